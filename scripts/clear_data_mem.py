@@ -15,6 +15,8 @@ def main():
     wb_add_std_args(parser)
     parser.add_argument("--size", "-s", type=int, default=DEFAULT_DATA_MEM_SIZE, required=False,
         help=f"Number of bytes to clear of data memory, defaults to ({DEFAULT_DATA_MEM_SIZE})")
+    parser.add_argument("--bank", "-b", type=int, default=0, required=False,
+        help="Data memory bank of byte-lane data memory, defaults to (0)")
     args = parser.parse_args()
 
     print(f"Clear ({args.size}) bytes of hBPF CPU data memory ...")
@@ -22,11 +24,15 @@ def main():
     wb = wb_open(args.host, args.port, args.csr, parser=parser)
 
     data = [0] * args.size
-    wb_load(wb, wb.bases.hbpf_data_mem,
-            data,
-            page_reg=wb.regs.hbpf_data_mem_page.addr,
-            page_base=wb.bases.hbpf_data_mem,
-            page_size=0x200)
+    lanes = wb_data_lanes(wb, args.bank)
+    if lanes:
+        wb_load(wb, 0, data, lanes=lanes)
+    else:
+        wb_load(wb, wb.bases.hbpf_data_mem,
+                data,
+                page_reg=wb.regs.hbpf_data_mem_page.addr,
+                page_base=wb.bases.hbpf_data_mem,
+                page_size=0x200)
 
     wb_close(wb)
 
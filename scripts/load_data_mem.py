@@ -15,6 +15,8 @@ def main():
     wb_add_std_args(parser)
     parser.add_argument("--file", "-f", type=str, default=DEFAULT_DATA_FILE, required=False,
                         help=f"Binary file to load into data memory, defaults to ({DEFAULT_DATA_FILE})")
+    parser.add_argument("--bank", "-b", type=int, default=0, required=False,
+        help="Data memory bank of byte-lane data memory, defaults to (0)")
     args = parser.parse_args()
 
     wb_check_file(args.csr, parser=parser, rtc=1)
@@ -26,11 +28,15 @@ def main():
 
     with open(args.file, mode='rb') as file:
         data = list(file.read())
-        wb_load(wb, wb.bases.hbpf_data_mem,
-                data,
-                page_reg=wb.regs.hbpf_data_mem_page.addr,
-                page_base=wb.bases.hbpf_data_mem,
-                page_size=0x200)
+        lanes = wb_data_lanes(wb, args.bank)
+        if lanes:
+            wb_load(wb, 0, data, lanes=lanes)
+        else:
+            wb_load(wb, wb.bases.hbpf_data_mem,
+                    data,
+                    page_reg=wb.regs.hbpf_data_mem_page.addr,
+                    page_base=wb.bases.hbpf_data_mem,
+                    page_size=0x200)
 
     wb_close(wb)
 
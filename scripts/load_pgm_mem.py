@@ -3,11 +3,17 @@
 # Load binary into hBPF CPU program memory.
 # richard.prinz@min.at 2022
 
+import os
 import sys
 import traceback
 import argparse
 import struct
 from wb_lib import *
+# Board debug folders link to this script, search relative to the real
+# path.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+    "..", "source"))
+from emulator.ebpf.vm_verifier import Verifier
 
 DEFAULT_PGM_FILE = "pgm_mem.bin"
 
@@ -16,25 +22,33 @@ def main():
     wb_add_std_args(parser)
     parser.add_argument("--file", "-f", type=str, default=DEFAULT_PGM_FILE, required=False,
                         help=f"Binary file to load into target, defaults to ({DEFAULT_PGM_FILE})")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="Load program without verifying it first")
     args = parser.parse_args()
 
     wb_check_file(args.csr, parser=parser, rtc=1)
     wb_check_file(args.file, parser=parser, rtc=2)
 
+    with open(args.file, mode='rb') as file:
+        data = file.read()
+
+    # Reject programs the CPU can not run before loading them.
+    if not args.no_verify:
+        Verifier(struct.unpack('<{}Q'.format(len(data) // 8), data),
+            fpga=True).verify()
+
     print(f"Load binary file ({args.file}) into hBPF CPU program memory ...")
 
     wb = wb_open(args.host, args.port, args.csr, parser=parser)
 
-    with open(args.file, mode='rb') as file:
-        data = file.read()
-        len_bytes = len(data)
-        len_words = len_bytes // 4
-        pgm_mem = list(struct.unpack('>{}L'.format(len_words), data))
-        wb_load(wb, wb.bases.hbpf_pgm_mem,
-                pgm_mem,
-                page_reg=wb.regs.hbpf_pgm_mem_page.addr,
-                page_base=wb.bases.hbpf_pgm_mem,
-                page_size=0x200)
+    len_bytes = len(data)
+    len_words = len_bytes // 4
+    pgm_mem = list(struct.unpack('>{}L'.format(len_words), data))
+    wb_load(wb, wb.bases.hbpf_pgm_mem,
+            pgm_mem,
+            page_reg=wb.regs.hbpf_pgm_mem_page.addr,
+            page_base=wb.bases.hbpf_pgm_mem,
+            page_size=0x200)
 
     wb_close(wb)
 
@@ -16,6 +16,8 @@ def main():
     wb_add_std_args(parser)
     parser.add_argument("--size", "-s", type=int, default=DEFAULT_DATA_MEM_SIZE, required=False,
         help=f"How many bytes to dump (integer > 0), defaults to ({DEFAULT_DATA_MEM_SIZE})")
+    parser.add_argument("--bank", "-b", type=int, default=0, required=False,
+        help="Data memory bank of byte-lane data memory, defaults to (0)")
     args = parser.parse_args()
 
     if args.size < 0:
@@ -27,11 +29,15 @@ def main():
 
     print("Show hBPF data memory ...\n")
 
-    wb_dump(wb, wb.bases.hbpf_data_mem,
-            args.size, bytes_per_word=1,
-            page_reg=wb.regs.hbpf_data_mem_page.addr,
-            page_base=wb.bases.hbpf_data_mem,
-            page_size=0x200)
+    lanes = wb_data_lanes(wb, args.bank)
+    if lanes:
+        wb_dump(wb, 0, args.size, bytes_per_word=1, lanes=lanes)
+    else:
+        wb_dump(wb, wb.bases.hbpf_data_mem,
+                args.size, bytes_per_word=1,
+                page_reg=wb.regs.hbpf_data_mem_page.addr,
+                page_base=wb.bases.hbpf_data_mem,
+                page_size=0x200)
 
     wb_close(wb)
 
@@ -48,7 +48,20 @@ def wb_check_file(filepath, parser=None, rtc=1):
         sys.exit(rtc)
 
 
-def wb_dump(bus, from_addr, words_to_dump, bytes_per_word=4, page_reg=None, page_base=0, page_size=512):
+# Byte-lane data memory (see source/fpga/ram_lanes.py) is split into 8
+# memories, byte n is stored in lane (n % 8) at row (n // 8). Returns the
+# base addresses of the lanes of the hBPF CPU data memory 'bank' or None
+# if the data memory is a single memory (hbpf_data_mem).
+def wb_data_lanes(bus, bank=0):
+    for name in ["hbpf_data_bank{}_lane{{}}".format(bank), "hbpf_data_lane{}"]:
+        if name.format(0) in bus.bases.d:
+            return [getattr(bus.bases, name.format(i)) for i in range(8)]
+    if bank != 0 or not "hbpf_data_mem" in bus.bases.d:
+        raise Exception(f"No hBPF data memory bank ({bank}) in CSR configuration")
+    return None
+
+
+def wb_dump(bus, from_addr, words_to_dump, bytes_per_word=4, page_reg=None, page_base=0, page_size=512, lanes=None):
     page = 0
     last_page = -1
     ps = page_size * 4
@@ -85,7 +98,10 @@ def wb_dump(bus, from_addr, words_to_dump, bytes_per_word=4, page_reg=None, page
                 last_page = page
                 hex_str = hex_str[:-1] + "*"
 
-        page_addr = page_base + (bus_addr & mask)
+        if lanes:
+            page_addr = lanes[i % len(lanes)] + 4 * (i // len(lanes))
+        else:
+            page_addr = page_base + (bus_addr & mask)
 
         data = bus.read(page_addr)
 
@@ -101,7 +117,7 @@ def wb_dump(bus, from_addr, words_to_dump, bytes_per_word=4, page_reg=None, page
             start_addr, start_addr_mem, page, (hex_str + (" " * 49))[0:49], ascii_str))
 
 
-def wb_load(bus, from_addr, data, page_reg=None, page_base=0, page_size=512):
+def wb_load(bus, from_addr, data, page_reg=None, page_base=0, page_size=512, lanes=None):
     page = 0
     last_page = -1
     ps = page_size * 4
@@ -119,6 +135,9 @@ def wb_load(bus, from_addr, data, page_reg=None, page_base=0, page_size=512):
                 bus.write(page_reg, page)
                 last_page = page
 
-        page_addr = page_base + (bus_addr & mask)
+        if lanes:
+            page_addr = lanes[i % len(lanes)] + 4 * (i // len(lanes))
+        else:
+            page_addr = page_base + (bus_addr & mask)
         bus.write(page_addr, data[i])
 
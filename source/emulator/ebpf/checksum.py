@@ -0,0 +1,50 @@
+import zlib
+
+
+# Checksum helpers over a range of data memory with the same behaviour as
+# the checksum functions of the FPGA call handlers (see fpga/checksum.py).
+# data_mem is a callable returning the current data memory (e.g.
+# lambda: vm.data_mem), as it changes with each packet. The range must be
+# inside data memory.
+# Use helpers() as (part of) the VM call_handler.
+class Checksum():
+
+    # Helper function numbers (call immediate).
+    INTERNET = 0xff000007
+    CRC32 = 0xff000008
+
+    def __init__(self, data_mem):
+        self.data_mem = data_mem
+
+
+    def _range(self, offset, length):
+        mem = self.data_mem()
+        return bytes(mem[offset:offset + length])
+
+
+    # R1 = offset, R2 = length, R3 = initial sum (e.g. of a pseudo header).
+    # Returns the Internet checksum (RFC 1071), 0 if the checksum field
+    # is part of the range and correct.
+    def internet(self, r1, r2, r3, r4, r5):
+        data = self._range(r1, r2)
+        if len(data) % 2:
+            data += b'\x00'
+        total = r3 & 0xffffffff
+        for i in range(0, len(data), 2):
+            total += (data[i] << 8) | data[i + 1]
+        while total >> 16:
+            total = (total & 0xffff) + (total >> 16)
+        return total ^ 0xffff
+
+
+    # R1 = offset, R2 = length, R3 = CRC of previous data (0 to start).
+    # Returns CRC32 as used by Ethernet.
+    def crc32(self, r1, r2, r3, r4, r5):
+        return zlib.crc32(self._range(r1, r2), r3 & 0xffffffff)
+
+
+    def helpers(self):
+        return {
+            self.INTERNET: self.internet,
+            self.CRC32: self.crc32
+        }
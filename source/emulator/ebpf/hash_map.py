@@ -0,0 +1,83 @@
+from emulator.ebpf.constants import *
+
+
+# Hash map helpers with the same behaviour as the hardware hash map of the
+# FPGA call handlers (see fpga/hash_map.py). Entries are kept in a dict of
+# buckets, each with 'ways' entries. The bucket of a key is selected by
+# XOR folding the key, an update fails if the key is not in the map and all
+# entries of its bucket are in use.
+# Use helpers() as (part of) the VM call_handler.
+class HashMap():
+
+    # Helper function numbers (call immediate).
+    LOOKUP = 0xff000004
+    UPDATE = 0xff000005
+    DELETE = 0xff000006
+
+    def __init__(self, buckets=256, ways=4):
+        if buckets < 2 or buckets & (buckets - 1) != 0:
+            raise Exception("Number of buckets must be a power of 2")
+        self.bucket_count = buckets
+        self.ways = ways
+        self.clear()
+
+
+    def clear(self):
+        # bucket index -> list of [key, value] or None per entry
+        self.buckets = {}
+
+
+    # Bucket index of key.
+    def index(self, key):
+        bits = self.bucket_count.bit_length() - 1
+        index = 0
+        for i in range(0, 64, bits):
+            index ^= (key >> i) & (self.bucket_count - 1)
+        return index
+
+
+    def _bucket(self, key):
+        return self.buckets.setdefault(self.index(key), [None] * self.ways)
+
+
+    # R1 = key, R2 = default. Returns value of key or default if not found.
+    def lookup(self, r1, r2, r3, r4, r5):
+        key = r1 & MAX_UINT64
+        for entry in self._bucket(key):
+            if entry is not None and entry[0] == key:
+                return entry[1]
+        return r2
+
+
+    # R1 = key, R2 = value. Returns 0 or 1 if bucket is full.
+    def update(self, r1, r2, r3, r4, r5):
+        key = r1 & MAX_UINT64
+        bucket = self._bucket(key)
+        for entry in bucket:
+            if entry is not None and entry[0] == key:
+                entry[1] = r2 & MAX_UINT64
+                return 0
+        for i, entry in enumerate(bucket):
+            if entry is None:
+                bucket[i] = [key, r2 & MAX_UINT64]
+                return 0
+        return 1
+
+
+    # R1 = key. Returns 0 or 1 if key is not found.
+    def delete(self, r1, r2, r3, r4, r5):
+        key = r1 & MAX_UINT64
+        bucket = self._bucket(key)
+        for i, entry in enumerate(bucket):
+            if entry is not None and entry[0] == key:
+                bucket[i] = None
+                return 0
+        return 1
+
+
+    def helpers(self):
+        return {
+            self.LOOKUP: self.lookup,
+            self.UPDATE: self.update,
+            self.DELETE: self.delete
+        }
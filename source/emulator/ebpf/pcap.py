@@ -0,0 +1,163 @@
+import io
+import struct
+
+
+# Size of read-ahead buffer used when streaming capture files.
+READ_AHEAD = 1024 * 1024
+
+# Classic pcap magic numbers (microsecond and nanosecond timestamps).
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+
+# Largest captured length of a classic pcap record (like libpcap), used
+# if the snapshot length of the file header is not valid.
+MAX_SNAPLEN = 262144
+
+# pcapng block types.
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_BYTE_ORDER_MAGIC_SWAPPED = 0x4d3c2b1a
+
+
+# Read exactly count bytes from file.
+def _read(f, count):
+    data = f.read(count)
+    if len(data) != count:
+        raise Exception("Truncated capture file (expected {} bytes, "
+            "got {})".format(count, len(data)))
+    return data
+
+
+# Yield captured frames (as bytes) of a classic pcap file. Header magic
+# was already read.
+def _read_pcap(f, magic):
+    if struct.unpack("<I", magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        bo = "<"
+    else:
+        bo = ">"
+
+    # Rest of global header (version, thiszone, sigfigs, snaplen, network)
+    version_major, version_minor, thiszone, sigfigs, snaplen, network = \
+        struct.unpack(bo + "HHiIII", _read(f, 20))
+    if snaplen == 0 or snaplen > MAX_SNAPLEN:
+        snaplen = MAX_SNAPLEN
+    record = struct.Struct(bo + "IIII")
+
+    while True:
+        hdr = f.read(record.size)
+        if not hdr:
+            return
+        if len(hdr) != record.size:
+            raise Exception("Truncated pcap record header")
+        ts_sec, ts_frac, incl_len, orig_len = record.unpack(hdr)
+        # A captured length above the snapshot length is a corrupt record,
+        # it is not read (up to 4 GiB).
+        if incl_len > snaplen:
+            raise Exception("Invalid pcap record, captured length ({}) "
+                "larger than snapshot length ({})".format(incl_len, snaplen))
+        yield _read(f, incl_len)
+
+
+# Yield captured frames (as bytes) of a pcapng file. Block type of first
+# section header block was already read.
+def _read_pcapng(f, block_type):
+    bo = "<"
+
+    while True:
+        if block_type == PCAPNG_SHB:
+            # Byte order of a section is given by its byte order magic.
+            length, bom = struct.unpack("<II", _read(f, 8))
+            if bom == PCAPNG_BYTE_ORDER_MAGIC:
+                bo = "<"
+            elif bom == PCAPNG_BYTE_ORDER_MAGIC_SWAPPED:
+                bo = ">"
+                length = struct.unpack(">I", struct.pack("<I", length))[0]
+            else:
+                raise Exception("Invalid pcapng byte order magic "
+                    "(0x{:08x})".format(bom))
+            body = length - 16
+        else:
+            length = struct.unpack(bo + "I", _read(f, 4))[0]
+            body = length - 12
+
+        if length < 12 or body < 0 or (length % 4) != 0:
+            raise Exception("Invalid pcapng block length ({})".format(length))
+
+        # Captured data must fit into the block body after the fixed
+        # fields, otherwise a malformed block would be parsed from
+        # somewhere else in the file.
+        fixed = {PCAPNG_EPB: 20, PCAPNG_SPB: 4, PCAPNG_PB: 20}.get(block_type, 0)
+        if body < fixed:
+            raise Exception("Invalid pcapng block length ({})".format(length))
+
+        if block_type == PCAPNG_EPB:
+            # interface id, timestamp high/low, captured and original length
+            hdr = _read(f, 20)
+            interface, ts_hi, ts_lo, incl_len, orig_len = \
+                struct.unpack(bo + "IIIII", hdr)
+            if incl_len > body - 20:
+                raise Exception("Invalid pcapng block length ({}), captured "
+                    "length ({})".format(length, incl_len))
+            frame = _read(f, incl_len)
+            f.seek(body - 20 - incl_len, io.SEEK_CUR)
+            yield frame
+        elif block_type == PCAPNG_SPB:
+            orig_len = struct.unpack(bo + "I", _read(f, 4))[0]
+            incl_len = min(orig_len, body - 4)
+            frame = _read(f, incl_len)
+            f.seek(body - 4 - incl_len, io.SEEK_CUR)
+            yield frame
+        elif block_type == PCAPNG_PB:
+            # interface id, drops count, timestamp high/low, captured and
+            # original length
+            hdr = _read(f, 20)
+            interface, drops, ts_hi, ts_lo, incl_len, orig_len = \
+                struct.unpack(bo + "HHIIII", hdr)
+            if incl_len > body - 20:
+                raise Exception("Invalid pcapng block length ({}), captured "
+                    "length ({})".format(length, incl_len))
+            frame = _read(f, incl_len)
+            f.seek(body - 20 - incl_len, io.SEEK_CUR)
+            yield frame
+        else:
+            # Skip all other blocks (interface descriptions, statistics ...)
+            f.seek(body, io.SEEK_CUR)
+
+        # Trailing block length.
+        _read(f, 4)
+
+        hdr = f.read(4)
+        if not hdr:
+            return
+        if len(hdr) != 4:
+            raise Exception("Truncated pcapng block header")
+        if struct.unpack("<I", hdr)[0] == PCAPNG_SHB:
+            block_type = PCAPNG_SHB
+        else:
+            block_type = struct.unpack(bo + "I", hdr)[0]
+
+
+# Yield all frames of a classic pcap or pcapng capture file one at a time.
+# Only a single frame is held in memory, the file is read through a
+# read-ahead buffer of read_ahead bytes.
+def read_frames(file_name, read_ahead=READ_AHEAD):
+    with open(file_name, "rb", buffering=read_ahead) as f:
+        magic = f.read(4)
+        if not magic:
+            return
+        if len(magic) != 4:
+            raise Exception("Truncated capture file")
+
+        value = struct.unpack("<I", magic)[0]
+        if value == PCAPNG_SHB:
+            yield from _read_pcapng(f, PCAPNG_SHB)
+        elif value in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or \
+                struct.unpack(">I", magic)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            yield from _read_pcap(f, magic)
+        else:
+            raise Exception("Unknown capture file format "
+                "(magic 0x{:08x})".format(value))
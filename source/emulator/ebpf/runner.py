@@ -0,0 +1,113 @@
+import os
+import struct
+import hashlib
+import collections
+import concurrent.futures
+from itertools import islice
+
+from emulator.ebpf.vm import VM
+
+
+# Warm VMs of a worker process by program hash.
+_vms = {}
+
+
+# Count results per verdict (R0), errors are counted as None.
+def count_verdicts(results):
+    return collections.Counter(
+        r0 if error is None else None for r0, error in results)
+
+
+# Runs a chunk of packets in a worker process, re-using the VM already
+# created for the program.
+def _run_chunk(key, mem, vm_args, args, packets, reducer):
+    vm = _vms.get(key, None)
+    if vm is None:
+        vm = VM(mem=list(mem), color=False, **vm_args)
+        _vms[key] = vm
+    results = list(vm.run_batch(packets, args=args))
+    if reducer is not None:
+        return reducer(results)
+    return results
+
+
+class Runner():
+
+    def __init__(self, mem, workers=None, chunk_size=256, args=None,
+                swap_endian=False, call_handler=None, engine="compiled"):
+
+        # Program and VM parameters sent to the workers. Call handlers
+        # and args (when callable) must be picklable, e.g. module level
+        # functions.
+        self.mem = list(mem)
+        self.vm_args = {
+            "swap_endian": swap_endian,
+            "call_handler": call_handler,
+            "engine": engine
+        }
+        self.args = args
+
+        h = hashlib.sha1()
+        for w in self.mem:
+            h.update(struct.pack("<Q", w))
+        h.update(repr(sorted(self.vm_args.items(), key=lambda i: i[0])).encode())
+        self.key = h.hexdigest()
+
+        # Number of packets sent to a worker at once.
+        self.chunk_size = chunk_size
+
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        self.executor.shutdown()
+
+
+    # Run packets through the program on all workers. Yields (r0, error)
+    # tuples in input order.
+    def run(self, packets):
+        for results in self._map(packets, None):
+            yield from results
+
+
+    # Run packets through the program on all workers and aggregate the
+    # results while streaming. Each worker applies reducer to the results
+    # of a chunk, partial results are merged with combine. Defaults to a
+    # count per verdict (R0).
+    def reduce(self, packets, reducer=count_verdicts, combine=None,
+                initial=None):
+        if combine is None:
+            combine = lambda a, b: a + b
+        total = initial
+        for partial in self._map(packets, reducer):
+            total = partial if total is None else combine(total, partial)
+        return total
+
+
+    # Submit chunks of packets to the workers, keeping a bounded number of
+    # chunks in flight, and yield chunk results in input order.
+    def _map(self, packets, reducer):
+        it = iter(packets)
+        pending = collections.deque()
+        max_pending = self.workers * 2
+
+        while True:
+            while len(pending) < max_pending:
+                chunk = [bytes(p) for p in islice(it, self.chunk_size)]
+                if not chunk:
+                    break
+                pending.append(self.executor.submit(_run_chunk,
+                    self.key, self.mem, self.vm_args, self.args, chunk, reducer))
+            if not pending:
+                break
+            yield pending.popleft().result()
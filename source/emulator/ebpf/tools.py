@@ -1,8 +1,27 @@
+import struct
 from colorama import Fore, Back, Style
 from emulator.ebpf.constants import *
 
 
+# Data memory accessors. Load/store (ldx/st/stx) use little-endian,
+# absolute loads (ldabs) big-endian (network) byte-order.
+LE16 = struct.Struct("<H")
+LE32 = struct.Struct("<I")
+LE64 = struct.Struct("<Q")
+BE16 = struct.Struct(">H")
+BE32 = struct.Struct(">I")
+BE64 = struct.Struct(">Q")
+
+MEM_LE = {LEN_H: LE16, LEN_W: LE32, LEN_DW: LE64}
+MEM_BE = {LEN_H: BE16, LEN_W: BE32, LEN_DW: BE64}
+
+# Value masks per access size.
+LEN_MASK = {LEN_B: MAX_UINT8, LEN_H: MAX_UINT16, LEN_W: MAX_UINT32, LEN_DW: MAX_UINT64}
+
+
 class RegisterDescriptor:
+    __slots__ = ("_reg",)
+
     def __init__(self, reg):
         self._reg = reg
 
@@ -26,106 +45,128 @@ class RegisterDescriptor:
 #     return new_f
 
 
+# Marks an instruction handler for disassembly output. Handlers are not
+# wrapped here, so VMs without debug output call them directly. Tracing
+# is bound per VM by trace_handlers() when a VM is created in debug mode.
 def disassemble(type, name):
     def wrap(f):
-        def wrapped_f(*args, **kwargs):
-            cls = args[0]
-            if cls.vm.debug:
-                n = name
-
-                if type == "ALU":
-                    cls, op_opr, op_src, insn = args
-                    n = n + ("" if insn.op_class == OPC_ALU64 else "32")
-                    if n.startswith("neg"):
-                        print("{}{}{:8s} r{}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.destination))
-                    elif n.startswith("endc"):
-                        n = (op_src == 1 and "be" or "le") + str(insn.immediate)
-                        print("{}{}{:8s} r{}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.destination))
-                    elif op_src == 0:
-                        print("{}{}{:8s} r{}, 0x{:016x}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.destination, insn.immediate))
-                    else:
-                        print("{}{}{:8s} r{}, r{}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.destination, insn.source))
-
-                elif type == "JMP":
-                    cls, op_opr, op_src, insn = args
-                    if op_opr == JMP_JA:
-                        print("{}{}{:8s} +0x{:016x}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.offset))
-                    elif op_opr == JMP_CALL:
-                        print("{}{}{:8s} 0x{:016x}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.immediate))
-                    elif op_opr == JMP_EXIT:
-                        print("{}{}{:8s} 0x{:016x}".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, cls.vm.r0))
-                    else:
-                        if op_src == 0:
-                            print("{}{}{:8s} r{}, 0x{:016x}, 0x{:016x}".format(
-                                Fore.YELLOW + Style.BRIGHT, IND,
-                                n, insn.destination, insn.immediate, insn.offset))
-                        else:
-                            print("{}{}{:8s} r{}, r{}, 0x{:016x}".format(
-                                Fore.YELLOW + Style.BRIGHT, IND,
-                                n, insn.destination, insn.source, insn.offset))
-
-                elif type == "LD":
-                    cls, op_mod, op_len, insn = args
-                    if op_mod == LDST_IMM:
-                        print("{}{}{:8s} r{}, [0x{:x}]".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n, insn.destination, insn.immediate))
-                    elif op_mod == LDST_ABS:
-                        print("{}{}{:8s} r0, [0x{:x}]".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n + ["w", "h", "b", "dw"][op_len],
-                            insn.immediate))
-                    elif op_mod == LDST_IND:
-                        print("{}{}OPL IND".format(
-                            Fore.YELLOW + Style.BRIGHT, IND))
-                    elif op_mod == LDST_MEM:
-                        print("{}{}{:8s} r{}, [r{}+0x{:x}]".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            n + ["w", "h", "b", "dw"][op_len],
-                            insn.destination, insn.source, insn.offset))
-                    elif op_mod == LDST_XADD:
-                        print("{}{}OPL XADD".format(
-                            Fore.YELLOW + Style.BRIGHT, IND))
-
-                elif type == "ST":
-                    cls, op_mod, op_len, insn = args
-                    if op_mod == LDST_IMM:
-                        print("{}{}OPS IMM".format(
-                            Fore.YELLOW + Style.BRIGHT, IND))
-                    elif op_mod == LDST_ABS:
-                        print("{}{}OPS ABS".format(
-                            Fore.YELLOW + Style.BRIGHT, IND))
-                    elif op_mod == LDST_IND:
-                        print("{}{}OPS IND".format(
-                            Fore.YELLOW + Style.BRIGHT, IND))
-                    elif op_mod == LDST_MEM:
-                        print("{}{}{:8s} r{}, [r{}+0x{:x}]".format(
-                            Fore.YELLOW + Style.BRIGHT, IND,
-                            "stx" + ["w", "h", "b", "dw"][op_len],
-                            insn.destination, insn.source, insn.offset))
-                    elif op_mod == LDST_XADD:
-                        print("OPS XADD".format(
-                            Fore.YELLOW + Style.BRIGHT, IND))
-
-            return f(*args, **kwargs)
-        return wrapped_f
+        f.disassemble = (type, name)
+        return f
     return wrap
 
 
+# Wrap the marked handlers of a decoder (ALU, JMP, LOAD, STORE) to print
+# their disassembly before they are executed.
+def trace_handlers(decoder):
+    for key, handler in decoder._decoder.items():
+        info = getattr(handler, "disassemble", None)
+        if info is not None:
+            decoder._decoder[key] = traced(handler, *info)
+
+
+# Returns handler wrapped to print its disassembly.
+def traced(handler, type, name):
+    def wrapped_f(op_a, op_b, insn):
+        print_disassembly(type, name, handler.__self__, op_a, op_b, insn)
+        return handler(op_a, op_b, insn)
+    return wrapped_f
+
+
+# Print disassembly of an instruction. op_a and op_b are the operation
+# and source (ALU, JMP) or mode and length (LD, ST) of the instruction.
+# For ALU operations and conditional jumps op_a is the function of the
+# operation instead (see vm_semantics.py).
+def print_disassembly(type, name, cls, op_a, op_b, insn):
+    op_opr = op_mod = op_a
+    op_src = op_len = op_b
+    n = name
+
+    if type == "ALU":
+        n = n + ("" if insn.op_class == OPC_ALU64 else "32")
+        if n.startswith("neg"):
+            print("{}{}{:8s} r{}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.destination))
+        elif n.startswith("endc"):
+            n = (op_src == 1 and "be" or "le") + str(insn.immediate)
+            print("{}{}{:8s} r{}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.destination))
+        elif op_src == 0:
+            print("{}{}{:8s} r{}, 0x{:016x}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.destination, insn.immediate))
+        else:
+            print("{}{}{:8s} r{}, r{}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.destination, insn.source))
+
+    elif type == "JMP":
+        if op_opr == JMP_JA:
+            print("{}{}{:8s} +0x{:016x}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.offset))
+        elif op_opr == JMP_CALL:
+            print("{}{}{:8s} 0x{:016x}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.immediate))
+        elif op_opr == JMP_EXIT:
+            print("{}{}{:8s} 0x{:016x}".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, cls.vm.r0))
+        else:
+            if op_src == 0:
+                print("{}{}{:8s} r{}, 0x{:016x}, 0x{:016x}".format(
+                    Fore.YELLOW + Style.BRIGHT, IND,
+                    n, insn.destination, insn.immediate, insn.offset))
+            else:
+                print("{}{}{:8s} r{}, r{}, 0x{:016x}".format(
+                    Fore.YELLOW + Style.BRIGHT, IND,
+                    n, insn.destination, insn.source, insn.offset))
+
+    elif type == "LD":
+        if op_mod == LDST_IMM:
+            print("{}{}{:8s} r{}, [0x{:x}]".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n, insn.destination, insn.immediate))
+        elif op_mod == LDST_ABS:
+            print("{}{}{:8s} r0, [0x{:x}]".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n + ["w", "h", "b", "dw"][op_len],
+                insn.immediate))
+        elif op_mod == LDST_IND:
+            print("{}{}OPL IND".format(
+                Fore.YELLOW + Style.BRIGHT, IND))
+        elif op_mod == LDST_MEM:
+            print("{}{}{:8s} r{}, [r{}+0x{:x}]".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                n + ["w", "h", "b", "dw"][op_len],
+                insn.destination, insn.source, insn.offset))
+        elif op_mod == LDST_XADD:
+            print("{}{}OPL XADD".format(
+                Fore.YELLOW + Style.BRIGHT, IND))
+
+    elif type == "ST":
+        if op_mod == LDST_IMM:
+            print("{}{}OPS IMM".format(
+                Fore.YELLOW + Style.BRIGHT, IND))
+        elif op_mod == LDST_ABS:
+            print("{}{}OPS ABS".format(
+                Fore.YELLOW + Style.BRIGHT, IND))
+        elif op_mod == LDST_IND:
+            print("{}{}OPS IND".format(
+                Fore.YELLOW + Style.BRIGHT, IND))
+        elif op_mod == LDST_MEM:
+            print("{}{}{:8s} r{}, [r{}+0x{:x}]".format(
+                Fore.YELLOW + Style.BRIGHT, IND,
+                "stx" + ["w", "h", "b", "dw"][op_len],
+                insn.destination, insn.source, insn.offset))
+        elif op_mod == LDST_XADD:
+            print("OPS XADD".format(
+                Fore.YELLOW + Style.BRIGHT, IND))
+
+
+
 def print_hex_list(lst):
     print("[{}]".format(", ".join(hex(x) for x in lst)))
 
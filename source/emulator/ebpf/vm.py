@@ -5,14 +5,32 @@ from pprint import pprint
 from colorama import Fore, Back, Style, init
 from emulator.ebpf.constants import *
 from emulator.ebpf.tools import *
-from emulator.ebpf.vm_insn import Instruction
+from emulator.ebpf.vm_insn import Instruction, check_word
 from emulator.ebpf.vm_opc import OPC
+from emulator.ebpf.vm_threaded import Threaded
+from emulator.ebpf.vm_compiled import Compiled
+from emulator.ebpf.vm_profiler import Profiler
+from emulator.ebpf.vm_verifier import Verifier
 
 
 class VM():
 
+    # Register accessors (vm.r0 - vm.r10) for self.regs.
+    r0 = RegisterDescriptor(0)
+    r1 = RegisterDescriptor(1)
+    r2 = RegisterDescriptor(2)
+    r3 = RegisterDescriptor(3)
+    r4 = RegisterDescriptor(4)
+    r5 = RegisterDescriptor(5)
+    r6 = RegisterDescriptor(6)
+    r7 = RegisterDescriptor(7)
+    r8 = RegisterDescriptor(8)
+    r9 = RegisterDescriptor(9)
+    r10 = RegisterDescriptor(10)
+
     def __init__(self, mem=None, mem_size=MAX_PGM_MEM, stack_size=MAX_STACK,
-                swap_endian=False, color=True, debug=False, call_handler=None):
+                swap_endian=False, color=True, debug=False, call_handler=None,
+                engine="interpreter", profile=False, verify=False):
 
         self.debug = debug
 
@@ -26,19 +44,18 @@ class VM():
         if ml > mem_size:
             raise Exception("Memory larger than maximum {}".format(mem_size))
         self.pgm_mem = mem
+        self.pgm_len = ml
         if(ml < mem_size):
             self.pgm_mem.extend([0] * (mem_size - ml))
 
         # Context memory.
-        self.data_mem = [0] * MAX_DATA_MEM
+        self.data_mem = bytearray(MAX_DATA_MEM)
 
         # VM Stack.
         self.stack = [0] * stack_size
 
-        # Prepare VM registers and create setters/getters for them.
+        # VM registers, accessible as self.r0 - self.r10.
         self.regs = [0] * MAX_REGS
-        for r in range(MAX_REGS):
-            setattr(self.__class__, "r{}".format(r), RegisterDescriptor(r))
 
         # Call handler, registry for helper functions
         self.call_handler = call_handler
@@ -61,16 +78,115 @@ class VM():
         # Instantiate OpCode decoder.
         self.opc = OPC(self)
 
+        # Execution engine used by start(). "interpreter" steps through
+        # the pre-decoded program, "threaded" runs it as a list of
+        # specialized closures and "compiled" as generated Python code.
+        # Debug tracing always uses the interpreter.
+        self.engine = engine
+        if engine == "interpreter":
+            self.executor = None
+        elif engine == "threaded":
+            self.executor = Threaded(self)
+        elif engine == "compiled":
+            self.executor = Compiled(self)
+        else:
+            raise Exception("Unknown engine ({})".format(engine))
+
+        # Verify program (see vm_verifier.py) when it is loaded instead of
+        # failing when an invalid instruction is executed.
+        self.verify = verify
+
+        # Pre-decoded program, one (execute, handler, op_a, op_b, insn)
+        # entry per program memory word.
+        self.code = None
+        self.predecode()
+
+        # Optional profiler. When enabled the program is run by the
+        # profiler's own loop instead of the selected engine.
+        self.profiler = Profiler(self) if profile else None
+
+
+    # Context memory. Objects supporting the buffer protocol (bytearray,
+    # memoryview, mmap, ...) are mapped without copying, so e.g. packets
+    # can be used straight from an mmap'd capture file. Lists of ints and
+    # read-only buffers (e.g. bytes) are copied into a bytearray as stores
+    # write to data memory.
+    @property
+    def data_mem(self):
+        return self._data_mem
 
-    # Reset VM.
+    @data_mem.setter
+    def data_mem(self, mem):
+        if mem is not None:
+            if isinstance(mem, list):
+                mem = bytearray(mem)
+            mem = memoryview(mem)
+            if mem.readonly:
+                mem = memoryview(bytearray(mem))
+            if mem.format != "B" or mem.ndim != 1:
+                mem = mem.cast("B")
+        self._data_mem = mem
+
+
+    # Reset VM, so program starts again for a new context.
     def reset(self):
         self.ip = 0
+        self.exit_val = None
+
+
+    # Run program against a sequence of contexts (e.g. network packets).
+    # For each context registers are cleared, R1 - R5 are set from args
+    # (a sequence or a callable returning one for the context) and the
+    # context is copied into the existing data memory. Yields a
+    # (r0, error) tuple per context, error is None on success.
+    def run_batch(self, packets, args=None):
+        data_mem = self.data_mem
+        size = len(data_mem)
+        used = 0
+        no_regs = [0] * MAX_REGS
+
+        for packet in packets:
+            pl = len(packet)
+            if pl > size:
+                raise Exception("Context ({} bytes) larger than data "
+                    "memory ({} bytes)".format(pl, size))
+            data_mem[:pl] = packet
+            if used > pl:
+                data_mem[pl:used] = bytes(used - pl)
+            used = pl
+
+            self.regs[:] = no_regs
+            values = args(packet) if callable(args) else args
+            if values:
+                if len(values) > 5:
+                    raise Exception("Only R1 - R5 can be used as arguments")
+                self.regs[1:1 + len(values)] = values
+            self.reset()
+
+            try:
+                yield (self.start(), None)
+            except Exception as ex:
+                yield (self.r0, ex)
 
 
     # Start VM.
     def start(self):
+        if self.profiler is not None:
+            return self.profiler.run()
+
+        if self.debug:
+            while self.exit_val is None:
+                self.step()
+            return self.exit_val
+
+        if self.executor is not None:
+            return self.executor.run()
+
+        code = self.code
         while self.exit_val is None:
-            self.step()
+            execute, handler, op_a, op_b, insn = code[self.ip]
+            self.cur_insn = insn
+            self.ip = execute(handler, op_a, op_b, insn)
         return self.exit_val
 
 
@@ -79,23 +195,55 @@ class VM():
         return (self.ip + n) % len(self.pgm_mem)
 
 
-    # Get current memory word where IP points to. VM internally always
-    # assumes little-endian.
-    def get_word(self):
-        w = self.pgm_mem[self.ip]
+    # Get memory word where IP (or the given address) points to. VM
+    # internally always assumes little-endian.
+    def get_word(self, ip=None):
+        w = self.pgm_mem[self.ip if ip is None else ip]
         if self.swap_endian:
             w = struct.unpack("<Q", struct.pack(">Q", w))[0]
         return w
 
 
+    # Decode the whole program memory once into a table of resolved
+    # handlers and operands which is re-used for every executed
+    # instruction (and every context the program runs against). Must be
+    # called again after program memory was changed.
+    def predecode(self):
+        if self.verify:
+            helpers = None
+            if isinstance(self.call_handler, dict):
+                helpers = self.call_handler.keys()
+            Verifier([self.get_word(ip) for ip in range(self.pgm_len)],
+                    helpers=helpers).verify()
+
+        decoded = {}
+        code = []
+        for ip, w in enumerate(self.pgm_mem):
+            entry = decoded.get(w)
+            if entry is None:
+                check_word(w)
+                insn = Instruction(self.get_word(ip))
+                entry = self.opc.resolve(insn) + (insn,)
+                decoded[w] = entry
+            code.append(entry)
+        self.code = code
+
+        if self.executor is not None:
+            self.executor.compile()
+
+
     # Process a single VM instruction.
     def step(self):
-        self.ip = self.decode(self.get_word())
+        execute, handler, op_a, op_b, insn = self.code[self.ip]
+        self.cur_insn = insn
+        self.print_state()
+        self.ip = execute(handler, op_a, op_b, insn)
         return self.exit_val
 
 
     # Execute a VM instruction.
     def decode(self, word):
+        check_word(word)
         self.cur_insn = Instruction(word)
         self.print_state()
         return self.opc.decode(self.cur_insn)
@@ -5,6 +5,7 @@ from pprint import pprint
 
 from emulator.ebpf.constants import *
 from emulator.ebpf.tools import *
+from emulator.ebpf.vm_semantics import *
 
 
 class ALU():
@@ -32,307 +33,146 @@ class ALU():
 
 
     def decode(self, insn):
+        execute, handler, f, op_src = self.resolve(insn)
+        return execute(handler, f, op_src, insn)
+
+
+    # Operations are evaluated by the functions built from the expressions
+    # in vm_semantics.py. The function is looked up once here and handed
+    # to the handler instead of the operation (None if not supported).
+    def resolve(self, insn):
         op_src = (insn.op_code >> 3) & 0b1
         op_opr = (insn.op_code >> 4) & 0b1111
 
-        self._decoder.get(op_opr, self._error)(op_opr, op_src, insn)
+        if op_opr == ALU_ENDC:
+            f = endc_function(op_src, insn.immediate)
+        else:
+            f = alu_function(insn.op_class, op_opr, op_src)
+        return (self.execute, self._decoder.get(op_opr, self._error),
+                f, op_src)
+
+
+    def execute(self, handler, op_opr, op_src, insn):
+        handler(op_opr, op_src, insn)
         return self.vm.inc_ip()
 
 
-    # ALU operation handlers.
-    @disassemble("ALU", "add")
-    def _add(self, op_opr, op_src, insn):
-        if insn.op_class == OPC_ALU64:
-            if op_src == 0:
-                # 0x07  add dst, imm    dst += imm
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] + insn.immediate
-            else:
-                # 0x0f  add dst, src    dst += src
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] + self.vm.regs[insn.source]
-
-            self.vm.regs[insn.destination] &= MAX_UINT64
-        else:
-            if op_src == 0:
-                # 0x07  add dst, imm    dst += imm
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) + uint32(insn.immediate)
-            else:
-                # 0x0f  add dst, src    dst += src
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) + uint32(self.vm.regs[insn.source])
+    # ALU operation handlers, f is the function of the operation.
+    def _op(self, f, op_src, insn):
+        if f is None:
+            self._error(f, op_src, insn)
+        regs = self.vm.regs
+        v = regs[insn.source] if op_src else insn.immediate
+        try:
+            regs[insn.destination] = f(regs[insn.destination], v)
+        except ZeroDivisionError:
+            dst = DIV_BY_ZERO.get((insn.op_code >> 4) & 0b1111, None)
+            if dst is not None:
+                regs[insn.destination] = dst
+            raise
 
-            self.vm.regs[insn.destination] &= MAX_UINT32
 
+    @disassemble("ALU", "add")
+    def _add(self, f, op_src, insn):
+        # 0x07  add dst, imm    dst += imm
+        # 0x0f  add dst, src    dst += src
+        self._op(f, op_src, insn)
 
-    @disassemble("ALU", "sub")
-    def _sub(self, op_opr, op_src, insn):
-        if insn.op_class == OPC_ALU64:
-            if op_src == 0:
-                # 0x17  sub dst, imm    dst -= imm
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] - insn.immediate
-            else:
-                # 0x1f  sub dst, src    dst -= src
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] - self.vm.regs[insn.source]
-
-            self.vm.regs[insn.destination] &= MAX_UINT64
-        else:
-            if op_src == 0:
-                # 0x17  sub dst, imm    dst -= imm
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) - uint32(insn.immediate)
-            else:
-                # 0x1f  sub dst, src    dst -= src
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) - uint32(self.vm.regs[insn.source])
 
-            self.vm.regs[insn.destination] &= MAX_UINT32
+    @disassemble("ALU", "sub")
+    def _sub(self, f, op_src, insn):
+        # 0x17  sub dst, imm    dst -= imm
+        # 0x1f  sub dst, src    dst -= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "mul")
-    def _mul(self, op_opr, op_src, insn):
-        if insn.op_class == OPC_ALU64:
-            if op_src == 0:
-                # 0x27  mul dst, imm    dst *= imm
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] * insn.immediate
-            else:
-                # 0x2f  mul dst, src    dst *= src
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] * self.vm.regs[insn.source]
-
-            self.vm.regs[insn.destination] &= MAX_UINT64
-        else:
-            if op_src == 0:
-                # 0x27  mul dst, imm    dst *= imm
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) * uint32(insn.immediate)
-            else:
-                # 0x2f  mul dst, src    dst *= src
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) * uint32(self.vm.regs[insn.source])
-
-            self.vm.regs[insn.destination] &= MAX_UINT32
+    def _mul(self, f, op_src, insn):
+        # 0x27  mul dst, imm    dst *= imm
+        # 0x2f  mul dst, src    dst *= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "div")
-    def _div(self, op_opr, op_src, insn):
-        try:
-            if insn.op_class == OPC_ALU64:
-                if op_src == 0:
-                    # 0x37  div dst, imm    dst /= imm
-                    self.vm.regs[insn.destination] = self.vm.regs[insn.destination] // insn.immediate
-                else:
-                    # 0x3f  div dst, src    dst /= src
-                    self.vm.regs[insn.destination] = self.vm.regs[insn.destination] // self.vm.regs[insn.source]
-
-                self.vm.regs[insn.destination] &= MAX_UINT64
-            else:
-                if op_src == 0:
-                    # 0x37  div dst, imm    dst /= imm
-                    self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) // uint32(insn.immediate)
-                else:
-                    # 0x3f  div dst, src    dst /= src
-                    self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) // uint32(self.vm.regs[insn.source])
-
-                self.vm.regs[insn.destination] &= MAX_UINT32
-        except ZeroDivisionError as ex:
-            # According to ebpf spec section 1.4.1, destination reg cleared to 0
-            self.vm.regs[insn.destination] = 0x00
-            raise
+    def _div(self, f, op_src, insn):
+        # 0x37  div dst, imm    dst /= imm
+        # 0x3f  div dst, src    dst /= src
+        self._op(f, op_src, insn)
 
-    @disassemble("ALU", "or")
-    def _or(self, op_opr, op_src, insn):
-        if op_src == 0:
-            # 0x47  or dst, imm     dst |= imm
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] | insn.immediate
-        else:
-            # 0x4f  or dst, src     dst |= src
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] | self.vm.regs[insn.source]
 
-        if insn.op_class != OPC_ALU64:
-            self.vm.regs[insn.destination] &= MAX_UINT32
-        else:
-            self.vm.regs[insn.destination] &= MAX_UINT64
+    @disassemble("ALU", "or")
+    def _or(self, f, op_src, insn):
+        # 0x47  or dst, imm     dst |= imm
+        # 0x4f  or dst, src     dst |= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "and")
-    def _and(self, op_opr, op_src, insn):
-        if op_src == 0:
-            # 0x57  and dst, imm    dst &= imm
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] & insn.immediate
-        else:
-            # 0x5f  and dst, src    dst &= src
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] & self.vm.regs[insn.source]
-
-        if insn.op_class != OPC_ALU64:
-            self.vm.regs[insn.destination] &= MAX_UINT32
-        else:
-            self.vm.regs[insn.destination] &= MAX_UINT64
+    def _and(self, f, op_src, insn):
+        # 0x57  and dst, imm    dst &= imm
+        # 0x5f  and dst, src    dst &= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "lsh")
-    def _lsh(self, op_opr, op_src, insn):
-        if op_src == 0:
-            # 0x67  lsh dst, imm    dst <<= imm
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] << insn.immediate
-        else:
-            # 0x6f  lsh dst, src    dst <<= src
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] << self.vm.regs[insn.source]
-
-        if insn.op_class != OPC_ALU64:
-            self.vm.regs[insn.destination] &= MAX_UINT32
-        else:
-            self.vm.regs[insn.destination] &= MAX_UINT64
+    def _lsh(self, f, op_src, insn):
+        # 0x67  lsh dst, imm    dst <<= imm
+        # 0x6f  lsh dst, src    dst <<= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "rsh")
-    def _rsh(self, op_opr, op_src, insn):
-        if insn.op_class == OPC_ALU64:
-            if op_src == 0:
-                # 0x77  rsh dst, imm    dst >>= imm (logical)
-                #self.vm.regs[insn.destination] = (self.vm.regs[insn.destination] % (1 << 64)) >> insn.immediate
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] >> insn.immediate
-            else:
-                # 0x7f  rsh dst, src    dst >>= src (logical)
-                #self.vm.regs[insn.destination] = (self.vm.regs[insn.destination] % (1 << 64)) >> self.vm.regs[insn.source]
-                self.vm.regs[insn.destination] = self.vm.regs[insn.destination] >> self.vm.regs[insn.source]
-
-            self.vm.regs[insn.destination] &= MAX_UINT64
-        else:
-            if op_src == 0:
-                # 0x77  rsh dst, imm    dst >>= imm (logical)
-                #self.vm.regs[insn.destination] = (uint32(self.vm.regs[insn.destination]) % (1 << 64)) >> insn.immediate
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) >> uint32(insn.immediate)
-            else:
-                # 0x7f  rsh dst, src    dst >>= src (logical)
-                #self.vm.regs[insn.destination] = (uint32(self.vm.regs[insn.destination]) % (1 << 64)) >> self.vm.regs[insn.source]
-                self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) >> uint32(self.vm.regs[insn.source])
-
-            self.vm.regs[insn.destination] &= MAX_UINT32
+    def _rsh(self, f, op_src, insn):
+        # 0x77  rsh dst, imm    dst >>= imm (logical)
+        # 0x7f  rsh dst, src    dst >>= src (logical)
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "neg")
-    def _neg(self, op_opr, op_src, insn):
-        if op_src == 0:
-            # 0x87  neg dst         dst = -dst
-            self.vm.regs[insn.destination] = -self.vm.regs[insn.destination]
-        else:
-            # 0x8f
-            self._error(op_opr, op_src, insn)
-
-        if insn.op_class != OPC_ALU64:
-            self.vm.regs[insn.destination] &= MAX_UINT32
-        else:
-            self.vm.regs[insn.destination] &= MAX_UINT64
+    def _neg(self, f, op_src, insn):
+        # 0x87  neg dst         dst = -dst
+        # 0x8f  invalid
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "mod")
-    def _mod(self, op_opr, op_src, insn):
-        try:
-            if insn.op_class == OPC_ALU64:
-                if op_src == 0:
-                    # 0x97  mod dst, imm    dst %= imm
-                    self.vm.regs[insn.destination] = self.vm.regs[insn.destination] % insn.immediate
-                else:
-                    # 0x9f  mod dst, src    dst %= src
-                    self.vm.regs[insn.destination] = self.vm.regs[insn.destination] % self.vm.regs[insn.source]
-
-                self.vm.regs[insn.destination] &= MAX_UINT64
-            else:
-                if op_src == 0:
-                    # 0x97  mod dst, imm    dst %= imm
-                    self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) % uint32(insn.immediate)
-                else:
-                    # 0x9f  mod dst, src    dst %= src
-                    self.vm.regs[insn.destination] = uint32(self.vm.regs[insn.destination]) % uint32(self.vm.regs[insn.source])
-
-                self.vm.regs[insn.destination] &= MAX_UINT32
-        except ZeroDivisionError as ex:
-            # According to ebpf spec section 1.4.1, destination reg is unchanged
-            #self.vm.regs[insn.destination] = 0x00
-            raise
+    def _mod(self, f, op_src, insn):
+        # 0x97  mod dst, imm    dst %= imm
+        # 0x9f  mod dst, src    dst %= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "xor")
-    def _xor(self, op_opr, op_src, insn):
-        if op_src == 0:
-            # 0xa7  xor dst, imm    dst ^= imm
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] ^ insn.immediate
-        else:
-            # 0xaf  xor dst, src    dst ^= src
-            self.vm.regs[insn.destination] = self.vm.regs[insn.destination] ^ self.vm.regs[insn.source]
-
-        if insn.op_class != OPC_ALU64:
-            self.vm.regs[insn.destination] &= MAX_UINT32
-        else:
-            self.vm.regs[insn.destination] &= MAX_UINT64
+    def _xor(self, f, op_src, insn):
+        # 0xa7  xor dst, imm    dst ^= imm
+        # 0xaf  xor dst, src    dst ^= src
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "mov")
-    def _mov(self, op_opr, op_src, insn):
-        if op_src == 0:
-            # 0xb7 	mov dst, imm 	dst = imm
-            self.vm.regs[insn.destination] = insn.immediate
-        else:
-            # 0xbf 	mov dst, src 	dst = src
-            self.vm.regs[insn.destination] = self.vm.regs[insn.source]
-
-        if insn.op_class != OPC_ALU64:
-            self.vm.regs[insn.destination] &= MAX_UINT32
-        else:
-            self.vm.regs[insn.destination] &= MAX_UINT64
+    def _mov(self, f, op_src, insn):
+        # 0xb7  mov dst, imm    dst = imm
+        # 0xbf  mov dst, src    dst = src
+        # MOV does not read the destination register.
+        regs = self.vm.regs
+        regs[insn.destination] = f(0,
+            regs[insn.source] if op_src else insn.immediate)
 
 
     @disassemble("ALU", "arsh")
-    def _arsh(self, op_opr, op_src, insn):
-        if insn.op_class == OPC_ALU64:
-            if op_src == 0:
-                # 0xc7  arsh dst, imm   dst >>= imm (arithmetic)
-                self.vm.regs[insn.destination] = arit_rshift(
-                    self.vm.regs[insn.destination],
-                    insn.immediate,
-                    sign_bit_pos=63)
-            else:
-                # 0xcf  arsh dst, src   dst >>= src (arithmetic)
-                self.vm.regs[insn.destination] = arit_rshift(
-                    self.vm.regs[insn.destination],
-                    self.vm.regs[insn.source],
-                    sign_bit_pos=63)
-
-            self.vm.regs[insn.destination] &= MAX_UINT64
-        else:
-            if op_src == 0:
-                # 0xc4  arsh32 dst, imm   dst >>= imm (arithmetic)
-                self.vm.regs[insn.destination] = arit_rshift(
-                    uint32(self.vm.regs[insn.destination]),
-                    uint32(insn.immediate),
-                    sign_bit_pos=31)
-            else:
-                # 0xcc  arsh32 dst, src   dst >>= src (arithmetic)
-                self.vm.regs[insn.destination] = arit_rshift(
-                    uint32(self.vm.regs[insn.destination]),
-                    uint32(self.vm.regs[insn.source]),
-                    sign_bit_pos=31)
-
-            self.vm.regs[insn.destination] &= MAX_UINT32
+    def _arsh(self, f, op_src, insn):
+        # 0xc7  arsh dst, imm   dst >>= imm (arithmetic)
+        # 0xcf  arsh dst, src   dst >>= src (arithmetic)
+        self._op(f, op_src, insn)
 
 
     @disassemble("ALU", "endc")
-    def _endc(self, op_opr, op_src, insn):
-        if op_src == 1:
-            # BigEndian
-            # mem is little endian
-            v = struct.unpack("<Q", struct.pack(">Q", self.vm.regs[insn.destination]))[0]
-            if insn.immediate == 16:
-                self.vm.regs[insn.destination] = (v & 0xffff000000000000) >> 48
-            elif insn.immediate == 32:
-                self.vm.regs[insn.destination] = (v & 0xffffffff00000000) >> 32
-            elif insn.immediate == 64:
-                self.vm.regs[insn.destination] = v
-            else:
-                self._error(op_opr, op_src, insn)
-        else:
-            # LittleEndian
-            if insn.immediate == 16:
-                self.vm.regs[insn.destination] = (self.vm.regs[insn.destination] & 0x000000000000ffff)
-            elif insn.immediate == 32:
-                self.vm.regs[insn.destination] = (self.vm.regs[insn.destination] & 0x00000000ffffffff)
-            elif insn.immediate == 64:
-                pass
-            else:
-                self._error(op_opr, op_src, insn)
+    def _endc(self, f, op_src, insn):
+        # 0xd4  le16/32/64 dst  dst = htole(dst)
+        # 0xdc  be16/32/64 dst  dst = htobe(dst)
+        if f is None:
+            self._error(f, op_src, insn)
+        self.vm.regs[insn.destination] = f(self.vm.regs[insn.destination])
 
 
     def _error(self, op_opr, op_src, insn, *args):
@@ -0,0 +1,369 @@
+import sys
+import os
+import struct
+import hashlib
+import collections
+from pprint import pprint
+
+from emulator.ebpf.constants import *
+from emulator.ebpf.tools import *
+from emulator.ebpf.vm_semantics import *
+
+
+# Compiled programs (code object and block leaders) by program hash. Only
+# the CACHE_SIZE most recently used programs are kept, e.g. for long
+# sweeps over many programs.
+CACHE_SIZE = 64
+_cache = collections.OrderedDict()
+
+REGS = ", ".join("r{}".format(r) for r in range(MAX_REGS))
+
+# Names of data memory accessors in generated code.
+LOAD_NAME = {LEN_H: "ld16", LEN_W: "ld32", LEN_DW: "ld64"}
+STORE_NAME = {LEN_H: "st16", LEN_W: "st32", LEN_DW: "st64"}
+
+
+class Compiled():
+
+    def __init__(self, vm):
+        self.vm = vm
+
+        # Generated Python function running the program.
+        self.function = None
+
+        # IPs where basic blocks start. The generated function can only
+        # be entered at these IPs.
+        self.leaders = None
+
+
+    # Translate the pre-decoded program of the VM into a Python function.
+    # Code objects are cached by program hash, so the translation is done
+    # only once per program.
+    def compile(self):
+        vm = self.vm
+        h = hashlib.sha1()
+        h.update(struct.pack("<?I", vm.swap_endian, len(vm.code)))
+        for w in vm.pgm_mem:
+            h.update(struct.pack("<Q", w))
+        key = h.hexdigest()
+
+        compiled = _cache.get(key, None)
+        if compiled is None:
+            source, leaders = self.translate()
+            compiled = (compile(source, "<ebpf {}>".format(key[:12]), "exec"),
+                        leaders)
+            _cache[key] = compiled
+            if len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+
+        code, self.leaders = compiled
+        namespace = {
+            **NAMESPACE,
+            "ld16": LE16.unpack_from,
+            "ld32": LE32.unpack_from,
+            "ld64": LE64.unpack_from,
+            "st16": LE16.pack_into,
+            "st32": LE32.pack_into,
+            "st64": LE64.pack_into
+        }
+        exec(code, namespace)
+        self.function = namespace["run"]
+
+
+    # Run program until exit. Whenever the IP is not the start of a
+    # translated basic block, the interpreter steps until it reaches one.
+    def run(self):
+        vm = self.vm
+        while vm.exit_val is None:
+            if vm.ip in self.leaders:
+                if self.function(vm, vm.regs, vm.code):
+                    break
+            else:
+                vm.step()
+        return vm.exit_val
+
+
+    # Returns generated Python source for the program and the set of
+    # basic block leaders.
+    def translate(self):
+        leaders, blocks = self._blocks()
+
+        lines = [
+            "def run(vm, regs, code):",
+            "    {} = regs".format(REGS),
+            "    dm = vm.data_mem",
+            "    pc = vm.ip",
+            "    ip = pc",
+            "    try:",
+            "        while True:"
+        ]
+        self._dispatch(lines, 3, sorted(blocks), blocks)
+        lines += [
+            "            break",
+            "    except Exception:",
+            "        regs[:] = ({},)".format(REGS),
+            "        if ip is not None:",
+            "            vm.ip = ip",
+            "        raise",
+            "    regs[:] = ({},)".format(REGS),
+            "    vm.ip = pc",
+            "    return False",
+            ""
+        ]
+        return "\n".join(lines), frozenset(blocks)
+
+
+    # Emits a binary search over block leaders.
+    def _dispatch(self, lines, level, keys, blocks):
+        ind = "    " * level
+        if len(keys) <= 2:
+            for k in keys:
+                lines.append("{}if pc == {}:".format(ind, k))
+                lines.extend("{}    {}".format(ind, l) for l in blocks[k])
+            return
+        mid = len(keys) // 2
+        lines.append("{}if pc < {}:".format(ind, keys[mid]))
+        self._dispatch(lines, level + 1, keys[:mid], blocks)
+        lines.append("{}else:".format(ind))
+        self._dispatch(lines, level + 1, keys[mid:], blocks)
+
+
+    # Find reachable basic blocks starting at IP 0 and translate them.
+    def _blocks(self):
+        code = self.vm.code
+        n = len(code)
+
+        # Translation stops at the last non-zero program word.
+        end = n
+        while end > 0 and self.vm.pgm_mem[end - 1] == 0:
+            end -= 1
+
+        leaders = {0}
+        work = [0]
+        seen = set()
+        while work:
+            ip = work.pop()
+            while 0 <= ip < end and ip not in seen:
+                seen.add(ip)
+                successors, terminates = self._successors(ip)
+                if not terminates:
+                    ip = successors[0]
+                    continue
+                for s in successors:
+                    if s < end and s not in leaders:
+                        leaders.add(s)
+                        work.append(s)
+
+        blocks = {}
+        for leader in leaders:
+            if leader >= end:
+                continue
+            body = ["ip = {}".format(leader)]
+            ip = leader
+            while True:
+                stmts, terminates, nxt = self._insn(ip)
+                body.extend(stmts)
+                if terminates:
+                    break
+                if nxt in leaders or nxt >= end:
+                    body += ["pc = {}".format(nxt), "continue"]
+                    break
+                ip = nxt
+            blocks[leader] = body
+        return leaders, blocks
+
+
+    # Returns ([successor IPs], terminates_block) for an instruction. If
+    # the block continues, the first successor is the fall through IP.
+    def _successors(self, ip):
+        n = len(self.vm.code)
+        execute, handler, op_a, op_b, insn = self.vm.code[ip]
+        op_opr = (insn.op_code >> 4) & 0b1111
+
+        if self._lddw(ip) is not None:
+            return [ip + 2], False
+        if self._translatable(ip):
+            if insn.op_class == OPC_JMP:
+                if op_opr == JMP_EXIT:
+                    return [], True
+                tgt = (ip + insn.offset_s) % n + 1
+                if op_opr == JMP_JA:
+                    return [tgt], True
+                return [ip + 1, tgt], True
+            return [(ip + 1) % n], False
+
+        # Interpreter fallback, ends block.
+        if handler in self._errors():
+            return [], True
+        successors = [ip + 1]
+        if insn.op_class == OPC_LD:
+            successors.append(ip + 2)
+        return successors, True
+
+
+    def _errors(self):
+        opc = self.vm.opc
+        return (opc._error, opc.alu._error, opc.jmp._error,
+                opc.load._error, opc.store._error)
+
+
+    # Returns the 64 bit immediate for a complete lddw pair at IP.
+    def _lddw(self, ip):
+        code = self.vm.code
+        insn = code[ip][-1]
+        if insn.op_code != 0x18 or ip + 1 >= len(code):
+            return None
+        nxt = code[ip + 1][-1]
+        if nxt.op_code != 0x00:
+            return None
+        return insn.immediate | (nxt.imm << 32)
+
+
+    def _translatable(self, ip):
+        return self._emit(ip) is not None
+
+
+    # Returns (statements, terminates_block, next_ip) for instruction at IP.
+    def _insn(self, ip):
+        stmts = self._emit(ip)
+        n = len(self.vm.code)
+        insn = self.vm.code[ip][-1]
+
+        v = self._lddw(ip)
+        if v is not None:
+            return ["r{} = {}".format(insn.destination, v)], False, ip + 2
+
+        if stmts is not None:
+            if insn.op_class == OPC_JMP:
+                return stmts, True, None
+            return stmts, False, (ip + 1) % n
+
+        # Interpreter fallback.
+        return [
+            "regs[:] = ({},)".format(REGS),
+            "ip = None",
+            "vm.ip = {}".format(ip),
+            "execute, handler, op_a, op_b, insn = code[{}]".format(ip),
+            "pc = execute(handler, op_a, op_b, insn)",
+            "{} = regs".format(REGS),
+            "continue"
+        ], True, None
+
+
+    # Returns Python statements for an instruction or None if it has to
+    # run through the interpreter handlers.
+    def _emit(self, ip):
+        insn = self.vm.code[ip][-1]
+        cls = insn.op_class
+        if cls in (OPC_ALU, OPC_ALU64):
+            return self._alu(ip, insn)
+        if cls == OPC_JMP:
+            return self._jmp(ip, insn)
+        if cls == OPC_LDX:
+            return self._ldx(ip, insn)
+        if cls in (OPC_ST, OPC_STX):
+            return self._st(ip, insn)
+        return None
+
+
+    def _alu(self, ip, insn):
+        op_src = (insn.op_code >> 3) & 0b1
+        op_opr = (insn.op_code >> 4) & 0b1111
+        d = "r{}".format(insn.destination)
+        v = op_src and "r{}".format(insn.source) or str(insn.immediate)
+
+        if insn.destination >= MAX_REGS or (op_src and insn.source >= MAX_REGS):
+            return None
+
+        if op_opr == ALU_ENDC:
+            expr = ENDC_EXPR.get((op_src, insn.immediate), None)
+            if expr is None:
+                return None
+            return ["{} = {}".format(d, expr.format(d=d))]
+
+        expr = alu_expr(insn.op_class, op_opr, op_src)
+        if expr is None:
+            return None
+        stmt = "{} = {}".format(d, expr.format(d=d, v=v))
+        if op_opr in DIV_BY_ZERO:
+            stmts = ["ip = {}".format(ip)]
+            dst = DIV_BY_ZERO[op_opr]
+            if dst is None:
+                return stmts + [stmt]
+            return stmts + [
+                "try:",
+                "    " + stmt,
+                "except ZeroDivisionError:",
+                "    {} = {}".format(d, dst),
+                "    raise"]
+        return [stmt]
+
+
+    def _jmp(self, ip, insn):
+        n = len(self.vm.code)
+        op_src = (insn.op_code >> 3) & 0b1
+        op_opr = (insn.op_code >> 4) & 0b1111
+        tgt = (ip + insn.offset_s) % n + 1
+
+        if op_src == JMP_K:
+            if op_opr == JMP_EXIT:
+                return [
+                    "regs[:] = ({},)".format(REGS),
+                    "vm.exit_val = r0",
+                    "vm.ip = {}".format(ip + 1),
+                    "return True"]
+            if op_opr == JMP_JA:
+                return ["pc = {}".format(tgt), "continue"]
+
+        cond = JMP_COND.get(op_opr, None)
+        if cond is None:
+            return None
+        if insn.destination >= MAX_REGS or (op_src and insn.source >= MAX_REGS):
+            return None
+        d = "r{}".format(insn.destination)
+        if op_src == JMP_K:
+            v, sv = str(insn.immediate), str(insn.immediate_s)
+        else:
+            v = "r{}".format(insn.source)
+            sv = "int32({})".format(v)
+        return [
+            "if {}:".format(cond.format(d=d, v=v, sv=sv)),
+            "    pc = {}".format(tgt),
+            "    continue",
+            "pc = {}".format(ip + 1),
+            "continue"]
+
+
+    def _ldx(self, ip, insn):
+        op_len = (insn.op_code >> 3) & 0b11
+        op_mod = (insn.op_code >> 5) & 0b111
+        if op_mod != LDST_MEM or max(insn.destination, insn.source) >= MAX_REGS:
+            return None
+        d = "r{}".format(insn.destination)
+        mi = "r{} + {}".format(insn.source, insn.offset)
+        if op_len == LEN_B:
+            load = "dm[{}]".format(mi)
+        else:
+            load = "{}(dm, {})[0]".format(LOAD_NAME[op_len], mi)
+        return ["ip = {}".format(ip), "{} = {}".format(d, load)]
+
+
+    def _st(self, ip, insn):
+        op_len = (insn.op_code >> 3) & 0b11
+        op_mod = (insn.op_code >> 5) & 0b111
+        if op_mod != LDST_MEM or max(insn.destination, insn.source) >= MAX_REGS:
+            return None
+        # Stores write the lower bytes of the value.
+        mask = LEN_MASK[op_len]
+        if insn.op_class == OPC_ST:
+            v = str(insn.immediate & mask)
+        else:
+            v = "r{} & {}".format(insn.source, mask)
+        mi = "r{} + {}".format(insn.destination, insn.offset)
+        if op_len == LEN_B:
+            store = "dm[{}] = {}".format(mi, v)
+        else:
+            store = "{}(dm, {}, {})".format(STORE_NAME[op_len], mi, v)
+        return ["ip = {}".format(ip), store]
@@ -0,0 +1,293 @@
+import csv
+
+from emulator.ebpf.constants import *
+from emulator.ebpf.vm_insn import Instruction
+from emulator.ebpf.vm_verifier import OP_LDDW, Verifier
+from emulator.ebpf.vm_profiler import JMP_CONDITIONAL
+
+
+# Cycles of a helper call. Not measured by stats_op_cycles.py as it
+# depends on the call handler, this is what the call_* test cases need
+# with the simulation call handler.
+CALL_CYCLES = 3
+
+ALU_NAMES = {
+    ALU_ADD: "add", ALU_SUB: "sub", ALU_MUL: "mul", ALU_DIV: "div",
+    ALU_OR: "or", ALU_AND: "and", ALU_LSH: "lsh", ALU_RSH: "rsh",
+    ALU_NEG: "neg", ALU_MOD: "mod", ALU_XOR: "xor", ALU_MOV: "mov",
+    ALU_ARSH: "arsh"
+}
+
+JMP_NAMES = {
+    JMP_JA: "ja", JMP_JEQ: "jeq", JMP_JGT: "jgt", JMP_JGE: "jge",
+    JMP_JSET: "jset", JMP_JNE: "jne", JMP_JSGT: "jsgt", JMP_JSGE: "jsge",
+    JMP_CALL: "call", JMP_EXIT: "exit", JMP_JLT: "jlt", JMP_JLE: "jle",
+    JMP_JSLT: "jslt", JMP_JSLE: "jsle"
+}
+
+SIZE_NAMES = {LEN_B: "b", LEN_H: "h", LEN_W: "w", LEN_DW: "dw"}
+
+
+# Read an opcode cycle table (as written by tests/stats_op_cycles.py to
+# tests/statistics) into a dict of opcode name to cycles.
+def read_cycle_table(file_name):
+    with open(file_name, newline="") as fd:
+        return {row["OpCode"]: int(row["Cycles"]) for row in csv.DictReader(fd)}
+
+
+# Name of an instruction as used in opcode cycle tables.
+def opcode_name(insn):
+    opc = insn.op_code
+    cls = insn.op_class
+    op = (opc >> 4) & 0b1111
+    src = "reg" if opc & 0x08 else "imm"
+
+    if opc == OP_LDDW:
+        return "lddw"
+    if cls in (OPC_ALU, OPC_ALU64):
+        suffix = "" if cls == OPC_ALU64 else "32"
+        if op == ALU_ENDC:
+            return "{}{}".format("be" if opc & 0x08 else "le", insn.immediate)
+        if op == ALU_NEG:
+            return "neg" + suffix
+        return "{}{} {}".format(ALU_NAMES.get(op, "?"), suffix, src)
+    if cls == OPC_JMP:
+        if op in JMP_CONDITIONAL:
+            return "{} {}".format(JMP_NAMES[op], src)
+        return JMP_NAMES.get(op, "?")
+    size = SIZE_NAMES[(opc >> 3) & 0b11]
+    if cls == OPC_LDX:
+        return "ldx" + size
+    if cls == OPC_ST:
+        return "st" + size
+    if cls == OPC_STX:
+        return "stx" + size
+    return "?"
+
+
+class CycleEstimator():
+
+    # words are the program's instructions in VM byte-order without
+    # padding (as for the Verifier). table maps opcode names to cycles
+    # (see read_cycle_table).
+    # call_cycles is either a number or a dict of helper function to
+    # cycles. Loops (cycles in the control flow graph) have no static
+    # bound, loop_bound limits how often a block inside a loop runs
+    # per packet.
+    def __init__(self, words, table, call_cycles=CALL_CYCLES,
+                loop_bound=None):
+        self.words = list(words)
+        Verifier(self.words, fpga=True).verify()
+
+        self.table = table
+        self.call_cycles = call_cycles
+        self.loop_bound = loop_bound
+        self.insns = [Instruction(w) for w in self.words]
+        self._build()
+
+
+    # Cycles of a single instruction.
+    def cycles(self, ip):
+        insn = self.insns[ip]
+        name = opcode_name(insn)
+        if name == "call":
+            if isinstance(self.call_cycles, dict):
+                return self.call_cycles.get(insn.immediate, CALL_CYCLES)
+            return self.call_cycles
+        if name in self.table:
+            return self.table[name]
+        # Tables do not list all source variants (e.g. 'mov reg').
+        for other in (name.replace(" reg", " imm"), name.replace(" imm", " reg")):
+            if other in self.table:
+                return self.table[other]
+        raise Exception("No cycles for '{}' (0x{:02x}) at 0x{:04x}".format(
+            name, insn.op_code, ip))
+
+
+    # Split the program into basic blocks and connect them. Blocks are
+    # keyed by their first IP, successors are (ip, taken) tuples where
+    # taken is None for unconditional edges.
+    def _build(self):
+        n = len(self.insns)
+        leaders = {0}
+        ip = 0
+        while ip < n:
+            insn = self.insns[ip]
+            op = (insn.op_code >> 4) & 0b1111
+            if insn.op_code == OP_LDDW:
+                ip += 2
+                continue
+            if insn.op_class == OPC_JMP and op != JMP_CALL:
+                if ip + 1 < n:
+                    leaders.add(ip + 1)
+                if op != JMP_EXIT:
+                    leaders.add(ip + insn.offset_s + 1)
+            ip += 1
+
+        # Only blocks reachable from IP 0.
+        self.blocks = {}
+        self.successors = {}
+        todo = [0]
+        while todo:
+            start = todo.pop()
+            if start in self.blocks:
+                continue
+            ip = start
+            cycles = 0
+            while True:
+                insn = self.insns[ip]
+                op = (insn.op_code >> 4) & 0b1111
+                cycles += self.cycles(ip)
+                last = ip
+                ip += 2 if insn.op_code == OP_LDDW else 1
+                if insn.op_class == OPC_JMP and op != JMP_CALL:
+                    break
+                if ip in leaders:
+                    break
+
+            insn = self.insns[last]
+            op = (insn.op_code >> 4) & 0b1111
+            if insn.op_class != OPC_JMP or op == JMP_CALL:
+                successors = [(ip, None)]
+            elif op == JMP_EXIT:
+                successors = []
+            elif op == JMP_JA:
+                successors = [(last + insn.offset_s + 1, None)]
+            else:
+                successors = [(ip, False), (last + insn.offset_s + 1, True)]
+            self.blocks[start] = (last, cycles)
+            self.successors[start] = successors
+            todo.extend(s for s, _ in successors)
+
+        self._components()
+
+
+    # Strongly connected components of the blocks reachable from IP 0
+    # (Tarjan) in reverse topological order. Components with more than
+    # one block or a self edge are loops.
+    def _components(self):
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        self.components = []
+
+        # Iterative to not hit the recursion limit on long programs.
+        work = [(0, iter(self.successors[0]))]
+        index[0] = low[0] = 0
+        stack.append(0)
+        on_stack.add(0)
+        while work:
+            node, it = work[-1]
+            for succ, _ in it:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(self.successors[succ])))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        b = stack.pop()
+                        on_stack.discard(b)
+                        component.append(b)
+                        if b == node:
+                            break
+                    self.components.append(sorted(component))
+
+        self.component_of = {}
+        for i, component in enumerate(self.components):
+            for b in component:
+                self.component_of[b] = i
+
+
+    # Check if a component is a loop.
+    def _is_loop(self, component):
+        return len(component) > 1 or \
+            any(s == component[0] for s, _ in self.successors[component[0]])
+
+
+    # Loops, each as list of the first IPs of its blocks.
+    def loops(self):
+        return [c for c in self.components if self._is_loop(c)]
+
+
+    # Cycles of a component. Every block of a loop is assumed to run
+    # loop_bound times.
+    def _component_cycles(self, component):
+        cycles = sum(self.blocks[b][1] for b in component)
+        if self._is_loop(component):
+            if self.loop_bound is None:
+                return None
+            return cycles * self.loop_bound
+        return cycles
+
+
+    # Edges leaving a component as (successor component, probability).
+    # Probability of a conditional edge is taken from branches (a dict of
+    # jump IP to (taken, not_taken) counts as returned by
+    # Profiler.branch_counts()), else 0.5.
+    def _edges(self, i, branches):
+        edges = []
+        for b in self.components[i]:
+            last = self.blocks[b][0]
+            taken, not_taken = branches.get(last, (1, 1))
+            total = taken + not_taken
+            for succ, is_taken in self.successors[b]:
+                j = self.component_of[succ]
+                if j == i:
+                    continue
+                if is_taken is None:
+                    p = 1.0
+                elif total == 0:
+                    p = 0.5
+                else:
+                    p = (taken if is_taken else not_taken) / total
+                edges.append((j, p))
+        return edges
+
+
+    # Worst-case cycles from reset to halt (longest path), None if the
+    # program contains loops and no loop_bound was given.
+    def worst_case(self):
+        # Components are in reverse topological order, successors first.
+        worst = []
+        for i, component in enumerate(self.components):
+            cycles = self._component_cycles(component)
+            if cycles is None:
+                return None
+            succ = [worst[j] for j, _ in self._edges(i, {})]
+            worst.append(cycles + max(succ, default=0))
+        return worst[-1]
+
+
+    # Expected cycles from reset to halt with each conditional jump taken
+    # with the probability given by branches (see _edges()).
+    def typical(self, branches=None):
+        branches = branches or {}
+        expected = []
+        for i, component in enumerate(self.components):
+            cycles = self._component_cycles(component)
+            if cycles is None:
+                return None
+            edges = self._edges(i, branches)
+            total = sum(p for _, p in edges)
+            succ = sum(expected[j] * p for j, p in edges)
+            expected.append(cycles + (succ / total if total else 0))
+        return expected[-1]
+
+
+# Packets per second a single CPU processes at sys_clk_freq (Hz) when
+# a packet takes cycles clock cycles.
+def packets_per_second(cycles, sys_clk_freq):
+    if cycles is None:
+        return None
+    return sys_clk_freq / cycles
@@ -6,17 +6,28 @@ from emulator.ebpf.constants import *
 from emulator.ebpf.tools import *
 
 
+# Check a program memory word before it is decoded. Done once when a
+# program is loaded (see VM.predecode()) instead of for every
+# Instruction created.
+def check_word(word):
+    if not isinstance(word, int):
+        raise Exception("Invalid opcode ({})".format(word))
+    if word > 0xffffffffffffffff or word < -1:
+        raise Exception("Invalid opcode (0x{:016x})".format(word))
+
+
 class Instruction():
 
-    def __init__(self, word, swap_endian=True):
+    # Decoded fields are plain slots, no per instance __dict__ and no
+    # property lookups on the hot path.
+    __slots__ = ("word", "op_code", "op_class", "destination", "source",
+        "offset", "offset_s", "immediate", "immediate_s")
 
-        if not isinstance(word, int):
-                raise Exception("Invalid opcode ({})".format(word))
-        if word > 0xffffffffffffffff or word < -1:
-                raise Exception("Invalid opcode (0x{:016x})".format(word))
+    # Word must have been checked with check_word(). swap_endian is kept
+    # for compatibility, the VM swaps words before decoding.
+    def __init__(self, word, swap_endian=True):
 
-        self._swap_endian = swap_endian
-        self._word = word
+        self.word = word
 
         # Represents a eBPF instruction.
         # See https://www.kernel.org/doc/Documentation/networking/filter.txt
@@ -37,69 +48,40 @@ class Instruction():
         #src_reg = (regs >> 4) & 0xf
         #cls = code & 7
 
-        self._opc = word & 0xff                # 0x00000000000000ff
-        self._dst = (word >> 8) & 0x0f         # 0x0000000000000f00
-        self._src = (word >> 12) & 0x0f        # 0x000000000000f000
-        self._off = (word >> 16) & 0xffff      # 0x00000000ffff0000
-        self._imm = (word >> 32) & 0xffffffff  # 0xffffffff00000000
+        self.op_code = word & 0xff                    # 0x00000000000000ff
+        self.destination = (word >> 8) & 0x0f         # 0x0000000000000f00
+        self.source = (word >> 12) & 0x0f             # 0x000000000000f000
+        self.offset = (word >> 16) & 0xffff           # 0x00000000ffff0000
+        self.immediate = (word >> 32) & 0xffffffff    # 0xffffffff00000000
 
-        self._off_s = int16(self._off)
-        self._imm_s = int32(self._imm)
-
-        self._cls = self._opc & 0b111
-
-
-    @property
-    def word(self):
-        return self._word
+        self.offset_s = int16(self.offset)
+        self.immediate_s = int32(self.immediate)
 
-    @property
-    def op_code(self):
-        return self._opc
+        self.op_class = self.op_code & 0b111
 
-    @property
-    def op_class(self):
-        return self._cls
 
-    @property
-    def destination(self):
-        return self._dst
+    # Short aliases.
     @property
     def dst(self):
-        return self._dst
+        return self.destination
 
     @property
-    def source(self):
-        return self._src
-    @property
     def src(self):
-        return self._src
+        return self.source
 
     @property
-    def offset(self):
-        return self._off
-    @property
     def off(self):
-        return self._off
-    @property
-    def offset_s(self):
-        return self._off_s
+        return self.offset
     @property
     def off_s(self):
-        return self._off_s
+        return self.offset_s
 
     @property
-    def immediate(self):
-        return self._imm
-    @property
     def imm(self):
-        return self._imm
-    @property
-    def immediate_s(self):
-        return self._imm_s
+        return self.immediate
     @property
     def imm_s(self):
-        return self._imm_s
+        return self.immediate_s
 
 
     def print(self):
@@ -5,6 +5,7 @@ from pprint import pprint
 
 from emulator.ebpf.constants import *
 from emulator.ebpf.tools import *
+from emulator.ebpf.vm_semantics import *
 
 
 class JMP():
@@ -32,10 +33,38 @@ class JMP():
 
 
     def decode(self, insn):
+        execute, handler, op_opr, op_src = self.resolve(insn)
+        return execute(handler, op_opr, op_src, insn)
+
+
+    # Conditional jumps are evaluated by the functions built from the
+    # expressions in vm_semantics.py. The function is looked up once here
+    # and handed to the handler instead of the operation.
+    def resolve(self, insn):
         op_src = (insn.op_code >> 3) & 0b1
         op_opr = (insn.op_code >> 4) & 0b1111
 
-        return self._decoder.get(op_opr, self._error)(op_opr, op_src, insn) + 1
+        f = jmp_function(op_opr)
+        return (self.execute, self._decoder.get(op_opr, self._error),
+                op_opr if f is None else f, op_src)
+
+
+    def execute(self, handler, op_opr, op_src, insn):
+        return handler(op_opr, op_src, insn) + 1
+
+
+    # Conditional jump handlers, f is the function of the condition.
+    def _cond(self, f, op_src, insn):
+        regs = self.vm.regs
+        if op_src == JMP_K:
+            v = insn.immediate
+            sv = insn.immediate_s
+        else:
+            v = regs[insn.source]
+            sv = int32(v)
+        if f(regs[insn.destination], v, sv):
+            return self.vm.inc_ip(n=insn.offset_s)
+        return self.vm.ip
 
 
     # Jump handlers.
@@ -50,94 +79,52 @@ class JMP():
 
 
     @disassemble("JMP", "jeq")
-    def _jeq(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x15  jeq dst, imm, +off   PC += off if dst == imm
-            if self.vm.regs[insn.destination] == insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x1d  jeq dst, src, +off   PC += off if dst == src
-            if self.vm.regs[insn.destination] == self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jeq(self, f, op_src, insn):
+        # 0x15  jeq dst, imm, +off   PC += off if dst == imm
+        # 0x1d  jeq dst, src, +off   PC += off if dst == src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jgt")
-    def _jgt(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x25  jgt dst, imm, +off   PC += off if dst > imm
-            if self.vm.regs[insn.destination] > insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x2d  jgt dst, src, +off   PC += off if dst > src
-            if self.vm.regs[insn.destination] > self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jgt(self, f, op_src, insn):
+        # 0x25  jgt dst, imm, +off   PC += off if dst > imm
+        # 0x2d  jgt dst, src, +off   PC += off if dst > src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jge")
-    def _jge(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x35  jge dst, imm, +off   PC += off if dst >= imm
-            if self.vm.regs[insn.destination] >= insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x3d  jge dst, src, +off   PC += off if dst >= src
-            if self.vm.regs[insn.destination] >= self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jge(self, f, op_src, insn):
+        # 0x35  jge dst, imm, +off   PC += off if dst >= imm
+        # 0x3d  jge dst, src, +off   PC += off if dst >= src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jset")
-    def _jset(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x45  jset dst, imm, +off  PC += off if dst & imm
-            if (self.vm.regs[insn.destination] & insn.immediate) == insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x4d  jset dst, src, +off  PC += off if dst & src
-            if (self.vm.regs[insn.destination] & self.vm.regs[insn.source]) == self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jset(self, f, op_src, insn):
+        # 0x45  jset dst, imm, +off  PC += off if dst & imm
+        # 0x4d  jset dst, src, +off  PC += off if dst & src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jne")
-    def _jne(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x55  jne dst, imm, +off   PC += off if dst != imm
-            if self.vm.regs[insn.destination] != insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x5d  jne dst, src, +off   PC += off if dst != src
-            if self.vm.regs[insn.destination] != self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jne(self, f, op_src, insn):
+        # 0x55  jne dst, imm, +off   PC += off if dst != imm
+        # 0x5d  jne dst, src, +off   PC += off if dst != src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jsgt")
-    def _jsgt(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x65  jsgt dst, imm, +off  PC += off if dst > imm (signed)
-            if int32(self.vm.regs[insn.destination]) > insn.immediate_s:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x6d  jsgt dst, src, +off  PC += off if dst > src (signed)
-            if int32(self.vm.regs[insn.destination]) > int32(self.vm.regs[insn.source]):
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jsgt(self, f, op_src, insn):
+        # 0x65  jsgt dst, imm, +off  PC += off if dst > imm (signed)
+        # 0x6d  jsgt dst, src, +off  PC += off if dst > src (signed)
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jsge")
-    def _jsge(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0x75  jsge dst, imm, +off  PC += off if dst >= imm (signed)
-            if int32(self.vm.regs[insn.destination]) >= insn.immediate_s:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0x7d  jsge dst, src, +off  PC += off if dst >= src (signed)
-            if int32(self.vm.regs[insn.destination]) >= int32(self.vm.regs[insn.source]):
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jsge(self, f, op_src, insn):
+        # 0x75  jsge dst, imm, +off  PC += off if dst >= imm (signed)
+        # 0x7d  jsge dst, src, +off  PC += off if dst >= src (signed)
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "call")
@@ -173,55 +160,31 @@ class JMP():
 
 
     @disassemble("JMP", "jlt")
-    def _jlt(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0xa5  jlt dst, imm, +off   PC += off if dst < imm
-            if self.vm.regs[insn.destination] < insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0xad  jlt dst, src, +off   PC += off if dst < src
-            if self.vm.regs[insn.destination] < self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jlt(self, f, op_src, insn):
+        # 0xa5  jlt dst, imm, +off   PC += off if dst < imm
+        # 0xad  jlt dst, src, +off   PC += off if dst < src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jle")
-    def _jle(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0xb5  jle dst, imm, +off   PC += off if dst <= imm
-            if self.vm.regs[insn.destination] <= insn.immediate:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0xbd  jle dst, src, +off   PC += off if dst <= src
-            if self.vm.regs[insn.destination] <= self.vm.regs[insn.source]:
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jle(self, f, op_src, insn):
+        # 0xb5  jle dst, imm, +off   PC += off if dst <= imm
+        # 0xbd  jle dst, src, +off   PC += off if dst <= src
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jslt")
-    def _jslt(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0xc5  jslt dst, imm, +off  PC += off if dst < imm (signed)
-            if int32(self.vm.regs[insn.destination]) < insn.immediate_s:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0xcd  jslt dst, src, +off  PC += off if dst < src (signed)
-            if int32(self.vm.regs[insn.destination]) < int32(self.vm.regs[insn.source]):
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jslt(self, f, op_src, insn):
+        # 0xc5  jslt dst, imm, +off  PC += off if dst < imm (signed)
+        # 0xcd  jslt dst, src, +off  PC += off if dst < src (signed)
+        return self._cond(f, op_src, insn)
 
 
     @disassemble("JMP", "jsle")
-    def _jsle(self, op_opr, op_src, insn):
-        if op_src == JMP_K:
-            # 0xd5  jsle dst, imm, +off  PC += off if dst <= imm (signed)
-            if int32(self.vm.regs[insn.destination]) <= insn.immediate_s:
-                return self.vm.inc_ip(n=insn.offset_s)
-        else:
-            # 0xdd  jsle dst, src, +off  PC += off if dst <= src (signed)
-            if int32(self.vm.regs[insn.destination]) <= int32(self.vm.regs[insn.source]):
-                return self.vm.inc_ip(n=insn.offset_s)
-        return self.vm.ip
+    def _jsle(self, f, op_src, insn):
+        # 0xd5  jsle dst, imm, +off  PC += off if dst <= imm (signed)
+        # 0xdd  jsle dst, src, +off  PC += off if dst <= src (signed)
+        return self._cond(f, op_src, insn)
 
 
     def _error(self, op_opr, op_src, insn, *args):
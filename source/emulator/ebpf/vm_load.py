@@ -24,10 +24,20 @@ class LOAD():
 
 
     def decode(self, insn):
+        execute, handler, op_mod, op_len = self.resolve(insn)
+        return execute(handler, op_mod, op_len, insn)
+
+
+    def resolve(self, insn):
         op_len = (insn.op_code >> 3) & 0b11
         op_mod = (insn.op_code >> 5) & 0b111
 
-        self._decoder.get(op_mod, self._error)(op_mod, op_len, insn)
+        return (self.execute, self._decoder.get(op_mod, self._error),
+                op_mod, op_len)
+
+
+    def execute(self, handler, op_mod, op_len, insn):
+        handler(op_mod, op_len, insn)
         return self.vm.inc_ip()
 
 
@@ -35,7 +45,7 @@ class LOAD():
     @disassemble("LD", "lddw")
     def _imm(self, op_mod, op_len, insn):
         self.vm.ip = self.vm.inc_ip()
-        tmp_insn = Instruction(self.vm.get_word(), swap_endian=self.vm.swap_endian)
+        tmp_insn = self.vm.code[self.vm.ip][-1]
         if tmp_insn.op_code != 0x00:
             self._error(op_mod, op_len, tmp_insn)
         self.vm.regs[insn.destination] = insn.immediate | (tmp_insn.imm << 32)
@@ -47,14 +57,11 @@ class LOAD():
         if op_len == LEN_B:
             self.vm.r0 = self.vm.data_mem[mi]
         elif op_len == LEN_H:
-            self.vm.r0 = int.from_bytes(self.vm.data_mem[mi:mi+2],
-                                        byteorder="big", signed=False)
+            self.vm.r0 = BE16.unpack_from(self.vm.data_mem, mi)[0]
         elif op_len == LEN_W:
-            self.vm.r0 = int.from_bytes(self.vm.data_mem[mi:mi+4],
-                                        byteorder="big", signed=False)
+            self.vm.r0 = BE32.unpack_from(self.vm.data_mem, mi)[0]
         elif op_len == LEN_DW:
-            self.vm.r0 = int.from_bytes(self.vm.data_mem[mi:mi+8],
-                                        byteorder="big", signed=False)
+            self.vm.r0 = BE64.unpack_from(self.vm.data_mem, mi)[0]
 
 
     @disassemble("LD", "ind")
@@ -75,14 +82,11 @@ class LOAD():
         if op_len == LEN_B:
             self.vm.regs[insn.destination] = self.vm.data_mem[mi]
         elif op_len == LEN_H:
-            self.vm.regs[insn.destination] = int.from_bytes(self.vm.data_mem[mi:mi+2],
-                                            byteorder="little", signed=False)
+            self.vm.regs[insn.destination] = LE16.unpack_from(self.vm.data_mem, mi)[0]
         elif op_len == LEN_W:
-            self.vm.regs[insn.destination] = int.from_bytes(self.vm.data_mem[mi:mi+4],
-                                            byteorder="little", signed=False)
+            self.vm.regs[insn.destination] = LE32.unpack_from(self.vm.data_mem, mi)[0]
         elif op_len == LEN_DW:
-            self.vm.regs[insn.destination] = int.from_bytes(self.vm.data_mem[mi:mi+8],
-                                            byteorder="little", signed=False)
+            self.vm.regs[insn.destination] = LE64.unpack_from(self.vm.data_mem, mi)[0]
 
 
     @disassemble("LD", "xadd")
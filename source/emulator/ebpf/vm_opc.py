@@ -20,6 +20,12 @@ class OPC():
         self.load = LOAD(vm)
         self.store = STORE(vm)
 
+        # Bind disassembly output to the instruction handlers in debug
+        # mode only, otherwise handlers are called without any wrapper.
+        if vm.debug:
+            for decoder in (self.alu, self.jmp, self.load, self.store):
+                trace_handlers(decoder)
+
         # OpCode decoder.
         self._decoder = {
             OPC_LD    : self.load.decode,
@@ -32,10 +38,35 @@ class OPC():
             OPC_ALU64 : self.alu.decode
         }
 
+        # OpCode resolver, used to pre-decode programs.
+        self._resolver = {
+            OPC_LD    : self.load.resolve,
+            OPC_LDX   : self.load.resolve,
+            OPC_ST    : self.store.resolve,
+            OPC_STX   : self.store.resolve,
+            OPC_ALU   : self.alu.resolve,
+            OPC_JMP   : self.jmp.resolve,
+            OPC_ALU64 : self.alu.resolve
+        }
+
 
     def decode(self, insn):
         return self._decoder.get(insn.op_class, self._error)(insn)
 
 
+    # Returns (execute, handler, op_a, op_b) for an instruction. Calling
+    # execute(handler, op_a, op_b, insn) runs the instruction and returns
+    # the next IP.
+    def resolve(self, insn):
+        resolver = self._resolver.get(insn.op_class, None)
+        if resolver is None:
+            return (self._execute, self._error, None, None)
+        return resolver(insn)
+
+
+    def _execute(self, handler, op_a, op_b, insn):
+        return handler(insn)
+
+
     def _error(self, insn, *args):
         raise Exception("Invalid instruction class: 0x{:016x}".format(insn.word))
@@ -0,0 +1,163 @@
+import time
+
+from emulator.ebpf.constants import *
+
+
+# Conditional jump operations (taken/not taken is recorded for them).
+JMP_CONDITIONAL = frozenset([
+    JMP_JEQ, JMP_JGT, JMP_JGE, JMP_JSET, JMP_JNE, JMP_JSGT, JMP_JSGE,
+    JMP_JLT, JMP_JLE, JMP_JSLT, JMP_JSLE])
+
+
+# Check if instruction is a helper function call.
+def _is_call(insn):
+    return insn.op_class == OPC_JMP and \
+        ((insn.op_code >> 4) & 0b1111) == JMP_CALL
+
+
+class Profiler():
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.reset()
+
+
+    # Clear all collected data. Data is accumulated over all runs of the
+    # program (e.g. all contexts of VM.run_batch()) until reset.
+    def reset(self):
+        n = len(self.vm.pgm_mem)
+        self.counts = [0] * n
+        self.taken = [0] * n
+        self.not_taken = [0] * n
+        self.call_time = [0.0] * n
+
+
+    # Run the pre-decoded program like the interpreter does while counting
+    # executions per IP, branch outcomes and time spent in helper calls.
+    # This loop is only used when the VM is created with profile=True so
+    # the other engines do not pay for it.
+    def run(self):
+        vm = self.vm
+        code = vm.code
+        counts = self.counts
+        taken = self.taken
+        not_taken = self.not_taken
+        call_time = self.call_time
+        clock = time.perf_counter
+
+        while vm.exit_val is None:
+            ip = vm.ip
+            execute, handler, op_a, op_b, insn = code[ip]
+            vm.cur_insn = insn
+            vm.print_state()
+            counts[ip] += 1
+
+            if insn.op_class != OPC_JMP:
+                vm.ip = execute(handler, op_a, op_b, insn)
+            elif ((insn.op_code >> 4) & 0b1111) in JMP_CONDITIONAL:
+                vm.ip = execute(handler, op_a, op_b, insn)
+                if vm.ip == ip + 1:
+                    not_taken[ip] += 1
+                else:
+                    taken[ip] += 1
+            elif _is_call(insn):
+                t = clock()
+                try:
+                    vm.ip = execute(handler, op_a, op_b, insn)
+                finally:
+                    call_time[ip] += clock() - t
+            else:
+                vm.ip = execute(handler, op_a, op_b, insn)
+
+        return vm.exit_val
+
+
+    # Instruction of an IP.
+    def _insn(self, ip):
+        return self.vm.code[ip][-1]
+
+
+    # Execution count per IP for all executed IPs.
+    def ip_counts(self):
+        return {ip: c for ip, c in enumerate(self.counts) if c}
+
+
+    # Execution count per opcode.
+    def opcode_counts(self):
+        counts = {}
+        for ip, c in self.ip_counts().items():
+            opc = self._insn(ip).op_code
+            counts[opc] = counts.get(opc, 0) + c
+        return counts
+
+
+    # Taken and not taken count per conditional jump IP.
+    def branch_counts(self):
+        return {ip: (self.taken[ip], self.not_taken[ip])
+            for ip, c in self.ip_counts().items()
+                if self.taken[ip] or self.not_taken[ip]}
+
+
+    # Number of calls and total time (in seconds) per helper function.
+    def helper_times(self):
+        helpers = {}
+        for ip, c in self.ip_counts().items():
+            insn = self._insn(ip)
+            if _is_call(insn):
+                calls, t = helpers.get(insn.immediate, (0, 0.0))
+                helpers[insn.immediate] = (calls + c, t + self.call_time[ip])
+        return helpers
+
+
+    # First IP of the basic block each IP belongs to. Blocks start at
+    # IP 0, at jump targets and after jumps.
+    def _blocks(self):
+        code = self.vm.code
+        n = len(code)
+        leaders = {0}
+        for ip in self.ip_counts():
+            insn = code[ip][-1]
+            if insn.op_class != OPC_JMP:
+                continue
+            op = (insn.op_code >> 4) & 0b1111
+            if op == JMP_CALL:
+                continue
+            leaders.add(ip + 1)
+            if op != JMP_EXIT:
+                leaders.add((ip + insn.offset_s) % n + 1)
+
+        blocks = {}
+        block = 0
+        for ip in range(max(self.ip_counts(), default=0) + 1):
+            if ip in leaders:
+                block = ip
+            blocks[ip] = block
+        return blocks
+
+
+    # Write profile as flat CSV, one line per executed IP.
+    def write_csv(self, file_name):
+        with open(file_name, "w") as fd:
+            fd.write("ip,opcode,count,taken,not_taken,helper,call_time\n")
+            for ip, c in self.ip_counts().items():
+                insn = self._insn(ip)
+                helper = ""
+                if _is_call(insn):
+                    helper = insn.immediate
+                fd.write("0x{:04x},0x{:02x},{},{},{},{},{:.9f}\n".format(
+                    ip, insn.op_code, c, self.taken[ip], self.not_taken[ip],
+                    helper, self.call_time[ip]))
+
+
+    # Write execution counts in collapsed stack format (as used by
+    # flamegraph.pl), program;block;instruction[;helper] count.
+    def write_collapsed(self, file_name, name="program"):
+        blocks = self._blocks()
+        with open(file_name, "w") as fd:
+            for ip, c in self.ip_counts().items():
+                insn = self._insn(ip)
+                stack = "{};block_0x{:04x};0x{:04x}_op_0x{:02x}".format(
+                    name, blocks[ip], ip, insn.op_code)
+                if _is_call(insn):
+                    stack += ";helper_{}".format(insn.immediate)
+                fd.write("{} {}\n".format(stack, c))
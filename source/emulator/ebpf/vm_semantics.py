@@ -0,0 +1,130 @@
+import functools
+
+from emulator.ebpf.constants import *
+from emulator.ebpf.tools import *
+
+
+# Semantics of ALU operations and jump conditions shared by all execution
+# engines: the interpreter handlers (vm_alu.py, vm_jump.py) and the
+# threaded (vm_threaded.py) and compiled (vm_compiled.py) engines build
+# their code from these expressions, so a change here applies to all of
+# them. Expressions are Python source, {d} is the destination register,
+# {v} the source register or immediate and {sv} the signed (int32)
+# source register or immediate.
+ALU64_EXPR = {
+    ALU_ADD  : "({d} + {v}) & 0xffffffffffffffff",
+    ALU_SUB  : "({d} - {v}) & 0xffffffffffffffff",
+    ALU_MUL  : "({d} * {v}) & 0xffffffffffffffff",
+    ALU_DIV  : "({d} // {v}) & 0xffffffffffffffff",
+    ALU_OR   : "({d} | {v}) & 0xffffffffffffffff",
+    ALU_AND  : "({d} & {v}) & 0xffffffffffffffff",
+    ALU_LSH  : "({d} << {v}) & 0xffffffffffffffff",
+    ALU_RSH  : "({d} >> {v}) & 0xffffffffffffffff",
+    ALU_NEG  : "-{d} & 0xffffffffffffffff",
+    ALU_MOD  : "({d} % {v}) & 0xffffffffffffffff",
+    ALU_XOR  : "({d} ^ {v}) & 0xffffffffffffffff",
+    ALU_MOV  : "{v} & 0xffffffffffffffff",
+    ALU_ARSH : "arit_rshift({d}, {v}, sign_bit_pos=63) & 0xffffffffffffffff"
+}
+
+ALU32_EXPR = {
+    ALU_ADD  : "({d} + {v}) & 0xffffffff",
+    ALU_SUB  : "({d} - {v}) & 0xffffffff",
+    ALU_MUL  : "({d} * {v}) & 0xffffffff",
+    ALU_DIV  : "(({d} & 0xffffffff) // ({v} & 0xffffffff)) & 0xffffffff",
+    ALU_OR   : "({d} | {v}) & 0xffffffff",
+    ALU_AND  : "({d} & {v}) & 0xffffffff",
+    ALU_LSH  : "({d} << {v}) & 0xffffffff",
+    ALU_RSH  : "(({d} & 0xffffffff) >> ({v} & 0xffffffff)) & 0xffffffff",
+    ALU_NEG  : "-{d} & 0xffffffff",
+    ALU_MOD  : "(({d} & 0xffffffff) % ({v} & 0xffffffff)) & 0xffffffff",
+    ALU_XOR  : "({d} ^ {v}) & 0xffffffff",
+    ALU_MOV  : "{v} & 0xffffffff",
+    ALU_ARSH : "arit_rshift({d} & 0xffffffff, {v} & 0xffffffff, " \
+               "sign_bit_pos=31) & 0xffffffff"
+}
+
+# Destination register after a division by zero, None if unchanged.
+# According to ebpf spec section 1.4.1 DIV clears it, MOD leaves it.
+DIV_BY_ZERO = {
+    ALU_DIV  : 0,
+    ALU_MOD  : None
+}
+
+# Endianess conversions by (source bit, size). Source bit set converts
+# to big endian, registers are little endian.
+ENDC_EXPR = {
+    (1, 16)  : "(({d} & 0xff) << 8) | (({d} >> 8) & 0xff)",
+    (1, 32)  : "int.from_bytes(({d} & 0xffffffff).to_bytes(4, 'little'), 'big')",
+    (1, 64)  : "int.from_bytes({d}.to_bytes(8, 'little'), 'big')",
+    (0, 16)  : "{d} & 0xffff",
+    (0, 32)  : "{d} & 0xffffffff",
+    (0, 64)  : "{d}"
+}
+
+# Conditions of conditional jumps.
+JMP_COND = {
+    JMP_JEQ  : "{d} == {v}",
+    JMP_JGT  : "{d} > {v}",
+    JMP_JGE  : "{d} >= {v}",
+    JMP_JSET : "({d} & {v}) == {v}",
+    JMP_JNE  : "{d} != {v}",
+    JMP_JSGT : "int32({d}) > {sv}",
+    JMP_JSGE : "int32({d}) >= {sv}",
+    JMP_JLT  : "{d} < {v}",
+    JMP_JLE  : "{d} <= {v}",
+    JMP_JSLT : "int32({d}) < {sv}",
+    JMP_JSLE : "int32({d}) <= {sv}"
+}
+
+# Globals of code built from the expressions above.
+NAMESPACE = {
+    "int32": int32,
+    "arit_rshift": arit_rshift
+}
+
+
+# Returns the ALU expression for an operation, None if not supported.
+# NEG is only valid with an immediate (source bit clear).
+def alu_expr(op_class, op_opr, op_src):
+    if op_opr == ALU_NEG and op_src:
+        return None
+    exprs = ALU64_EXPR if op_class == OPC_ALU64 else ALU32_EXPR
+    return exprs.get(op_opr, None)
+
+
+# Executes Python source in the shared namespace and returns the object
+# it defines as 'name'.
+def define(source, name):
+    namespace = dict(NAMESPACE)
+    exec(source, namespace)
+    return namespace[name]
+
+
+# Functions f(d, v) returning the result of an ALU operation, f(d) of an
+# endianess conversion and f(d, v, sv) the condition of a jump. None if
+# not supported.
+@functools.lru_cache(maxsize=None)
+def alu_function(op_class, op_opr, op_src):
+    expr = alu_expr(op_class, op_opr, op_src)
+    if expr is None:
+        return None
+    return define("def f(d, v):\n    return {}\n".format(
+        expr.format(d="d", v="v")), "f")
+
+
+@functools.lru_cache(maxsize=None)
+def endc_function(op_src, size):
+    expr = ENDC_EXPR.get((op_src, size), None)
+    if expr is None:
+        return None
+    return define("def f(d):\n    return {}\n".format(expr.format(d="d")), "f")
+
+
+@functools.lru_cache(maxsize=None)
+def jmp_function(op_opr):
+    cond = JMP_COND.get(op_opr, None)
+    if cond is None:
+        return None
+    return define("def f(d, v, sv):\n    return {}\n".format(
+        cond.format(d="d", v="v", sv="sv")), "f")
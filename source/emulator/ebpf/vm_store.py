@@ -23,10 +23,20 @@ class STORE():
 
 
     def decode(self, insn):
+        execute, handler, op_mod, op_len = self.resolve(insn)
+        return execute(handler, op_mod, op_len, insn)
+
+
+    def resolve(self, insn):
         op_len = (insn.op_code >> 3) & 0b11
         op_mod = (insn.op_code >> 5) & 0b111
 
-        self._decoder.get(op_mod, self._error)(op_mod, op_len, insn)
+        return (self.execute, self._decoder.get(op_mod, self._error),
+                op_mod, op_len)
+
+
+    def execute(self, handler, op_mod, op_len, insn):
+        handler(op_mod, op_len, insn)
         return self.vm.ip + 1
 
 
@@ -48,31 +58,20 @@ class STORE():
     @disassemble("ST", "stx")
     def _mem(self, op_mod, op_len, insn):
         if insn.op_class == OPC_ST:
-            mi = self.vm.regs[insn.destination] + insn.offset
-            if op_len == LEN_B:
-                self.vm.data_mem[mi] = insn.immediate
-            elif op_len == LEN_H:
-                self.vm.data_mem[mi:mi+2] = int.to_bytes(insn.immediate, 2,
-                                                byteorder="little", signed=False)
-            elif op_len == LEN_W:
-                self.vm.data_mem[mi:mi+4] = int.to_bytes(insn.immediate, 4,
-                                                byteorder="little", signed=False)
-            elif op_len == LEN_DW:
-                self.vm.data_mem[mi:mi+8] = int.to_bytes(insn.immediate, 8,
-                                                byteorder="little", signed=False)
-        elif insn.op_class == OPC_STX:
-            mi = self.vm.regs[insn.destination] + insn.offset
-            if op_len == LEN_B:
-                self.vm.data_mem[mi] = self.vm.regs[insn.source]
-            elif op_len == LEN_H:
-                self.vm.data_mem[mi:mi+2] = int.to_bytes(self.vm.regs[insn.source], 2,
-                                                byteorder="little", signed=False)
-            elif op_len == LEN_W:
-                self.vm.data_mem[mi:mi+4] = int.to_bytes(self.vm.regs[insn.source], 4,
-                                                byteorder="little", signed=False)
-            elif op_len == LEN_DW:
-                self.vm.data_mem[mi:mi+8] = int.to_bytes(self.vm.regs[insn.source], 8,
-                                                byteorder="little", signed=False)
+            value = insn.immediate
+        else:
+            value = self.vm.regs[insn.source]
+
+        # Stores write the lower bytes of the value.
+        mi = self.vm.regs[insn.destination] + insn.offset
+        if op_len == LEN_B:
+            self.vm.data_mem[mi] = value & MAX_UINT8
+        elif op_len == LEN_H:
+            LE16.pack_into(self.vm.data_mem, mi, value & MAX_UINT16)
+        elif op_len == LEN_W:
+            LE32.pack_into(self.vm.data_mem, mi, value & MAX_UINT32)
+        elif op_len == LEN_DW:
+            LE64.pack_into(self.vm.data_mem, mi, value & MAX_UINT64)
 
 
     @disassemble("ST", "xadd")
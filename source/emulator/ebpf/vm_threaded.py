@@ -0,0 +1,231 @@
+import sys
+import os
+import struct
+import functools
+from pprint import pprint
+
+from emulator.ebpf.constants import *
+from emulator.ebpf.tools import *
+from emulator.ebpf.vm_semantics import *
+
+
+class Threaded():
+
+    def __init__(self, vm):
+        self.vm = vm
+
+        # One specialized closure per program memory word. Each closure
+        # executes its instruction and returns the next IP (None on exit).
+        self.ops = None
+
+        # IPs running through interpreter handlers, which keep the VM IP
+        # up to date themselves.
+        self.fallback = set()
+
+        # Translators for OpCode classes.
+        self._translator = {
+            OPC_LDX   : self._ldx,
+            OPC_ST    : self._st,
+            OPC_STX   : self._st,
+            OPC_ALU   : self._alu,
+            OPC_JMP   : self._jmp,
+            OPC_ALU64 : self._alu
+        }
+
+
+    # Translate the pre-decoded program of the VM into closures.
+    def compile(self):
+        self.fallback = set()
+        self.ops = [self._translate(ip, entry)
+                    for ip, entry in enumerate(self.vm.code)]
+
+
+    # Run program until exit.
+    def run(self):
+        vm = self.vm
+        if vm.exit_val is not None:
+            return vm.exit_val
+
+        ops = self.ops
+        ip = vm.ip
+        try:
+            while ip is not None:
+                ip = ops[ip]()
+        except Exception:
+            if ip not in self.fallback:
+                vm.ip = ip
+            raise
+        return vm.exit_val
+
+
+    def _translate(self, ip, entry):
+        insn = entry[-1]
+        translator = self._translator.get(insn.op_class, None)
+        op = None
+        if translator is not None:
+            op = translator(ip, insn)
+        if op is None:
+            op = self._fallback(ip, entry)
+        return op
+
+
+    # Instructions without a specialized closure (e.g. lddw, call,
+    # endianess conversion or invalid instructions) run through the
+    # interpreter handlers.
+    def _fallback(self, ip, entry):
+        vm = self.vm
+        execute, handler, op_a, op_b, insn = entry
+        self.fallback.add(ip)
+
+        def op():
+            vm.ip = ip
+            return execute(handler, op_a, op_b, insn)
+        return op
+
+
+    # ALU closures.
+    def _alu(self, ip, insn):
+        op_src = (insn.op_code >> 3) & 0b1
+        op_opr = (insn.op_code >> 4) & 0b1111
+        make = _alu_factory(insn.op_class, op_opr, op_src)
+        if make is None:
+            return None
+        return make(self.vm.regs, insn.destination, insn.source,
+                    insn.immediate, (ip + 1) % len(self.vm.code))
+
+
+    # Jump closures.
+    def _jmp(self, ip, insn):
+        vm = self.vm
+        regs = vm.regs
+        nxt = ip + 1
+        tgt = (ip + insn.offset_s) % len(vm.code) + 1
+        op_src = (insn.op_code >> 3) & 0b1
+        op_opr = (insn.op_code >> 4) & 0b1111
+        d = insn.destination
+        s = insn.source
+        imm = insn.immediate
+        imm_s = insn.immediate_s
+
+        if op_opr == JMP_EXIT and op_src == JMP_K:
+            def op():
+                vm.exit_val = regs[0]
+                vm.ip = nxt
+                return None
+        elif op_opr == JMP_JA and op_src == JMP_K:
+            def op():
+                return tgt
+        else:
+            make = _jmp_factory(op_opr, op_src)
+            if make is None:
+                return None
+            op = make(regs, d, s, imm, imm_s, tgt, nxt)
+        return op
+
+
+    # Load closures (ldx).
+    def _ldx(self, ip, insn):
+        vm = self.vm
+        regs = vm.regs
+        nxt = (ip + 1) % len(vm.code)
+        op_len = (insn.op_code >> 3) & 0b11
+        op_mod = (insn.op_code >> 5) & 0b111
+        d = insn.destination
+        s = insn.source
+        off = insn.offset
+
+        if op_mod != LDST_MEM:
+            return None
+
+        if op_len == LEN_B:
+            def op():
+                regs[d] = vm.data_mem[regs[s] + off]
+                return nxt
+        else:
+            unpack_from = MEM_LE[op_len].unpack_from
+            def op():
+                regs[d] = unpack_from(vm.data_mem, regs[s] + off)[0]
+                return nxt
+        return op
+
+
+    # Store closures (st, stx).
+    def _st(self, ip, insn):
+        vm = self.vm
+        regs = vm.regs
+        nxt = ip + 1
+        op_len = (insn.op_code >> 3) & 0b11
+        op_mod = (insn.op_code >> 5) & 0b111
+        d = insn.destination
+        s = insn.source
+        off = insn.offset
+        imm = insn.immediate
+
+        if op_mod != LDST_MEM:
+            return None
+
+        # Stores write the lower bytes of the value.
+        mask = LEN_MASK[op_len]
+        if insn.op_class == OPC_ST:
+            value = imm & mask
+            if op_len == LEN_B:
+                def op():
+                    vm.data_mem[regs[d] + off] = value
+                    return nxt
+            else:
+                pack_into = MEM_LE[op_len].pack_into
+                def op():
+                    pack_into(vm.data_mem, regs[d] + off, value)
+                    return nxt
+        else:
+            if op_len == LEN_B:
+                def op():
+                    vm.data_mem[regs[d] + off] = regs[s] & MAX_UINT8
+                    return nxt
+            else:
+                pack_into = MEM_LE[op_len].pack_into
+                def op():
+                    pack_into(vm.data_mem, regs[d] + off, regs[s] & mask)
+                    return nxt
+        return op
+
+
+# Factories returning closures for ALU operations and conditional jumps
+# of the expressions in vm_semantics.py. Each is compiled once per
+# operation, closures then only bind registers, immediates and IPs.
+@functools.lru_cache(maxsize=None)
+def _alu_factory(op_class, op_opr, op_src):
+    expr = alu_expr(op_class, op_opr, op_src)
+    if expr is None:
+        return None
+    stmt = "regs[d] = " + expr.format(d="regs[d]",
+        v="regs[s]" if op_src else "imm")
+    dst = DIV_BY_ZERO.get(op_opr, None)
+    if dst is not None:
+        stmt = ("try:\n"
+            "                {}\n"
+            "            except ZeroDivisionError:\n"
+            "                regs[d] = {}\n"
+            "                raise").format(stmt, dst)
+    return define(
+        "def make(regs, d, s, imm, nxt):\n"
+        "        def op():\n"
+        "            {}\n"
+        "            return nxt\n"
+        "        return op\n".format(stmt), "make")
+
+
+@functools.lru_cache(maxsize=None)
+def _jmp_factory(op_opr, op_src):
+    cond = JMP_COND.get(op_opr, None)
+    if cond is None:
+        return None
+    if op_src == JMP_K:
+        cond = cond.format(d="regs[d]", v="imm", sv="imm_s")
+    else:
+        cond = cond.format(d="regs[d]", v="regs[s]", sv="int32(regs[s])")
+    return define(
+        "def make(regs, d, s, imm, imm_s, tgt, nxt):\n"
+        "        def op():\n"
+        "            return tgt if {} else nxt\n"
+        "        return op\n".format(cond), "make")
@@ -0,0 +1,171 @@
+from emulator.ebpf.constants import *
+from emulator.ebpf.vm_insn import Instruction, check_word
+
+
+OP_LDDW = OPC_LD | (LDST_IMM << 5) | (LEN_DW << 3)
+
+
+# Opcodes implemented by the emulator and the FPGA CPU.
+def _opcodes():
+    opcodes = set([OP_LDDW])
+    for cls in (OPC_ALU, OPC_ALU64):
+        for op in (ALU_ADD, ALU_SUB, ALU_MUL, ALU_DIV, ALU_OR, ALU_AND,
+                    ALU_LSH, ALU_RSH, ALU_MOD, ALU_XOR, ALU_MOV, ALU_ARSH):
+            opcodes.add(cls | (op << 4))
+            opcodes.add(cls | (op << 4) | 0x08)
+        opcodes.add(cls | (ALU_NEG << 4))
+    opcodes.add(OPC_ALU | (ALU_ENDC << 4))
+    opcodes.add(OPC_ALU | (ALU_ENDC << 4) | 0x08)
+    for op in (JMP_JEQ, JMP_JGT, JMP_JGE, JMP_JSET, JMP_JNE, JMP_JSGT,
+                JMP_JSGE, JMP_JLT, JMP_JLE, JMP_JSLT, JMP_JSLE):
+        opcodes.add(OPC_JMP | (op << 4))
+        opcodes.add(OPC_JMP | (op << 4) | 0x08)
+    opcodes.add(OPC_JMP | (JMP_JA << 4))
+    opcodes.add(OPC_JMP | (JMP_CALL << 4))
+    opcodes.add(OPC_JMP | (JMP_EXIT << 4))
+    for cls in (OPC_LDX, OPC_ST, OPC_STX):
+        for size in (LEN_W, LEN_H, LEN_B, LEN_DW):
+            opcodes.add(cls | (LDST_MEM << 5) | (size << 3))
+    return frozenset(opcodes)
+
+OPCODES = _opcodes()
+
+# Absolute (packet) loads, only implemented by the emulator.
+OPCODES_LDABS = frozenset(OPC_LD | (LDST_ABS << 5) | (size << 3)
+    for size in (LEN_W, LEN_H, LEN_B, LEN_DW))
+
+
+class Verifier():
+
+    # words are the program's instructions in VM byte-order (as returned
+    # by VM.get_word()) without padding. helpers, if given, are the
+    # numbers of the available helper functions. With fpga set only
+    # opcodes implemented by the FPGA CPU are accepted.
+    def __init__(self, words, helpers=None, fpga=False):
+        self.words = list(words)
+        self.helpers = helpers
+        self.opcodes = OPCODES if fpga else OPCODES | OPCODES_LDABS
+
+
+    # Returns a list of (ip, message) tuples for all errors found.
+    def errors(self):
+        errors = []
+        n = len(self.words)
+        if n == 0:
+            return [(0, "empty program")]
+
+        insns = []
+        for ip, w in enumerate(self.words):
+            try:
+                check_word(w)
+            except Exception as ex:
+                errors.append((ip, str(ex)))
+                return errors
+            insns.append(Instruction(w))
+
+        # Second words of lddw pairs, no instructions on their own.
+        lddw_high = set()
+
+        ip = 0
+        while ip < n:
+            insn = insns[ip]
+            opc = insn.op_code
+
+            if opc not in self.opcodes:
+                errors.append((ip, "unknown opcode 0x{:02x}".format(opc)))
+            if insn.source >= MAX_REGS:
+                errors.append((ip, "invalid source register"))
+            if insn.destination >= MAX_REGS:
+                errors.append((ip, "invalid destination register"))
+
+            if opc == OP_LDDW:
+                if ip + 1 >= n or insns[ip + 1].op_code != 0:
+                    errors.append((ip, "incomplete lddw"))
+                else:
+                    lddw_high.add(ip + 1)
+                    ip += 1
+
+            elif opc in self.opcodes and insn.op_class in (OPC_ALU, OPC_ALU64):
+                op = (opc >> 4) & 0b1111
+                if op in (ALU_DIV, ALU_MOD) and not (opc & 0x08) and \
+                        insn.immediate == 0:
+                    errors.append((ip, "division by zero"))
+                elif op == ALU_ENDC and insn.immediate not in (16, 32, 64):
+                    errors.append((ip, "invalid endian immediate"))
+
+            elif opc in self.opcodes and insn.op_class == OPC_JMP:
+                op = (opc >> 4) & 0b1111
+                if op == JMP_CALL:
+                    if self.helpers is not None and \
+                            insn.immediate not in self.helpers:
+                        errors.append((ip, "call to unknown helper "
+                            "function {}".format(insn.immediate)))
+                elif op != JMP_EXIT:
+                    target = ip + insn.offset_s + 1
+                    if target < 0 or target >= n:
+                        errors.append((ip, "jump out of bounds"))
+
+            ip += 1
+
+        for ip in range(n):
+            insn = insns[ip]
+            if ip in lddw_high or insn.op_class != OPC_JMP:
+                continue
+            op = (insn.op_code >> 4) & 0b1111
+            if op in (JMP_CALL, JMP_EXIT):
+                continue
+            if ip + insn.offset_s + 1 in lddw_high:
+                errors.append((ip, "jump to middle of lddw"))
+
+        if errors:
+            return sorted(errors)
+
+        return self._check_exit(insns)
+
+
+    # Walk all paths from IP 0, each must end in exit and stay inside
+    # the program.
+    def _check_exit(self, insns):
+        n = len(insns)
+        errors = []
+        exits = False
+        seen = set()
+        todo = [0]
+        while todo:
+            ip = todo.pop()
+            if ip in seen:
+                continue
+            seen.add(ip)
+
+            insn = insns[ip]
+            op = (insn.op_code >> 4) & 0b1111
+            if insn.op_code == OP_LDDW:
+                successors = [ip + 2]
+            elif insn.op_class != OPC_JMP or op == JMP_CALL:
+                successors = [ip + 1]
+            elif op == JMP_EXIT:
+                exits = True
+                successors = []
+            elif op == JMP_JA:
+                successors = [ip + insn.offset_s + 1]
+            else:
+                successors = [ip + 1, ip + insn.offset_s + 1]
+
+            for s in successors:
+                if s >= n:
+                    errors.append((ip, "falls off end of program"))
+                else:
+                    todo.append(s)
+
+        if not exits:
+            errors.append((0, "no reachable exit"))
+        return sorted(set(errors))
+
+
+    # Raise an exception for the first error found.
+    def verify(self):
+        errors = self.errors()
+        if errors:
+            ip, msg = errors[0]
+            raise Exception("Program verification failed at 0x{:04x}: "
+                "{}".format(ip, msg))
@@ -6,6 +6,7 @@ import os
 import argparse
 import struct
 from emulator.ebpf.vm import *
+from emulator.ebpf.pcap import read_frames
 #from scapy.all import *
 
 
@@ -33,6 +34,60 @@ def load_program(file_name):
     return list(struct.unpack(fmt, data))
 
 
+# Run each frame of a pcap/pcapng capture file through the program and
+# print the verdict (R0) per frame. Like the arty-a7-100-net hardware
+# the frame is placed into data memory and its length is given in R1.
+# Frames larger than data memory are skipped (the program would only see
+# part of them), each is reported and they are counted in the summary.
+def run_pcap(mem, file_name, engine, profile=None, verify=False):
+    vm = VM(mem=mem, swap_endian=True, engine=engine,
+            profile=profile is not None, verify=verify)
+    size = len(vm.data_mem)
+
+    # Number of the current frame in the capture file and skipped frames.
+    count = 0
+    skipped = 0
+
+    def fitting(frames):
+        nonlocal count, skipped
+        for frame in frames:
+            count += 1
+            if len(frame) > size:
+                skipped += 1
+                print("Frame {}: skipped, {} bytes larger than data "
+                    "memory ({} bytes)".format(count, len(frame), size))
+            else:
+                yield frame
+
+    verdicts = {}
+    for r0, error in vm.run_batch(fitting(read_frames(file_name)),
+            args=lambda frame: [len(frame)]):
+        if error is not None:
+            print("Frame {}: error: {}".format(count, error))
+            r0 = None
+        else:
+            print("Frame {}: 0x{:016x}".format(count, r0))
+        verdicts[r0] = verdicts.get(r0, 0) + 1
+
+    print("Frames: {}".format(count))
+    for r0, n in sorted(verdicts.items(), key=lambda i: (i[0] is None, i[0] or 0)):
+        if r0 is None:
+            print("  error: {}".format(n))
+        else:
+            print("  0x{:016x}: {}".format(r0, n))
+    if skipped:
+        print("  skipped: {}".format(skipped))
+
+    if profile is not None:
+        write_profile(vm, profile)
+
+
+# Write profile of VM as CSV and collapsed stacks (for flame graphs).
+def write_profile(vm, prefix):
+    vm.profiler.write_csv(prefix + ".csv")
+    vm.profiler.write_collapsed(prefix + ".folded")
+
+
 def main():
     try:
         bo = "{}-endian".format(sys.byteorder)
@@ -41,6 +96,16 @@ def main():
                               help='Binary file with compiled ebpf bytecode')
         parser.add_argument('--data', default=None,
                               help='Binary file with loaded into data memory')
+        parser.add_argument('--pcap', default=None,
+                              help='pcap or pcapng file, program is run for each frame '
+                                   '(frames larger than data memory are skipped and counted)')
+        parser.add_argument('--engine', default='compiled',
+                              choices=['interpreter', 'threaded', 'compiled'],
+                              help='Execution engine used with --pcap')
+        parser.add_argument('--verify', action='store_true',
+                              help='Verify program before running it')
+        parser.add_argument('--profile', default=None, metavar='PREFIX',
+                              help='Profile program, write PREFIX.csv and PREFIX.folded')
         parser.add_argument('--step', action='store_true',
                               help='Single step through program')
         args = parser.parse_args()
@@ -48,6 +113,10 @@ def main():
         # Load program into memory
         mem = load_program(args.program)
 
+        if args.pcap is not None:
+            run_pcap(mem, args.pcap, args.engine, args.profile, args.verify)
+            return 0
+
         data_mem = None
 
         # Data memory can also be filled with sample packets created
@@ -75,7 +144,8 @@ def main():
 
 
         # Instantiate VM
-        vm = VM(mem=mem, debug=True, swap_endian=True)
+        vm = VM(mem=mem, debug=True, swap_endian=True,
+                profile=args.profile is not None, verify=args.verify)
         if data_mem is not None:
             vm.data_mem = data_mem
 
@@ -88,6 +158,9 @@ def main():
 
         print("Exit value: 0x{:016x}".format(vm.exit_val))
 
+        if args.profile is not None:
+            write_profile(vm, args.profile)
+
         return 0
 
     except KeyboardInterrupt:
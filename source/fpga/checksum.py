@@ -0,0 +1,145 @@
+import sys
+sys.path.insert(0, '..')
+
+from operator import xor
+from migen import *
+
+
+# CRC32 (IEEE 802.3, reflected) of one byte as XOR of 'crc' and 'byte'
+# bits. Each result bit is a list of ('c', bit) and ('d', bit) inputs.
+def crc32_byte_terms(polynomial=0xedb88320):
+    crc = [{('c', i)} for i in range(32)]
+    for i in range(8):
+        bit = crc[0] ^ {('d', i)}
+        crc = crc[1:] + [set()]
+        for k in range(32):
+            if polynomial & (1 << k):
+                crc[k] = crc[k] ^ bit
+    return [sorted(terms) for terms in crc]
+
+
+# Checksums over a range of data memory for call handlers. Data memory is
+# read in 8 byte words (see RAM dat_r8), so a checksum takes about one
+# memory access per 8 bytes instead of a LDX per byte in a program loop.
+# op OP_INTERNET - Internet ones' complement checksum (RFC 1071) of 16 bit
+#                  big-endian words, an odd last byte is padded with 0.
+#                  'init' is added to the sum (e.g. a pseudo header sum).
+#                  Returns the complement of the folded sum, 0 if a range
+#                  including its checksum field is correct.
+#    OP_CRC32    - CRC32 as used by Ethernet and zlib.crc32, 'init' is
+#                  the CRC of previous data (0 to start).
+# Inputs must be stable while stb is set. The data memory to use is
+# connected with connect_data(), the CPU does this for its call handler
+# (it does not access data memory while a call is pending).
+# See emulator/ebpf/checksum.py for the same functions in Python.
+class Checksum(Module):
+
+    OP_INTERNET = 0
+    OP_CRC32 = 1
+
+    def __init__(self):
+        self.op = Signal()
+        self.offset = Signal(64)
+        self.length = Signal(64)
+        self.init = Signal(64)
+        self.ret = Signal(64)
+        self.stb = Signal()
+        self.ack = Signal()
+
+
+    def connect_data(self, data):
+        op = self.op
+        ret = self.ret
+        stb = self.stb
+        ack = self.ack
+
+        # # #
+
+        adr = Signal.like(data.adr)
+        remaining = Signal(64)
+        busy = Signal()
+        done = Signal()
+
+        # Sum of 16 bit words, large enough for data memory sizes.
+        total = Signal(48)
+        crc = Signal(32)
+
+        # Bytes of current word (valid ones only).
+        word = [Signal(8) for i in range(8)]
+        for i in range(8):
+            self.comb += If(remaining > i,
+                word[i].eq(data.dat_r8[8*i:8*(i+1)])
+            )
+
+        # CRC of valid bytes of current word.
+        terms = crc32_byte_terms()
+        stages = [crc]
+        for i in range(8):
+            prev = stages[-1]
+            stage = Signal(32)
+            inputs = {'c': prev, 'd': word[i]}
+            self.comb += If(remaining > i,
+                stage.eq(Cat(*[reduce(xor, [inputs[s][b] for s, b in t])
+                    for t in terms]))
+            ).Else(
+                stage.eq(prev)
+            )
+            stages.append(stage)
+
+        # Ones' complement sum folded to 16 bits.
+        fold1 = Signal(18)
+        fold2 = Signal(17)
+        fold3 = Signal(16)
+        self.comb += [
+            fold1.eq(total[0:16] + total[16:32] + total[32:48]),
+            fold2.eq(fold1[0:16] + fold1[16:18]),
+            fold3.eq(fold2[0:16] + fold2[16]),
+        ]
+
+        self.sync += [
+            ack.eq(0),
+
+            If(~stb,
+                busy.eq(0),
+                done.eq(0)
+            ).Elif(~busy & ~done,
+                # Start.
+                busy.eq(1),
+                adr.eq(self.offset),
+                remaining.eq(self.length),
+                total.eq(self.init[0:32]),
+                crc.eq(self.init[0:32] ^ 0xffffffff),
+                data.adr.eq(self.offset),
+            ).Elif(busy,
+                If(remaining == 0,
+                    busy.eq(0),
+                    done.eq(1),
+                    ack.eq(1),
+                    If(op == self.OP_INTERNET,
+                        ret.eq(fold3 ^ 0xffff)
+                    ).Else(
+                        ret.eq(crc ^ 0xffffffff)
+                    )
+                ).Elif(data.stb,
+                    If(data.ack,
+                        data.stb.eq(0),
+                        total.eq(total +
+                            Cat(word[7], word[6]) + Cat(word[5], word[4]) +
+                            Cat(word[3], word[2]) + Cat(word[1], word[0])),
+                        crc.eq(stages[-1]),
+                        If(remaining > 8,
+                            remaining.eq(remaining - 8),
+                        ).Else(
+                            remaining.eq(0)
+                        ),
+                        adr.eq(adr + 8),
+                        data.adr.eq(adr + 8),
+                    )
+                ).Else(
+                    # Read next word, address was set a cycle before so
+                    # reads take the same cycles independent of the
+                    # previous address (see RAMLanes ack).
+                    data.stb.eq(1),
+                )
+            )
+        ]
@@ -6,8 +6,11 @@ from litex.soc.interconnect.csr import *
 from fpga.constants import *
 from fpga.ram import *
 from fpga.ram64 import *
+from fpga.ram_lanes import *
+from fpga.ram_banks import *
 from fpga.math.divide import Divider
 from fpga.math.shift import Shifter
+from fpga.math.multiply import Multiplier
 
 
 class CPU(Module, AutoCSR):
@@ -16,7 +19,8 @@ class CPU(Module, AutoCSR):
     MAX_PGM_WORDS = 4096
     MAX_DATA_WORDS = 2048
 
-    # CPU states.
+    # CPU states. STATE_OP_FETCH is no longer entered, instructions
+    # are fetched while decoding the previous one.
     STATE_OP_FETCH = 0
     STATE_DECODE = 1
     STATE_DATA_FETCH = 2
@@ -27,7 +31,9 @@ class CPU(Module, AutoCSR):
     def __init__(self,
             pgm_init=None, max_pgm_words=MAX_PGM_WORDS,
             data_init=None, max_data_words=MAX_DATA_WORDS,
-            debug=False, call_handler=None, simulation=False):
+            debug=False, call_handler=None, simulation=False,
+            data_byte_lanes=False, data_banks=1, divider_radix=2,
+            shifter_stages=0, multiplier_stages=0):
 
         # Direct CPU status and control signals.
         self.reset_n = reset_n = Signal()
@@ -83,6 +89,10 @@ class CPU(Module, AutoCSR):
         state = Signal(self.STATE_HALT.bit_length())
         data_ack = Signal()
         div64_ack = Signal()
+        # Cycles a pipelined shift waited for its result.
+        alu_count = Signal(bits_for(shifter_stages))
+        # Multiplication started, waiting for its result.
+        mul_pending = Signal()
 
         # Represents an ebpf instruction.
         # See https://www.kernel.org/doc/Documentation/networking/filter.txt
@@ -122,6 +132,10 @@ class CPU(Module, AutoCSR):
         ip = Signal(32)
         ip_next = Signal(32)
 
+        jmp_target = Signal(32)
+        jmp_taken = Signal()
+        jmp_valid = Signal(reset=1)
+
         # hbpf program memory.
         self.submodules.pgm = pgm = RAM64(
                                 max_words=max_pgm_words,
@@ -131,18 +145,52 @@ class CPU(Module, AutoCSR):
         # Note: To get optimum performance, disable CSR access for
         # data memory. This is normally used for development
         # and debugging.
+        # With data_byte_lanes the data memory is organized in byte-lanes
+        # (see ram_lanes.py) which does any load or store in one memory
+        # cycle while keeping CSR access, but exposes the lanes as
+        # separate CSR memories.
+        # With data_banks > 1 there are several byte-lane data memories
+        # (see ram_banks.py), the CPU works on bank 'data.bank' while the
+        # next packet is written to 'data.rx_bank' through 'data.rx'.
 
         # hbpf data memory (e.g packet data).
-        self.submodules.data = data = RAM(max_words=max_data_words,
-                                init=data_init, write_capable=True,
-                                csr_access=True,
-                                debug=debug)
-
-        # Math divider for 32 and 64 bit.
-        self.submodules.div64 = div64 = Divider(data_width=64)
-
-        # Logic and arithmetic shifter.
-        self.submodules.arsh64 = arsh64 = Shifter(data_width=64)
+        if data_banks > 1:
+            assert data_byte_lanes, \
+                "Data memory banks require byte-lane data memory"
+            self.submodules.data = data = RAMBanks(banks=data_banks,
+                                    max_words=max_data_words,
+                                    init=data_init, write_capable=True,
+                                    csr_access=True,
+                                    debug=debug)
+        else:
+            data_ram = RAMLanes if data_byte_lanes else RAM
+            self.submodules.data = data = data_ram(max_words=max_data_words,
+                                    init=data_init, write_capable=True,
+                                    csr_access=True,
+                                    debug=debug)
+
+        # Call handlers with data memory access (e.g. checksums, see
+        # checksum.py) get the data memory, it is not used by the CPU
+        # while a call is pending.
+        if hasattr(self, 'call_handler') and \
+                hasattr(self.call_handler, 'connect_data'):
+            self.call_handler.connect_data(data)
+
+        # Math divider for 32 and 64 bit, divider_radix 4 or 16 computes
+        # 2 or 4 bits per cycle (see math/divide.py).
+        self.submodules.div64 = div64 = Divider(data_width=64,
+                                    radix=divider_radix)
+
+        # Logic and arithmetic shifter, single cycle or pipelined with
+        # shifter_stages stages for a higher fmax (see math/shift.py).
+        self.submodules.arsh64 = arsh64 = Shifter(data_width=64,
+                                    stages=shifter_stages)
+
+        # Multiplier for 32 and 64 bit, pipelined with multiplier_stages
+        # stages as DSP slices are, so MUL is not the critical path (see
+        # math/multiply.py).
+        self.submodules.mul64 = mul64 = Multiplier(data_width=64,
+                                    stages=multiplier_stages)
 
         #region Combinatorial logic.
         self.comb += [
@@ -165,6 +213,7 @@ class CPU(Module, AutoCSR):
             reset_n_int.eq(reset_n | csr_ctl.storage[0]),
 
             div64.reset_n.eq(reset_n_int),
+            mul64.reset_n.eq(reset_n_int),
 
             # MSB                                                        LSB
             # | Byte 8 | Byte 7  | Byte 5-6       | Byte 1-4               |
@@ -202,7 +251,180 @@ class CPU(Module, AutoCSR):
             dst_reg_32.eq(regs[dst]),
             dst_reg_32_s.eq(regs[dst]),
 
-            pgm.adr.eq(ip_next),
+            # Shifter inputs from the current instruction, shifts stay in
+            # STATE_DECODE for arsh64.latency cycles.
+            If(opclass == OPC_ALU,
+                If((opcode & 0xf0) == EBPF_OP_ARSH,
+                    arsh64.value.eq(Cat(dst_reg[0:32],
+                        Replicate(dst_reg[31], 32)))
+                ).Else(
+                    arsh64.value.eq(dst_reg[0:32])
+                )
+            ).Else(
+                arsh64.value.eq(dst_reg)
+            ),
+            If(opcode & EBPF_SRC_REG,
+                arsh64.shift.eq(src_reg)
+            ).Else(
+                arsh64.shift.eq(immediate)
+            ),
+            arsh64.arith.eq((opcode & 0xf0) == EBPF_OP_ARSH),
+            arsh64.left.eq((opcode & 0xf0) == EBPF_OP_LSH),
+
+            # Multiplier inputs from the current instruction, the lower 32
+            # bits of the product do not depend on upper operand bits.
+            # A multiplication is started in the first decode cycle of a
+            # MUL, the CPU stays in STATE_DECODE until mul64.ack.
+            mul64.a.eq(dst_reg),
+            If(opcode & EBPF_SRC_REG,
+                mul64.b.eq(src_reg)
+            ).Else(
+                mul64.b.eq(immediate)
+            ),
+            mul64.stb.eq(reset_n_int & ~halt & ~mul_pending &
+                (state == self.STATE_DECODE) &
+                ((opclass == OPC_ALU) | (opclass == OPC_ALU64)) &
+                ((opcode & 0xf0) == EBPF_OP_MUL)),
+        ]
+        #endregion
+
+        #region Jump condition
+        # Jumps are resolved during decode and the instruction at the
+        # jump target is fetched right away (see pgm.adr) instead of
+        # spending an extra op fetch cycle.
+        self.comb += [
+            jmp_target.eq(ip_next + offset_s),
+            Case(opcode, {
+                #region OP_JA
+                EBPF_OP_JA: [
+                    jmp_taken.eq(1),
+                ],
+                #endregion
+                #region OP_JEQ_IMM
+                EBPF_OP_JEQ_IMM: [
+                    jmp_taken.eq(regs[dst] == immediate)
+                ],
+                #endregion
+                #region OP_JEQ_REG
+                EBPF_OP_JEQ_REG: [
+                    jmp_taken.eq(regs[dst] == regs[src])
+                ],
+                #endregion
+                #region OP_JGT_IMM
+                EBPF_OP_JGT_IMM: [
+                    jmp_taken.eq(regs[dst] > immediate)
+                ],
+                #endregion
+                #region OP_JGT_REG
+                EBPF_OP_JGT_REG: [
+                    jmp_taken.eq(regs[dst] > regs[src])
+                ],
+                #endregion
+                #region OP_JGE_IMM
+                EBPF_OP_JGE_IMM: [
+                    jmp_taken.eq(regs[dst] >= immediate)
+                ],
+                #endregion
+                #region OP_JGE_REG
+                EBPF_OP_JGE_REG: [
+                    jmp_taken.eq(regs[dst] >= regs[src])
+                ],
+                #endregion
+                #region OP_JSET_IMM
+                EBPF_OP_JSET_IMM: [
+                    jmp_taken.eq((regs[dst] & immediate) != 0)
+                ],
+                #endregion
+                #region OP_JSET_REG
+                EBPF_OP_JSET_REG: [
+                    jmp_taken.eq((regs[dst] & regs[src]) != 0)
+                ],
+                #endregion
+                #region OP_JNE_IMM
+                EBPF_OP_JNE_IMM: [
+                    jmp_taken.eq(regs[dst] != immediate)
+                ],
+                #endregion
+                #region OP_JNE_REG
+                EBPF_OP_JNE_REG: [
+                    jmp_taken.eq(regs[dst] != regs[src])
+                ],
+                #endregion
+                #region OP_JSGT_IMM
+                EBPF_OP_JSGT_IMM: [
+                    jmp_taken.eq(dst_reg_32_s > immediate_s)
+                ],
+                #endregion
+                #region OP_JSGT_REG
+                EBPF_OP_JSGT_REG: [
+                    jmp_taken.eq(dst_reg_32_s > src_reg_32_s)
+                ],
+                #endregion
+                #region OP_JSGE_IMM
+                EBPF_OP_JSGE_IMM: [
+                    jmp_taken.eq(dst_reg_32_s >= immediate_s)
+                ],
+                #endregion
+                #region OP_JSGE_REG
+                EBPF_OP_JSGE_REG: [
+                    jmp_taken.eq(dst_reg_32_s >= src_reg_32_s)
+                ],
+                #endregion
+                #region OP_JLT_IMM
+                EBPF_OP_JLT_IMM: [
+                    jmp_taken.eq(regs[dst] < immediate)
+                ],
+                #endregion
+                #region OP_JLT_REG
+                EBPF_OP_JLT_REG: [
+                    jmp_taken.eq(regs[dst] < regs[src])
+                ],
+                #endregion
+                #region OP_JLE_IMM
+                EBPF_OP_JLE_IMM: [
+                    jmp_taken.eq(regs[dst] <= immediate)
+                ],
+                #endregion
+                #region OP_JLE_REG
+                EBPF_OP_JLE_REG: [
+                    jmp_taken.eq(regs[dst] <= regs[src])
+                ],
+                #endregion
+                #region OP_JSLT_IMM
+                EBPF_OP_JSLT_IMM: [
+                    jmp_taken.eq(dst_reg_32_s < immediate_s)
+                ],
+                #endregion
+                #region OP_JSLT_REG
+                EBPF_OP_JSLT_REG: [
+                    jmp_taken.eq(dst_reg_32_s < src_reg_32_s)
+                ],
+                #endregion
+                #region OP_JSLE_IMM
+                EBPF_OP_JSLE_IMM: [
+                    jmp_taken.eq(dst_reg_32_s <= immediate_s)
+                ],
+                #endregion
+                #region OP_JSLE_REG
+                EBPF_OP_JSLE_REG: [
+                    jmp_taken.eq(dst_reg_32_s <= src_reg_32_s)
+                ],
+                #endregion
+                "default": [
+                    jmp_valid.eq(0)
+                ]
+            }),
+
+            # Fetch next instruction from the jump target, the next IP or
+            # IP 0 during reset.
+            If(~reset_n_int,
+                pgm.adr.eq(0)
+            ).Elif((state == self.STATE_DECODE) & (opclass == OPC_JMP) &
+                    jmp_taken,
+                pgm.adr.eq(jmp_target)
+            ).Else(
+                pgm.adr.eq(ip_next)
+            )
         ]
         #endregion
 
@@ -261,13 +483,16 @@ class CPU(Module, AutoCSR):
                 error.eq(0),
                 halt.eq(0),
 
-                ip_next.eq(0),
+                # First instruction is fetched during reset.
+                ip_next.eq(1),
                 ip.eq(0),
                 instruction.eq(pgm.dat_r),
-                state.eq(self.STATE_OP_FETCH),
+                state.eq(self.STATE_DECODE),
 
                 keep_op.eq(0),
                 keep_dst.eq(0),
+                alu_count.eq(0),
+                mul_pending.eq(0),
 
                 self.r0.eq(0),
 
@@ -312,15 +537,6 @@ class CPU(Module, AutoCSR):
                 csr_r5.storage.eq(self.r5),
 
                 Case(state, {
-                    #region STATE_OP_FETCH
-                    self.STATE_OP_FETCH: [
-                        ip_next.eq(ip_next + 1),
-                        ip.eq(ip_next),
-                        instruction.eq(pgm.dat_r),
-                        state.eq(self.STATE_DECODE)
-                    ],
-                    #endregion
-
                     #region STATE_DECODE
                     # Decode instructions.
                     self.STATE_DECODE: [
@@ -478,6 +694,8 @@ class CPU(Module, AutoCSR):
                             #region OPC_ALU
                             OPC_ALU: [
                                 div64_ack.eq(0),
+                                # 32 bit divide on the lower operand half.
+                                div64.half.eq(1),
                                 Case(opcode, {
                                     #region OP_DIV_IMM
                                     EBPF_OP_DIV_IMM: [
@@ -539,111 +757,107 @@ class CPU(Module, AutoCSR):
                                         )
                                     ],
                                     #endregion
+                                    #region OP_MUL_IMM
+                                    EBPF_OP_MUL_IMM: [
+                                        If(mul64.ack,
+                                            regs[dst].eq(mul64.out & 0xffffffff),
+                                            mul_pending.eq(0),
+                                            ip_next.eq(ip_next + 1),
+                                            ip.eq(ip_next),
+                                            instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            mul_pending.eq(1)
+                                        )
+                                    ],
+                                    #endregion
+                                    #region OP_MUL_REG
+                                    EBPF_OP_MUL_REG: [
+                                        If(mul64.ack,
+                                            regs[dst].eq(mul64.out & 0xffffffff),
+                                            mul_pending.eq(0),
+                                            ip_next.eq(ip_next + 1),
+                                            ip.eq(ip_next),
+                                            instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            mul_pending.eq(1)
+                                        )
+                                    ],
+                                    #endregion
                                     #region OP_ARSH_IMM
                                     EBPF_OP_ARSH_IMM: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(Cat(
-                                                regs[dst][0:32],
-                                                Replicate(regs[dst][31], 32),
-                                            )),
-                                            arsh64.shift.eq(immediate),
-                                            arsh64.arith.eq(1),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out & 0xffffffff),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_ARSH_REG
                                     EBPF_OP_ARSH_REG: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(Cat(
-                                                regs[dst][0:32],
-                                                Replicate(regs[dst][31], 32),
-                                            )),
-                                            arsh64.shift.eq(regs[src] & 0xffffffff),
-                                            arsh64.arith.eq(1),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out & 0xffffffff),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_LSH_IMM
                                     EBPF_OP_LSH_IMM: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst] & 0xffffffff),
-                                            arsh64.shift.eq(immediate),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(1),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out & 0xffffffff),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_LSH_REG
                                     EBPF_OP_LSH_REG: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst] & 0xffffffff),
-                                            arsh64.shift.eq(regs[src] & 0xffffffff),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(1),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out & 0xffffffff),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_RSH_IMM
                                     EBPF_OP_RSH_IMM: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst] & 0xffffffff),
-                                            arsh64.shift.eq(immediate),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out & 0xffffffff),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_RSH_REG
                                     EBPF_OP_RSH_REG: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst] & 0xffffffff),
-                                            arsh64.shift.eq(regs[src] & 0xffffffff),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out & 0xffffffff),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
@@ -669,16 +883,6 @@ class CPU(Module, AutoCSR):
                                                 regs[dst].eq((regs[dst] - regs[src]) & 0xffffffff)
                                             ],
                                             #endregion
-                                            #region OP_MUL_IMM
-                                            EBPF_OP_MUL_IMM: [
-                                                regs[dst].eq((regs[dst] * immediate) & 0xffffffff)
-                                            ],
-                                            #endregion
-                                            #region OP_MUL_REG
-                                            EBPF_OP_MUL_REG: [
-                                                regs[dst].eq((regs[dst] * regs[src]) & 0xffffffff)
-                                            ],
-                                            #endregion
                                             #region OP_OR_IMM
                                             EBPF_OP_OR_IMM: [
                                                 regs[dst].eq((regs[dst] | immediate) & 0xffffffff)
@@ -808,179 +1012,25 @@ class CPU(Module, AutoCSR):
                                     #region OP_CALL
                                     EBPF_OP_CALL: call_handler_actions,
                                     #endregion
-                                    "default": [
-                                        state.eq(self.STATE_OP_FETCH),
-                                        Case(opcode, {
-                                            #region OP_JA
-                                            EBPF_OP_JA: [
-                                                ip_next.eq(ip_next + offset_s),
-                                            ],
-                                            #endregion
-                                            #region OP_JEQ_IMM
-                                            EBPF_OP_JEQ_IMM: [
-                                                If(regs[dst] == immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JEQ_REG
-                                            EBPF_OP_JEQ_REG: [
-                                                If(regs[dst] == regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JGT_IMM
-                                            EBPF_OP_JGT_IMM: [
-                                                If(regs[dst] > immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JGT_REG
-                                            EBPF_OP_JGT_REG: [
-                                                If(regs[dst] > regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JGE_IMM
-                                            EBPF_OP_JGE_IMM: [
-                                                If(regs[dst] >= immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JGE_REG
-                                            EBPF_OP_JGE_REG: [
-                                                If(regs[dst] >= regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSET_IMM
-                                            EBPF_OP_JSET_IMM: [
-                                                If(regs[dst] & immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSET_REG
-                                            EBPF_OP_JSET_REG: [
-                                                If(regs[dst] & regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JNE_IMM
-                                            EBPF_OP_JNE_IMM: [
-                                                If(regs[dst] != immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JNE_REG
-                                            EBPF_OP_JNE_REG: [
-                                                If(regs[dst] != regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSGT_IMM
-                                            EBPF_OP_JSGT_IMM: [
-                                                If(dst_reg_32_s > immediate_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSGT_REG
-                                            EBPF_OP_JSGT_REG: [
-                                                If(dst_reg_32_s > src_reg_32_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSGE_IMM
-                                            EBPF_OP_JSGE_IMM: [
-                                                If(dst_reg_32_s >= immediate_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSGE_REG
-                                            EBPF_OP_JSGE_REG: [
-                                                If(dst_reg_32_s >= src_reg_32_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_EXIT
-                                            EBPF_OP_EXIT: [
-                                                halt.eq(1),
-                                            ],
-                                            #endregion
-                                            #region OP_JLT_IMM
-                                            EBPF_OP_JLT_IMM: [
-                                                If(regs[dst] < immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JLT_REG
-                                            EBPF_OP_JLT_REG: [
-                                                If(regs[dst] < regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JLE_IMM
-                                            EBPF_OP_JLE_IMM: [
-                                                If(regs[dst] <= immediate,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JLE_REG
-                                            EBPF_OP_JLE_REG: [
-                                                If(regs[dst] <= regs[src],
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSLT_IMM
-                                            EBPF_OP_JSLT_IMM: [
-                                                If(dst_reg_32_s < immediate_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSLT_REG
-                                            EBPF_OP_JSLT_REG: [
-                                                If(dst_reg_32_s < src_reg_32_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSLE_IMM
-                                            EBPF_OP_JSLE_IMM: [
-                                                If(dst_reg_32_s <= immediate_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            #region OP_JSLE_REG
-                                            EBPF_OP_JSLE_REG: [
-                                                If(dst_reg_32_s <= src_reg_32_s,
-                                                    ip_next.eq(ip_next + offset_s),
-                                                )
-                                            ],
-                                            #endregion
-                                            "default": [
-                                                error.eq(1),
-                                                halt.eq(1)
-                                            ]
-                                        }),
+                                    #region OP_EXIT
+                                    EBPF_OP_EXIT: [
+                                        halt.eq(1),
                                         ip.eq(ip_next),
+                                    ],
+                                    #endregion
+                                    "default": [
+                                        If(~jmp_valid,
+                                            error.eq(1),
+                                            halt.eq(1)
+                                        ).Elif(jmp_taken,
+                                            ip_next.eq(jmp_target + 1),
+                                            ip.eq(jmp_target),
+                                            instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            ip_next.eq(ip_next + 1),
+                                            ip.eq(ip_next),
+                                            instruction.eq(pgm.dat_r),
+                                        )
                                     ]
                                 })
                             ],
@@ -994,6 +1044,7 @@ class CPU(Module, AutoCSR):
                             #region OPC_ALU64
                             OPC_ALU64: [
                                 div64_ack.eq(0),
+                                div64.half.eq(0),
                                 Case(opcode, {
                                     #region OP_DIV64_IMM
                                     EBPF_OP_DIV64_IMM: [
@@ -1055,105 +1106,107 @@ class CPU(Module, AutoCSR):
                                         )
                                     ],
                                     #endregion
+                                    #region OP_MUL64_IMM
+                                    EBPF_OP_MUL64_IMM: [
+                                        If(mul64.ack,
+                                            regs[dst].eq(mul64.out),
+                                            mul_pending.eq(0),
+                                            ip_next.eq(ip_next + 1),
+                                            ip.eq(ip_next),
+                                            instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            mul_pending.eq(1)
+                                        )
+                                    ],
+                                    #endregion
+                                    #region OP_MUL64_REG
+                                    EBPF_OP_MUL64_REG: [
+                                        If(mul64.ack,
+                                            regs[dst].eq(mul64.out),
+                                            mul_pending.eq(0),
+                                            ip_next.eq(ip_next + 1),
+                                            ip.eq(ip_next),
+                                            instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            mul_pending.eq(1)
+                                        )
+                                    ],
+                                    #endregion
                                     #region OP_ARSH64_IMM
                                     EBPF_OP_ARSH64_IMM: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst]),
-                                            arsh64.shift.eq(immediate),
-                                            arsh64.arith.eq(1),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_ARSH64_REG
                                     EBPF_OP_ARSH64_REG: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst]),
-                                            arsh64.shift.eq(regs[src]),
-                                            arsh64.arith.eq(1),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_LSH64_IMM
                                     EBPF_OP_LSH64_IMM: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst]),
-                                            arsh64.shift.eq(immediate),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(1),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_LSH64_REG
                                     EBPF_OP_LSH64_REG: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst]),
-                                            arsh64.shift.eq(regs[src]),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(1),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_RSH64_IMM
                                     EBPF_OP_RSH64_IMM: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst]),
-                                            arsh64.shift.eq(immediate),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
                                     #region OP_RSH64_REG
                                     EBPF_OP_RSH64_REG: [
-                                        If(~arsh64.ack,
-                                            arsh64.value.eq(regs[dst]),
-                                            arsh64.shift.eq(regs[src]),
-                                            arsh64.arith.eq(0),
-                                            arsh64.left.eq(0),
-                                            arsh64.stb.eq(1)
-                                        ).Else(
+                                        If(alu_count == arsh64.latency,
                                             regs[dst].eq(arsh64.out),
-                                            arsh64.stb.eq(0),
+                                            alu_count.eq(0),
                                             ip_next.eq(ip_next + 1),
                                             ip.eq(ip_next),
                                             instruction.eq(pgm.dat_r),
+                                        ).Else(
+                                            alu_count.eq(alu_count + 1)
                                         )
                                     ],
                                     #endregion
@@ -1179,16 +1232,6 @@ class CPU(Module, AutoCSR):
                                                 regs[dst].eq(regs[dst] - regs[src])
                                             ],
                                             #endregion
-                                            #region OP_MUL64_IMM
-                                            EBPF_OP_MUL64_IMM: [
-                                                regs[dst].eq(regs[dst] * immediate)
-                                            ],
-                                            #endregion
-                                            #region OP_MUL64_REG
-                                            EBPF_OP_MUL64_REG: [
-                                                regs[dst].eq(regs[dst] * regs[src])
-                                            ],
-                                            #endregion
                                             #region OP_OR64_IMM
                                             EBPF_OP_OR64_IMM: [
                                                 regs[dst].eq(regs[dst] | immediate)
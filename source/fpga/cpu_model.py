@@ -0,0 +1,501 @@
+import sys
+sys.path.insert(0, '..')
+
+from fpga.constants import *
+
+
+# Cycles the CPU spends in its states, derived from fpga/cpu.py,
+# fpga/ram.py and fpga/math. Instructions not listed are decoded and
+# executed in a single STATE_DECODE cycle.
+
+# Data memory (RAM with CSR access) access in STATE_DATA_FETCH: strobe,
+# start, address wait, 8 byte reads and the cycle ack is seen. Writes
+# store ww bytes after a start cycle first and then do a full read.
+DATA_READ_CYCLES = 12
+DATA_WRITE_CYCLES = DATA_READ_CYCLES + 1
+
+# Data memory organized in byte-lanes (RAMLanes): strobe and the cycle
+# ack is seen, for reads and writes of any size.
+LANES_DATA_CYCLES = 2
+
+# STATE_DIV_PENDING: strobe, load, one cycle per log2(radix) significant
+# bits of the dividend (leading zeros are skipped). Division by zero is
+# flagged right after the load.
+DIV_LOAD_CYCLES = 2
+DIV_ERROR_CYCLES = 2
+
+
+# Cycles in STATE_DIV_PENDING for a division of dividend.
+def div_cycles(dividend, radix=2):
+    bits = radix.bit_length() - 1
+    return DIV_LOAD_CYCLES + (dividend.bit_length() + bits - 1) // bits
+
+
+# Shifts take one STATE_DECODE cycle plus one per shifter pipeline
+# stage.
+SHIFT_CYCLES = 1
+
+# Multiplies take one STATE_DECODE cycle plus one per multiplier pipeline
+# stage.
+MUL_CYCLES = 1
+
+# Cycles a call handler needs from seeing stb to ack (as the
+# CallHandler of test_fpga_sim.py). STATE_CALL_PENDING takes one more.
+CALL_LATENCY = 1
+
+MASK32 = 0xffffffff
+MASK64 = 0xffffffffffffffff
+
+
+# Sign extend 32 bit value.
+def _s32(v):
+    v &= MASK32
+    return v - 0x100000000 if v & 0x80000000 else v
+
+
+# Operations of the single cycle ALU instructions, (dst, operand) ->
+# dst where operand is the unsigned immediate or the source register.
+_ALU = {
+    EBPF_OP_ADD_IMM: lambda d, v: (d + v) & MASK32,
+    EBPF_OP_ADD_REG: lambda d, v: (d + v) & MASK32,
+    EBPF_OP_SUB_IMM: lambda d, v: (d - v) & MASK32,
+    EBPF_OP_SUB_REG: lambda d, v: (d - v) & MASK32,
+    EBPF_OP_MUL_IMM: lambda d, v: (d * v) & MASK32,
+    EBPF_OP_MUL_REG: lambda d, v: (d * v) & MASK32,
+    EBPF_OP_OR_IMM: lambda d, v: (d | v) & MASK32,
+    EBPF_OP_OR_REG: lambda d, v: (d | v) & MASK32,
+    EBPF_OP_AND_IMM: lambda d, v: (d & v) & MASK32,
+    EBPF_OP_AND_REG: lambda d, v: (d & v) & MASK32,
+    EBPF_OP_NEG: lambda d, v: -d & MASK32,
+    EBPF_OP_XOR_IMM: lambda d, v: (d ^ v) & MASK32,
+    EBPF_OP_XOR_REG: lambda d, v: (d ^ v) & MASK32,
+    EBPF_OP_MOV_IMM: lambda d, v: v,
+    # The CPU copies all 64 bits.
+    EBPF_OP_MOV_REG: lambda d, v: v,
+
+    EBPF_OP_ADD64_IMM: lambda d, v: (d + v) & MASK64,
+    EBPF_OP_ADD64_REG: lambda d, v: (d + v) & MASK64,
+    EBPF_OP_SUB64_IMM: lambda d, v: (d - v) & MASK64,
+    EBPF_OP_SUB64_REG: lambda d, v: (d - v) & MASK64,
+    EBPF_OP_MUL64_IMM: lambda d, v: (d * v) & MASK64,
+    EBPF_OP_MUL64_REG: lambda d, v: (d * v) & MASK64,
+    EBPF_OP_OR64_IMM: lambda d, v: d | v,
+    EBPF_OP_OR64_REG: lambda d, v: d | v,
+    EBPF_OP_AND64_IMM: lambda d, v: d & v,
+    EBPF_OP_AND64_REG: lambda d, v: d & v,
+    EBPF_OP_NEG64: lambda d, v: -d & MASK64,
+    EBPF_OP_XOR64_IMM: lambda d, v: d ^ v,
+    EBPF_OP_XOR64_REG: lambda d, v: d ^ v,
+    EBPF_OP_MOV64_IMM: lambda d, v: v,
+    EBPF_OP_MOV64_REG: lambda d, v: v,
+}
+
+# Multiplies, pipelined in the CPU.
+_MUL = {EBPF_OP_MUL_IMM, EBPF_OP_MUL_REG, EBPF_OP_MUL64_IMM, EBPF_OP_MUL64_REG}
+
+# Shifts, (dst, operand) -> dst.
+def _arsh(v, s):
+    return ((v - (1 << 64) if v >> 63 else v) >> s) & MASK64
+
+_SHIFT = {
+    EBPF_OP_LSH_IMM: lambda d, v: ((d & MASK32) << (v & 63)) & MASK32,
+    EBPF_OP_LSH_REG: lambda d, v: ((d & MASK32) << (v & 63)) & MASK32,
+    EBPF_OP_RSH_IMM: lambda d, v: (d & MASK32) >> (v & 63),
+    EBPF_OP_RSH_REG: lambda d, v: (d & MASK32) >> (v & 63),
+    EBPF_OP_ARSH_IMM: lambda d, v: _arsh(_s32(d) & MASK64, v & 63) & MASK32,
+    EBPF_OP_ARSH_REG: lambda d, v: _arsh(_s32(d) & MASK64, v & 63) & MASK32,
+    EBPF_OP_LSH64_IMM: lambda d, v: (d << (v & 63)) & MASK64,
+    EBPF_OP_LSH64_REG: lambda d, v: (d << (v & 63)) & MASK64,
+    EBPF_OP_RSH64_IMM: lambda d, v: d >> (v & 63),
+    EBPF_OP_RSH64_REG: lambda d, v: d >> (v & 63),
+    EBPF_OP_ARSH64_IMM: lambda d, v: _arsh(d, v & 63),
+    EBPF_OP_ARSH64_REG: lambda d, v: _arsh(d, v & 63),
+}
+
+# Divisions, opcode -> (32 bit operands, remainder).
+_DIV = {
+    EBPF_OP_DIV_IMM: (True, False), EBPF_OP_DIV_REG: (True, False),
+    EBPF_OP_MOD_IMM: (True, True), EBPF_OP_MOD_REG: (True, True),
+    EBPF_OP_DIV64_IMM: (False, False), EBPF_OP_DIV64_REG: (False, False),
+    EBPF_OP_MOD64_IMM: (False, True), EBPF_OP_MOD64_REG: (False, True),
+}
+
+# Conditional jumps, (dst, operand) -> taken. Signed jumps compare the
+# lower 32 bits.
+_JMP = {
+    EBPF_OP_JEQ_IMM: lambda d, v: d == v,
+    EBPF_OP_JEQ_REG: lambda d, v: d == v,
+    EBPF_OP_JGT_IMM: lambda d, v: d > v,
+    EBPF_OP_JGT_REG: lambda d, v: d > v,
+    EBPF_OP_JGE_IMM: lambda d, v: d >= v,
+    EBPF_OP_JGE_REG: lambda d, v: d >= v,
+    EBPF_OP_JSET_IMM: lambda d, v: (d & v) != 0,
+    EBPF_OP_JSET_REG: lambda d, v: (d & v) != 0,
+    EBPF_OP_JNE_IMM: lambda d, v: d != v,
+    EBPF_OP_JNE_REG: lambda d, v: d != v,
+    EBPF_OP_JSGT_IMM: lambda d, v: _s32(d) > _s32(v),
+    EBPF_OP_JSGT_REG: lambda d, v: _s32(d) > _s32(v),
+    EBPF_OP_JSGE_IMM: lambda d, v: _s32(d) >= _s32(v),
+    EBPF_OP_JSGE_REG: lambda d, v: _s32(d) >= _s32(v),
+    EBPF_OP_JLT_IMM: lambda d, v: d < v,
+    EBPF_OP_JLT_REG: lambda d, v: d < v,
+    EBPF_OP_JLE_IMM: lambda d, v: d <= v,
+    EBPF_OP_JLE_REG: lambda d, v: d <= v,
+    EBPF_OP_JSLT_IMM: lambda d, v: _s32(d) < _s32(v),
+    EBPF_OP_JSLT_REG: lambda d, v: _s32(d) < _s32(v),
+    EBPF_OP_JSLE_IMM: lambda d, v: _s32(d) <= _s32(v),
+    EBPF_OP_JSLE_REG: lambda d, v: _s32(d) <= _s32(v),
+}
+
+_LDX = {EBPF_OP_LDXB: 1, EBPF_OP_LDXH: 2, EBPF_OP_LDXW: 4, EBPF_OP_LDXDW: 8}
+_ST = {EBPF_OP_STB: 1, EBPF_OP_STH: 2, EBPF_OP_STW: 4, EBPF_OP_STDW: 8}
+_STX = {EBPF_OP_STXB: 1, EBPF_OP_STXH: 2, EBPF_OP_STXW: 4, EBPF_OP_STXDW: 8}
+
+
+# Cycle accurate behavioral model of the hBPF CPU (fpga/cpu.py). It
+# passes the same states, takes the same number of clock cycles per
+# state and reports the same ticks, halt and error signals and register
+# contents as the gateware, without simulating signals.
+class CPUModel():
+
+    MAX_REGS = 11
+    MAX_PGM_WORDS = 4096
+    MAX_DATA_WORDS = 2048
+
+    # CPU states.
+    STATE_OP_FETCH = 0
+    STATE_DECODE = 1
+    STATE_DATA_FETCH = 2
+    STATE_DIV_PENDING = 3
+    STATE_CALL_PENDING = 4
+    STATE_HALT = 5
+
+    # pgm_init and data_init are lists as for the CPU (32 bit big-endian
+    # program half words, data bytes). call_handler maps functions to
+    # callables (r1, ..., r5) -> ret, a return value of None keeps the
+    # previous ret like a call handler not driving it. call_latency is
+    # the cycles the call handler needs to ack, either a number or a
+    # dict per function. Numbers can also be callables (r1, ..., r5) ->
+    # cycles for functions depending on arguments (e.g. checksums over a
+    # range). data_byte_lanes, divider_radix, shifter_stages and
+    # multiplier_stages as for the CPU.
+    def __init__(self,
+            pgm_init=None, max_pgm_words=MAX_PGM_WORDS,
+            data_init=None, max_data_words=MAX_DATA_WORDS,
+            call_handler=None, call_latency=CALL_LATENCY,
+            data_byte_lanes=False, divider_radix=2, shifter_stages=0,
+            multiplier_stages=0):
+
+        self.pgm = [0] * max_pgm_words
+        if pgm_init is not None:
+            if len(pgm_init) > max_pgm_words:
+                raise Exception("Init contents ({} words) does not fit into "
+                    "specified maximum ({} words)".format(
+                    len(pgm_init), max_pgm_words))
+            self.pgm[:len(pgm_init)] = pgm_init
+        self.pgm_mask = (1 << (max_pgm_words - 1).bit_length()) - 1
+
+        self.data = bytearray(max_data_words)
+        if data_init is not None:
+            if len(data_init) > max_data_words:
+                raise Exception("Init contents ({} words) does not fit into "
+                    "specified maximum ({} words)".format(
+                    len(data_init), max_data_words))
+            self.data[:len(data_init)] = bytes(data_init)
+        self.data_mask = (1 << (max_data_words - 1).bit_length()) - 1
+
+        self.call_handler = call_handler
+        self.call_latency = call_latency
+        self.call_ret = 0
+        self.divider_radix = divider_radix
+        self.shift_cycles = SHIFT_CYCLES + shifter_stages
+        self.mul_cycles = MUL_CYCLES + multiplier_stages
+
+        if data_byte_lanes:
+            self.data_read_cycles = LANES_DATA_CYCLES
+            self.data_write_cycles = [LANES_DATA_CYCLES] * 9
+        else:
+            self.data_read_cycles = DATA_READ_CYCLES
+            self.data_write_cycles = [DATA_WRITE_CYCLES + size
+                for size in range(9)]
+
+        self.regs = [0] * self.MAX_REGS
+        self.insns = {}
+        self.reset()
+
+
+    # Registers r0 - r10.
+    def __getattr__(self, name):
+        if name[0] == "r" and name[1:].isdigit():
+            return self.regs[int(name[1:])]
+        raise AttributeError(name)
+
+
+    # Bring CPU into reset, r1 - r5 are the input arguments, all other
+    # registers are cleared.
+    def reset(self, r1=0, r2=0, r3=0, r4=0, r5=0):
+        self.regs[:] = [0, r1, r2, r3, r4, r5] + [0] * (self.MAX_REGS - 6)
+        self.ticks = 0
+        self.halt = 0
+        self.error = 0
+        self.ip = 0
+        self.state = self.STATE_DECODE
+        self.state_ticks = [0] * (self.STATE_HALT + 1)
+
+
+    # Decoded fields of the instruction at IP (opcode, dst, src, offset,
+    # signed offset, immediate) as the CPU decodes them.
+    def insn(self, ip):
+        insn = self.insns.get(ip, None)
+        if insn is None:
+            size = len(self.pgm)
+            adr = (ip << 1) & self.pgm_mask
+            hi = self.pgm[adr] if adr < size else 0
+            lo = self.pgm[adr + 1] if adr + 1 < size else 0
+            offset = ((hi >> 8) & 0xff) | ((hi & 0xff) << 8)
+            insn = (
+                (hi >> 24) & 0xff,
+                (hi >> 16) & 0x0f,
+                (hi >> 20) & 0x0f,
+                offset,
+                offset - 0x10000 if offset & 0x8000 else offset,
+                int.from_bytes(lo.to_bytes(4, "big"), "little")
+            )
+            self.insns[ip] = insn
+        return insn
+
+
+    # Read and write data memory as the RAM does, little-endian and
+    # wrapping around at the end of memory.
+    def _read(self, adr, size):
+        data = self.data
+        mask = self.data_mask
+        n = len(data)
+        value = 0
+        for i in range(size):
+            a = (adr + i) & mask
+            if a < n:
+                value |= data[a] << (8 * i)
+        return value
+
+
+    def _write(self, adr, size, value):
+        data = self.data
+        mask = self.data_mask
+        for i in range(size):
+            a = (adr + i) & mask
+            if a < len(data):
+                data[a] = (value >> (8 * i)) & 0xff
+
+
+    # Spend cycles in a state.
+    def _tick(self, state, cycles):
+        self.state_ticks[state] += cycles
+        self.ticks += cycles
+
+
+    # Stop with error, the current cycle is not counted (checks done
+    # before an instruction is processed).
+    def _fault(self):
+        self.error = 1
+        self.halt = 1
+
+
+    # Stop with error in a counted cycle of state.
+    def _fail(self, state, cycles=1):
+        self._tick(state, cycles)
+        self._fault()
+
+
+    # Run the CPU from reset until it halts or max_ticks are reached.
+    # Returns r0.
+    def run(self, max_ticks=None):
+        regs = self.regs
+        MAX_REGS = self.MAX_REGS
+
+        # The first instruction is fetched during reset.
+        ip = 0
+
+        while not self.halt:
+            if max_ticks is not None and self.ticks >= max_ticks:
+                break
+
+            self.ip = ip
+            self.state = self.STATE_DECODE
+            op, dst, src, offset, offset_s, imm = self.insn(ip)
+            if src >= MAX_REGS or dst >= MAX_REGS:
+                self._fault()
+                break
+            cls = op & 0x07
+
+            if cls == OPC_ALU or cls == OPC_ALU64:
+                v = regs[src] if op & EBPF_SRC_REG else imm
+                alu = _ALU.get(op, None)
+                if alu is not None:
+                    regs[dst] = alu(regs[dst], v)
+                    self._tick(self.STATE_DECODE,
+                        self.mul_cycles if op in _MUL else 1)
+                elif op in _SHIFT:
+                    if cls == OPC_ALU:
+                        v &= MASK32
+                    regs[dst] = _SHIFT[op](regs[dst], v)
+                    self._tick(self.STATE_DECODE, self.shift_cycles)
+                elif op in _DIV:
+                    is32, mod = _DIV[op]
+                    d = regs[dst]
+                    if is32:
+                        d &= MASK32
+                        v &= MASK32
+                    self._tick(self.STATE_DECODE, 1)
+                    self.state = self.STATE_DIV_PENDING
+                    if v == 0:
+                        # Division by zero clears dst, modulo keeps it.
+                        if not mod:
+                            regs[dst] = 0
+                        self._fail(self.STATE_DIV_PENDING, DIV_ERROR_CYCLES)
+                        break
+                    self._tick(self.STATE_DIV_PENDING,
+                        div_cycles(d, self.divider_radix))
+                    regs[dst] = d % v if mod else d // v
+                    self.state = self.STATE_DECODE
+                    self._tick(self.STATE_DECODE, 1)
+                elif op == EBPF_OP_LE or op == EBPF_OP_BE:
+                    if imm not in (16, 32, 64):
+                        self._fail(self.STATE_DECODE)
+                        break
+                    size = imm // 8
+                    b = (regs[dst] & ((1 << imm) - 1)).to_bytes(size, "little")
+                    if op == EBPF_OP_BE:
+                        b = b[::-1]
+                    regs[dst] = int.from_bytes(b, "little")
+                    self._tick(self.STATE_DECODE, 1)
+                else:
+                    self._fail(self.STATE_DECODE)
+                    break
+                ip += 1
+
+            elif cls == OPC_JMP:
+                if op == EBPF_OP_EXIT:
+                    self._tick(self.STATE_DECODE, 1)
+                    self.halt = 1
+                    break
+                elif op == EBPF_OP_JA:
+                    ip += offset_s
+                elif op == EBPF_OP_CALL:
+                    self._tick(self.STATE_DECODE, 1)
+                    if not self._call(imm):
+                        break
+                    ip += 1
+                    continue
+                elif op in _JMP:
+                    v = regs[src] if op & EBPF_SRC_REG else imm
+                    if _JMP[op](regs[dst], v):
+                        ip += offset_s
+                else:
+                    self._fail(self.STATE_DECODE)
+                    break
+                # The instruction at the jump target is fetched while
+                # decoding the jump.
+                ip = (ip + 1) & MASK32
+                self._tick(self.STATE_DECODE, 1)
+
+            elif cls == OPC_LDX:
+                # The access is done for all LDX opcodes, unknown ones
+                # fail when the data arrives.
+                self._tick(self.STATE_DECODE, 1)
+                self.state = self.STATE_DATA_FETCH
+                self._tick(self.STATE_DATA_FETCH, self.data_read_cycles)
+                self.state = self.STATE_DECODE
+                size = _LDX.get(op, None)
+                if size is None:
+                    self._fail(self.STATE_DECODE)
+                    break
+                regs[dst] = self._read((regs[src] + offset) & self.data_mask,
+                    size)
+                self._tick(self.STATE_DECODE, 1)
+                ip += 1
+
+            elif cls == OPC_ST or cls == OPC_STX:
+                if cls == OPC_ST:
+                    size = _ST.get(op, None)
+                    v = imm
+                else:
+                    size = _STX.get(op, None)
+                    v = regs[src]
+                if size is None:
+                    self._fail(self.STATE_DECODE)
+                    break
+                self._write((regs[dst] + offset) & self.data_mask, size, v)
+                self._tick(self.STATE_DECODE, 1)
+                self.state = self.STATE_DATA_FETCH
+                self._tick(self.STATE_DATA_FETCH, self.data_write_cycles[size])
+                self.state = self.STATE_DECODE
+                self._tick(self.STATE_DECODE, 1)
+                ip += 1
+
+            elif op == EBPF_OP_LDDW:
+                regs[dst] = imm
+                self._tick(self.STATE_DECODE, 1)
+                ip += 1
+                self.ip = ip
+                # Second half is decoded with the kept opcode, its
+                # opcode bits must not overlap.
+                op2, _, _, _, _, imm2 = self.insn(ip)
+                if op2 & EBPF_OP_LDDW:
+                    self._fault()
+                    break
+                regs[dst] |= imm2 << 32
+                self._tick(self.STATE_DECODE, 1)
+                ip += 1
+
+            else:
+                self._fail(self.STATE_DECODE)
+                break
+
+        if self.halt:
+            self.state = self.STATE_HALT
+        return regs[0]
+
+
+    # Process call to helper function func. Returns False if the CPU
+    # halted.
+    def _call(self, func):
+        if self.call_handler is None:
+            self._fault()
+            return False
+
+        latency = self.call_latency
+        if isinstance(latency, dict):
+            latency = latency.get(func, CALL_LATENCY)
+        if callable(latency):
+            latency = latency(*self.regs[1:6])
+        self.state = self.STATE_CALL_PENDING
+        self._tick(self.STATE_CALL_PENDING, latency + 1)
+
+        helper = self.call_handler.get(func, None)
+        if helper is None:
+            self._fault()
+            return False
+        ret = helper(*self.regs[1:6])
+        if ret is not None:
+            self.call_ret = ret & MASK64
+        self.regs[0] = self.call_ret
+        return True
+
+
+    # Run the program once per packet as the net boards do: packet is
+    # copied to data memory (remaining bytes are kept), r1 holds its
+    # length. args (a list or a callable returning the list for a
+    # packet) overrides r1 - r5. Yields (r0, error, ticks).
+    def run_batch(self, packets, args=None, max_ticks=None):
+        for packet in packets:
+            if len(packet) > len(self.data):
+                raise Exception("Packet ({} bytes) larger than data memory "
+                    "({} bytes)".format(len(packet), len(self.data)))
+            self.data[:len(packet)] = packet
+            values = args(packet) if callable(args) else args
+            if values is None:
+                values = [len(packet)]
+            self.reset(*values)
+            r0 = self.run(max_ticks=max_ticks)
+            yield (r0, self.error, self.ticks)
@@ -0,0 +1,215 @@
+import sys
+sys.path.insert(0, '..')
+
+from migen import *
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+from fpga.cpu import *
+
+
+# Received frames, one byte per beat, 'last' marks the end of a frame.
+def frame_description():
+    return stream.EndpointDescription([("data", 8)])
+
+
+# Result of a program run per frame.
+def verdict_description():
+    return stream.EndpointDescription([
+        ("r0", 64),
+        ("error", 1),
+        ("ticks", 64),
+    ])
+
+
+# Packet engine with a number of hBPF CPUs (cores) running the same program.
+# Frames from 'sink' are assigned round-robin to the cores and copied into a
+# data memory bank of the core. A core is started with the frame length in
+# R1 as soon as it is idle and a frame is complete. With banks > 1 (byte-lane
+# data memory only) a core receives the next frames into its other banks
+# while processing the current one (ping-pong for 2 banks). Ingress only
+# stalls if the next core has no free bank, so up to 'cores' frames are
+# processed in parallel and up to 'cores * banks' are buffered. Verdicts
+# (R0, error, ticks) are provided on 'source' in the order the frames were
+# received, a core becomes idle and frees its bank when its verdict was
+# taken.
+# With data_width > 8 received bytes are collected into words of data_width
+# bits which are written to data memory with a single access (one cycle
+# for byte-lane data memory).
+# Each core has its own program memory (asynchronous read memory with two
+# read ports, a shared one would need two ports per core anyway) and its own
+# data memory. call_handler is a callable returning a call handler module
+# for a core (e.g. a class) or None. Further arguments (e.g.
+# multiplier_stages) are passed to the CPUs.
+# CSRs and memories of the cores are not collected with the ones of the
+# engine, a core with CSR access to its program and (byte-lane) data
+# memories needs up to 18 of the 32 CSR locations of a SoC. A SoC exposes
+# a core by adding it under its own name (e.g. core 0 as 'hbpf').
+class PacketEngine(Module, AutoCSR):
+
+    def __init__(self, pgm_init=None, max_pgm_words=CPU.MAX_PGM_WORDS,
+            data_init=None, max_data_words=CPU.MAX_DATA_WORDS, cores=2,
+            banks=1, data_width=8, call_handler=None, data_byte_lanes=False,
+            debug=False, **kwargs):
+
+        assert data_width in [8, 16, 32, 64], \
+            "Data width must be 8, 16, 32 or 64 bits"
+
+        self.sink = sink = stream.Endpoint(frame_description())
+        self.source = source = stream.Endpoint(verdict_description())
+
+        # Frames processed and frames with error.
+        self.csr_packets = csr_packets = CSRStatus(32)
+        self.csr_errors = csr_errors = CSRStatus(32)
+
+        self.cores = []
+        for i in range(cores):
+            cpu = CPU(pgm_init=pgm_init, max_pgm_words=max_pgm_words,
+                    data_init=data_init, max_data_words=max_data_words,
+                    debug=debug,
+                    call_handler=call_handler() if call_handler else None,
+                    data_byte_lanes=data_byte_lanes, data_banks=banks,
+                    **kwargs)
+            setattr(self.submodules, "core{}".format(i), cpu)
+            self.cores.append(cpu)
+        self.autocsr_exclude = {"core{}".format(i) for i in range(cores)}
+
+        # # #
+
+        # Received words and number of valid bytes per word.
+        if data_width > 8:
+            self.submodules.converter = converter = stream.Converter(8,
+                data_width, report_valid_token_count=True)
+            self.comb += sink.connect(converter.sink)
+            rx = converter.source
+            count = converter.source.valid_token_count
+        else:
+            rx = sink
+            count = 1
+
+        # Core receiving the next frame and core delivering the next verdict.
+        wr = Signal(max=max(cores, 2))
+        rd = Signal(max=max(cores, 2))
+        adr = Signal(max=max_data_words)
+        last = Signal()
+        packets = Signal(32)
+        errors = Signal(32)
+
+        # Core got a frame and its verdict was not taken yet.
+        busy = Array(Signal() for i in range(cores))
+
+        def next_index(index, n):
+            return If(index == n - 1,
+                index.eq(0)
+            ).Else(
+                index.eq(index + 1)
+            )
+
+        for i, cpu in enumerate(self.cores):
+            # Per core: banks holding a frame (including the one processed),
+            # bank receiving the next frame, bank processed next and
+            # frame length per bank.
+            used = Signal(max=banks + 1)
+            fill = Signal(max=max(banks, 2))
+            head = Signal(max=max(banks, 2))
+            length = Array(Signal(64) for k in range(banks))
+
+            if banks > 1:
+                port = cpu.data.rx
+                self.comb += [
+                    cpu.data.rx_bank.eq(fill),
+                    cpu.data.bank.eq(head),
+                ]
+            else:
+                # Single bank is written while core is idle.
+                port = cpu.data
+
+            done = Signal()
+            taken = Signal()
+            self.comb += [
+                done.eq(port.ack & last),
+                taken.eq((rd == i) & source.valid & source.ready),
+            ]
+
+            # Dispatch, copy received frame into the data memory
+            # of the current core (see arty-a7-100-net for a single core).
+            self.sync += [
+                If((wr == i) & (used < banks),
+                    If(~port.stb,
+                        rx.ready.eq(1),
+                        If(rx.valid & rx.ready,
+                            port.adr.eq(adr),
+                            port.ww.eq(count),
+                            port.dat_w.eq(rx.data),
+                            port.we.eq(1),
+                            port.stb.eq(1),
+                            rx.ready.eq(0),
+
+                            # Length of received frame is provided in R1.
+                            If(rx.last,
+                                last.eq(1),
+                                length[fill].eq(adr + count),
+                            )
+                        )
+                    ).Else(
+                        If(port.ack,
+                            port.stb.eq(0),
+                            port.we.eq(0),
+                            If(last,
+                                # Frame complete, continue with next core.
+                                last.eq(0),
+                                adr.eq(0),
+                                next_index(fill, banks),
+                                next_index(wr, cores)
+                            ).Else(
+                                adr.eq(adr + data_width // 8),
+                                rx.ready.eq(1),
+                            )
+                        )
+                    )
+                ),
+
+                # Start idle core with the next frame, R1 is taken over
+                # while the core is in reset.
+                If(~busy[i] & (used > 0),
+                    busy[i].eq(1),
+                    cpu.csr_r1.storage.eq(length[head]),
+                ),
+                If(busy[i] & ~cpu.reset_n,
+                    cpu.reset_n.eq(1),
+                ),
+
+                # Verdict taken, free bank.
+                If(taken,
+                    busy[i].eq(0),
+                    cpu.reset_n.eq(0),
+                    cpu.csr_r1.storage.eq(0),
+                    next_index(head, banks),
+                ),
+
+                If((wr == i) & done & ~taken,
+                    used.eq(used + 1)
+                ).Elif(~((wr == i) & done) & taken,
+                    used.eq(used - 1)
+                ),
+            ]
+
+        # Collect verdicts in order of the frames.
+        halt = Array(cpu.halt for cpu in self.cores)
+        self.comb += [
+            source.valid.eq(busy[rd] & halt[rd]),
+            source.r0.eq(Array(cpu.r0 for cpu in self.cores)[rd]),
+            source.error.eq(Array(cpu.error for cpu in self.cores)[rd]),
+            source.ticks.eq(Array(cpu.ticks for cpu in self.cores)[rd]),
+            csr_packets.status.eq(packets),
+            csr_errors.status.eq(errors),
+        ]
+
+        self.sync += [
+            If(source.valid & source.ready,
+                packets.eq(packets + 1),
+                If(source.error,
+                    errors.eq(errors + 1)
+                ),
+                next_index(rd, cores)
+            )
+        ]
@@ -0,0 +1,139 @@
+import sys
+sys.path.insert(0, '..')
+
+from operator import and_, xor
+from migen import *
+
+
+# Hash map for call handlers, similar to a BPF hash map, with 64 bit keys
+# and values. Entries are stored in 'buckets' buckets of 'ways' entries
+# each. A bucket is a single row of a block RAM, all entries of a bucket
+# are read at once and compared in parallel. So each operation takes the
+# same number of cycles, independent of the number of entries.
+# The bucket of a key is selected by XOR folding the key into the bucket
+# index. An update fails if the key is not yet in the map and all entries
+# of its bucket are in use.
+# See emulator/ebpf/hash_map.py for the same map in Python.
+class HashMap(Module):
+
+    OP_LOOKUP = 0
+    OP_UPDATE = 1
+    OP_DELETE = 2
+
+    def __init__(self, buckets=256, ways=4):
+
+        assert buckets >= 2 and buckets & (buckets - 1) == 0, \
+            "Number of buckets must be a power of 2"
+
+        self.buckets = buckets
+        self.ways = ways
+
+        # Operation, key and value. Inputs must be stable while stb is set.
+        # Lookup returns the value of key or 'value' if key is not found.
+        # Update returns 0 or 1 if bucket is full.
+        # Delete returns 0 or 1 if key is not found.
+        self.op = op = Signal(2)
+        self.key = key = Signal(64)
+        self.value = value = Signal(64)
+        self.ret = ret = Signal(64)
+        self.stb = stb = Signal()
+        self.ack = ack = Signal()
+
+        # # #
+
+        # Entry layout: value, key, valid.
+        entry_width = 64 + 64 + 1
+        self.specials.mem = mem = Memory(entry_width * ways, buckets)
+        self.specials.port = port = mem.get_port(has_re=False,
+            write_capable=True)
+
+        # Bucket is read in the first cycle, compared and written
+        # in the second.
+        compare = Signal()
+
+        index_bits = log2_int(buckets)
+        index = Signal(index_bits)
+        self.comb += index.eq(reduce(xor, [key[i:i + index_bits]
+            for i in range(0, 64, index_bits)]))
+
+        valid = []
+        keys = []
+        values = []
+        match = []
+        free = []
+        for w in range(ways):
+            entry = port.dat_r[w * entry_width:(w + 1) * entry_width]
+            valid.append(entry[128])
+            keys.append(entry[64:128])
+            values.append(entry[0:64])
+            match.append(Signal())
+            free.append(Signal())
+            self.comb += [
+                match[w].eq(valid[w] & (keys[w] == key)),
+                # First entry not in use.
+                free[w].eq(~valid[w] & reduce(and_, valid[:w], 1)),
+            ]
+
+        hit = Signal()
+        full = Signal()
+        self.comb += [
+            hit.eq(reduce(or_, match)),
+            full.eq(reduce(and_, valid)),
+            port.adr.eq(index),
+            ack.eq(stb & compare),
+        ]
+
+        # New bucket contents.
+        new_entries = []
+        for w in range(ways):
+            entry = Signal(entry_width)
+            self.comb += [
+                entry.eq(Cat(values[w], keys[w], valid[w])),
+                Case(op, {
+                    self.OP_UPDATE: [
+                        If(match[w] | (~hit & free[w]),
+                            entry.eq(Cat(value, key, 1))
+                        )
+                    ],
+                    self.OP_DELETE: [
+                        If(match[w],
+                            entry[128].eq(0)
+                        )
+                    ],
+                    "default": []
+                })
+            ]
+            new_entries.append(entry)
+
+        self.comb += [
+            port.dat_w.eq(Cat(*new_entries)),
+
+            Case(op, {
+                self.OP_LOOKUP: [
+                    If(hit,
+                        ret.eq(reduce(or_, [Mux(match[w], values[w], 0)
+                            for w in range(ways)]))
+                    ).Else(
+                        ret.eq(value)
+                    )
+                ],
+                self.OP_UPDATE: [
+                    port.we.eq(ack & (hit | ~full)),
+                    ret.eq((hit == 0) & full)
+                ],
+                self.OP_DELETE: [
+                    port.we.eq(ack & hit),
+                    ret.eq(hit == 0)
+                ],
+                "default": []
+            })
+        ]
+
+        self.sync += [
+            If(stb & ~compare,
+                compare.eq(1)
+            ).Else(
+                compare.eq(0)
+            )
+        ]
+
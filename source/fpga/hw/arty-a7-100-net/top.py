@@ -13,6 +13,7 @@ from liteeth.phy.mii import LiteEthPHYMII
 from liteeth.mac import LiteEthMACCore
 
 from fpga.cpu import *
+from fpga.engine import *
 from call_handler import *
 import ubpf.assembler
 import tools.testdata
@@ -68,7 +69,7 @@ class _CRG(Module):
 
 class Top(SoCMini):
 
-    def __init__(self, platform, sys_clk_freq=int(100e6), **kwargs):
+    def __init__(self, platform, sys_clk_freq=int(100e6), cores=4, **kwargs):
 
         self.platform = platform
 
@@ -115,33 +116,72 @@ class Top(SoCMini):
 
         #----------
 
-        call_handler = CallHandler()
-        self.submodules.hbpf = CPU(pgm_init=pgm_mem_data, max_pgm_words=1024,
+        # Packet engine with 'cores' CPUs running the same program, each
+        # with its own byte-lane data memory (loads and stores take 4
+        # instead of 14 - 23 cycles). Received packets are dispatched
+        # round-robin to the cores, each core receives the next packet
+        # into a second data memory bank while processing one, so
+        # reception only stalls if all banks are in use. Received bytes
+        # are collected into 64 bit words, each written to packet memory
+        # in a single cycle.
+        self.submodules.engine = PacketEngine(pgm_init=pgm_mem_data,
+                                    max_pgm_words=1024,
                                     data_init=data_mem_data, max_data_words=2048,
-                                    debug=True, call_handler=call_handler)
+                                    cores=cores, banks=2, data_width=64,
+                                    call_handler=CallHandler,
+                                    data_byte_lanes=True, debug=True)
+        # The first CPU keeps the CSR names of the single CPU, used by the
+        # debug scripts. Data memory is accessed by byte-lane (8 memories
+        # per bank).
+        self.hbpf = self.engine.cores[0]
         self.add_csr("hbpf")
+        self.csr.add("hbpf_pgm_mem", use_loc_if_exists=True)
+        for bank in range(2):
+            for lane in range(RAMLanes.LANES):
+                self.csr.add("hbpf_data_bank{}_lane{}".format(bank, lane),
+                    use_loc_if_exists=True)
+        self.add_csr("engine")
+        call_handlers = [cpu.call_handler for cpu in self.engine.cores]
+        running = Signal()
+        verdict_error = Signal()
+
+        self.comb += [
+            # Verdicts are only shown by LEDs, nothing downstream can
+            # stall the engine. So the verdict stream has no backpressure,
+            # each verdict is dropped as soon as it is valid (the engine
+            # counts packets and errors) and its core takes the next
+            # packet.
+            self.engine.source.ready.eq(1),
+            running.eq(reduce(or_,
+                [cpu.reset_n & ~cpu.halt for cpu in self.engine.cores])),
+        ]
 
         counter = Signal(26)
         processing_led_delay = Signal(26)
         self.sync += [
-            # green, CPU halt LED
-            leds[0].eq(self.hbpf.halt),
+            If(self.engine.source.valid,
+                verdict_error.eq(self.engine.source.error)
+            ),
+
+            # green, all cores idle LED
+            leds[0].eq(~running),
 
-            # red, CPU error LED
-            rgb_led1_pads.r.eq(self.hbpf.error),
+            # red, CPU error LED (last packet)
+            rgb_led1_pads.r.eq(verdict_error),
 
-            If(~self.hbpf.error,
+            If(~verdict_error,
                 # green, packet class 1 (e.g. IPv4) LED
-                leds[1].eq(call_handler.IP4_led),
+                leds[1].eq(reduce(or_, [c.IP4_led for c in call_handlers])),
 
                 # green, packet class 2 (e.g. IPv6) LED
-                leds[2].eq(call_handler.IPv6_led),
+                leds[2].eq(reduce(or_, [c.IPv6_led for c in call_handlers])),
 
                 # red, packet error LED
-                rgb_led2_pads.r.eq(call_handler.pkt_err_led),
+                rgb_led2_pads.r.eq(reduce(or_,
+                    [c.pkt_err_led for c in call_handlers])),
 
                 # blue, packet processing LED
-                If(self.hbpf.reset_n & ~self.hbpf.halt,
+                If(running,
                     processing_led_delay.eq(0x300_000)
                 ),
                 If(processing_led_delay > 0,
@@ -173,57 +213,16 @@ class Top(SoCMini):
 
         dw = 8
 
-        # Add a LiteEthMACCore as source ...
+        # Add a LiteEthMACCore as source of received packets for the
+        # packet engine.
         self.submodules.ethmac = LiteEthMACCore(self.ethphy, dw, with_preamble_crc=True)
         self.add_csr("ethmac")
 
-        # ... and define a sink which transfers
-        # received packets from MAC into hBPF packet memory.
-        self.sink = stream.Endpoint(eth_phy_description(dw))
-        self.comb += self.ethmac.source.connect(self.sink)
-        last = Signal()
-
-        self.sync += [
-            If(self.hbpf.halt | ~self.hbpf.reset_n,
-                If(self.hbpf.halt,
-                    # hBPF finished processing of packet
-                    # reset for next packet
-                    self.hbpf.data.adr.eq(0),
-                    self.hbpf.csr_r1.storage.eq(0)
-                ),
-                self.hbpf.reset_n.eq(0),
-
-                If(~self.hbpf.data.stb,
-                    self.sink.ready.eq(1),
-                    If(self.sink.valid,
-                        self.hbpf.data.ww.eq(1),
-                        self.hbpf.data.dat_w.eq(self.sink.data),
-                        self.hbpf.data.we.eq(1),
-                        self.hbpf.data.stb.eq(1),
-                        self.sink.ready.eq(0),
-
-                        # Place length of received packet into hBPF CPU register R1
-                        If(self.sink.last,
-                            last.eq(1),
-                            self.hbpf.csr_r1.storage.eq(self.hbpf.data.adr + 1),
-                        )
-                    )
-                ).Else(
-                    If(self.hbpf.data.ack,
-                        self.hbpf.data.stb.eq(0),
-                        If(last & ~self.sink.last,
-                            last.eq(0),
-                            # Packet fully received, start hBPF,
-                            # length of captured packet is provided to CPU in R1
-                            self.hbpf.data.adr.eq(0),
-                            self.hbpf.reset_n.eq(1),
-                        ).Else(
-                            self.hbpf.data.adr.eq(self.hbpf.data.adr + 1),
-                            self.sink.ready.eq(1),
-                        )
-                    )
-                )
-            )
+        self.comb += [
+            self.engine.sink.valid.eq(self.ethmac.source.valid),
+            self.engine.sink.last.eq(self.ethmac.source.last),
+            self.engine.sink.data.eq(self.ethmac.source.data),
+            self.ethmac.source.ready.eq(self.engine.sink.ready),
         ]
 
         # LiteScope ------------------------------------------------------------
@@ -247,13 +246,15 @@ class Top(SoCMini):
             # MAC to hBPF packet memory signals
             self.ethmac.source,
             self.ethmac.sink,
-            self.sink,
-            self.hbpf.data.stb,
-            self.hbpf.data.ack,
-            self.hbpf.data.dat_w,
-            self.hbpf.data.ww,
-            self.hbpf.data.we,
-            self.hbpf.data.adr,
+            self.engine.sink,
+            self.engine.source,
+            self.hbpf.data.rx_bank,
+            self.hbpf.data.rx.stb,
+            self.hbpf.data.rx.ack,
+            self.hbpf.data.rx.dat_w,
+            self.hbpf.data.rx.ww,
+            self.hbpf.data.rx.we,
+            self.hbpf.data.rx.adr,
         ]
         self.submodules.analyzer = LiteScopeAnalyzer(analyzer_signals,
             depth        = 2048,
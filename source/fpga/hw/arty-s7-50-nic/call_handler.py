@@ -2,12 +2,17 @@ import sys
 sys.path.insert(0, '..')
 
 from migen import *
+from fpga.hash_map import HashMap
+from fpga.checksum import Checksum
 
 
-# This call handler provides three extensions to a hBPF CPU via the `call`
+# This call handler provides extensions to a hBPF CPU via the `call`
 # opcode. The function is selected via hBPF register R1.
-# It provides functions to read and write up to 5 64-bit values and a function
-# to set some LEDs.
+# It provides functions to read and write up to 5 64-bit values, a function
+# to set some LEDs, lookup, update and delete functions of a hash map (see
+# fpga/hash_map.py, emulator/ebpf/hash_map.py provides the same functions
+# for the emulator) and Internet checksum and CRC32 functions over a range
+# of data memory (see fpga/checksum.py and emulator/ebpf/checksum.py).
 class CallHandler(Module):
 
     def __init__(self):
@@ -33,6 +38,30 @@ class CallHandler(Module):
         self.specials.port = port = mem.get_port(has_re=False, write_capable=True)
         self.wait = wait = Signal()
 
+        # Hash map for e.g. per flow state, key in R1, value in R2
+        self.submodules.hash_map = hash_map = HashMap()
+        self.comb += [
+            hash_map.key.eq(r1),
+            hash_map.value.eq(r2),
+            Case(func, {
+                0xff000004: [hash_map.op.eq(HashMap.OP_LOOKUP)],
+                0xff000005: [hash_map.op.eq(HashMap.OP_UPDATE)],
+                0xff000006: [hash_map.op.eq(HashMap.OP_DELETE)],
+                "default": []
+            }),
+            hash_map.stb.eq(stb & (func >= 0xff000004) & (func <= 0xff000006))
+        ]
+
+        # Checksums, offset in R1, length in R2, initial value in R3
+        self.submodules.checksum = checksum = Checksum()
+        self.comb += [
+            checksum.offset.eq(r1),
+            checksum.length.eq(r2),
+            checksum.init.eq(r3),
+            checksum.op.eq(func == 0xff000008),
+            checksum.stb.eq(stb & ((func == 0xff000007) | (func == 0xff000008)))
+        ]
+
         self.sync += [
             ack.eq(0),
             err.eq(0),
@@ -78,6 +107,43 @@ class CallHandler(Module):
                         )
                     ],
 
+                    # Hash map lookup (R2 = value if key not found), update
+                    # (returns 1 if bucket full) and delete (returns 1 if key
+                    # not found)
+                    0xff000004: [
+                        If(hash_map.ack,
+                            ret.eq(hash_map.ret),
+                            ack.eq(1)
+                        )
+                    ],
+                    0xff000005: [
+                        If(hash_map.ack,
+                            ret.eq(hash_map.ret),
+                            ack.eq(1)
+                        )
+                    ],
+                    0xff000006: [
+                        If(hash_map.ack,
+                            ret.eq(hash_map.ret),
+                            ack.eq(1)
+                        )
+                    ],
+
+                    # Internet checksum (returns 0 if range includes a
+                    # correct checksum) and CRC32 of a data memory range
+                    0xff000007: [
+                        If(checksum.ack,
+                            ret.eq(checksum.ret),
+                            ack.eq(1)
+                        )
+                    ],
+                    0xff000008: [
+                        If(checksum.ack,
+                            ret.eq(checksum.ret),
+                            ack.eq(1)
+                        )
+                    ],
+
                     "default": [
                         err.eq(1),
                         ack.eq(1)
@@ -85,3 +151,8 @@ class CallHandler(Module):
                 })
             )
         ]
+
+
+    # Called by the CPU with its data memory.
+    def connect_data(self, data):
+        self.checksum.connect_data(data)
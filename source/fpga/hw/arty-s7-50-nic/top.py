@@ -12,6 +12,7 @@ from liteeth.phy.rmii import LiteEthPHYRMII
 from liteeth.mac import LiteEthMACCore
 
 from fpga.cpu import *
+from fpga.engine import *
 from call_handler import *
 import ubpf.assembler
 import tools.testdata
@@ -104,16 +105,36 @@ class Top(SoCMini):
         half_words = len(code) // 4
         pgm_mem_data = list(struct.unpack('>{}L'.format(half_words), code))
 
-        # Add a custom call handler to extend the CPU
-        call_handler = CallHandler()
-
-        # Instantiate the CPU
-        self.submodules.hbpf = CPU(pgm_init=pgm_mem_data, max_pgm_words=1024,
+        # Instantiate a packet engine with one CPU, extended by a custom
+        # call handler. The CPU has two byte-lane packet memory banks, the
+        # next packet is received into one bank while the CPU processes
+        # the previous one in the other bank.
+        self.submodules.engine = PacketEngine(pgm_init=pgm_mem_data,
+                                    max_pgm_words=1024,
                                     data_init=None, max_data_words=2048,
-                                    debug=True, call_handler=call_handler)
+                                    cores=1, banks=2,
+                                    call_handler=CallHandler,
+                                    data_byte_lanes=True, debug=True)
+        # The CPU keeps its CSR names, used by the debug scripts. Data
+        # memory is accessed by byte-lane (8 memories per bank).
+        self.hbpf = self.engine.cores[0]
         self.add_csr("hbpf")
         self.csr.add("hbpf_pgm_mem", use_loc_if_exists=True)
-        self.csr.add("hbpf_data_mem", use_loc_if_exists=True)
+        for bank in range(2):
+            for lane in range(RAMLanes.LANES):
+                self.csr.add("hbpf_data_bank{}_lane{}".format(bank, lane),
+                    use_loc_if_exists=True)
+        self.add_csr("engine")
+        call_handler = self.hbpf.call_handler
+
+        # Verdicts are dropped as soon as they are valid, a verdict with
+        # error included (the engine counts it). The error is kept until
+        # the next hard reset and shown by the CPU error LED.
+        verdict_error = Signal()
+        self.comb += self.engine.source.ready.eq(1)
+        self.sync += If(self.engine.source.valid & self.engine.source.error,
+            verdict_error.eq(1)
+        )
 
         # Connect CPU signals
         counter = Signal(26)
@@ -124,9 +145,9 @@ class Top(SoCMini):
             leds[0].eq(self.hbpf.halt),
 
             # red, CPU error LED
-            rgb_led1_pads.r.eq(self.hbpf.error),
+            rgb_led1_pads.r.eq(verdict_error),
 
-            If(~self.hbpf.error,
+            If(~verdict_error,
                 # green, packet class 1 (e.g. IPv4) LED
                 leds[1].eq(call_handler.IP4_led),
 
@@ -179,56 +200,12 @@ class Top(SoCMini):
         self.submodules.ethmac = LiteEthMACCore(self.ethphy, dw, with_preamble_crc=True)
         self.add_csr("ethmac")
 
-        # ... and define a sink which transfers
-        # received packets from MAC into hBPF packet memory.
-        self.sink = stream.Endpoint(eth_phy_description(dw))
-        self.comb += self.ethmac.source.connect(self.sink)
-        last = Signal()
-
-        self.sync += [
-            # Stop everything on hBPF CPU error - needs hard reset
-            If(~self.hbpf.error,
-                If(self.hbpf.halt | ~self.hbpf.reset_n,
-                    If(self.hbpf.halt,
-                        # hBPF finished processing of packet
-                        # reset for next packet
-                        self.hbpf.data.adr.eq(0),
-                        self.hbpf.csr_r1.storage.eq(0)
-                    ),
-                    self.hbpf.reset_n.eq(0),
-
-                    If(~self.hbpf.data.stb,
-                        self.sink.ready.eq(1),
-                        If(self.sink.valid,
-                            self.hbpf.data.ww.eq(1),
-                            self.hbpf.data.dat_w.eq(self.sink.data),
-                            self.hbpf.data.we.eq(1),
-                            self.hbpf.data.stb.eq(1),
-                            self.sink.ready.eq(0),
-
-                            # Place length of received packet into hBPF CPU register R1
-                            If(self.sink.last,
-                                last.eq(1),
-                                self.hbpf.csr_r1.storage.eq(self.hbpf.data.adr + 1),
-                            )
-                        )
-                    ).Else(
-                        If(self.hbpf.data.ack,
-                            self.hbpf.data.stb.eq(0),
-                            If(last & ~self.sink.last,
-                                last.eq(0),
-                                # Packet fully received, start hBPF,
-                                # length of captured packet is provided to CPU in R1
-                                self.hbpf.data.adr.eq(0),
-                                self.hbpf.reset_n.eq(1),
-                            ).Else(
-                                self.hbpf.data.adr.eq(self.hbpf.data.adr + 1),
-                                self.sink.ready.eq(1),
-                            )
-                        )
-                    )
-                )
-            )
+        # ... which transfers received packets into the hBPF packet memory.
+        self.comb += [
+            self.engine.sink.valid.eq(self.ethmac.source.valid),
+            self.engine.sink.last.eq(self.ethmac.source.last),
+            self.engine.sink.data.eq(self.ethmac.source.data),
+            self.ethmac.source.ready.eq(self.engine.sink.ready),
         ]
 
         # LiteScope ------------------------------------------------------------
@@ -244,13 +221,15 @@ class Top(SoCMini):
             # MAC to hBPF packet memory signals
             self.ethmac.source,
             self.ethmac.sink,
-            self.sink,
-            self.hbpf.data.stb,
-            self.hbpf.data.ack,
-            self.hbpf.data.dat_w,
-            self.hbpf.data.ww,
-            self.hbpf.data.we,
-            self.hbpf.data.adr,
+            self.engine.sink,
+            self.engine.source,
+            self.hbpf.data.rx_bank,
+            self.hbpf.data.rx.stb,
+            self.hbpf.data.rx.ack,
+            self.hbpf.data.rx.dat_w,
+            self.hbpf.data.rx.ww,
+            self.hbpf.data.rx.we,
+            self.hbpf.data.rx.adr,
         ]
         self.submodules.analyzer = LiteScopeAnalyzer(analyzer_signals,
             depth        = 4096,
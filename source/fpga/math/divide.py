@@ -3,15 +3,30 @@ import math
 from migen import *
 
 
+# Restoring divider computing log2(radix) quotient bits per cycle
+# (radix 2, 4 or 16). Higher radix chains more subtractors per cycle,
+# which costs area and fmax. With 'half' set on stb, dividend and divisor
+# are data_width / 2 bits wide (e.g. 32 bit ops on a 64 bit divider).
+# Leading zero bits of the dividend are skipped on load, so a division
+# takes one cycle per log2(radix) significant dividend bits after the
+# load (e.g. 11 cycles for 1500 / 8 with radix 2), data_width /
+# log2(radix) at most.
 class Divider(Module):
-    def __init__(self, data_width=32):
+    def __init__(self, data_width=32, radix=2):
         self.dw = dw = data_width
+        self.radix = radix
+
+        assert radix in [2, 4, 16], "Radix must be 2, 4 or 16"
+        bits = log2_int(radix)
+        assert (dw // 2) % bits == 0, \
+            "Half data width must be a multiple of log2(radix)"
 
         # Inputs
         self.reset_n = reset_n = Signal()
 
         self.dividend = dividend = Signal(dw)
         self.divisor = divisor = Signal(dw)
+        self.half = half = Signal()
         self.stb = stb = Signal()
 
         # Outputs
@@ -25,15 +40,46 @@ class Divider(Module):
         qr = Signal(2*dw)
         counter = Signal(max=dw+1)
         divisor_r = Signal(dw)
-        diff = Signal(dw+1)
+
+        # One restoring step per quotient bit.
+        steps = [qr]
+        for i in range(bits):
+            prev = steps[-1]
+            diff = Signal(dw+1)
+            step = Signal(2*dw)
+            self.comb += [
+                diff.eq(prev[dw-1:] - divisor_r),
+                If(diff[dw],
+                    step.eq(Cat(0, prev[:2 * dw - 1]))
+                ).Else(
+                    step.eq(Cat(1, prev[:dw-1], diff[:dw]))
+                )
+            ]
+            steps.append(step)
 
         self.comb += [
             quotient.eq(qr[:dw]),
             remainder.eq(qr[dw:]),
             ack.eq(counter == 0),
-            diff.eq(qr[dw-1:] - divisor_r)
         ]
 
+        # Dividend (lower half for half width operands) and its number of
+        # significant digits (log2(radix) bits each). Steps for leading
+        # zero digits would only shift in zeros, so the dividend starts
+        # shifted by them.
+        operand = Signal(dw)
+        digits = Signal(max=dw // bits + 1)
+        self.comb += [
+            If(half,
+                operand.eq(dividend[:dw // 2])
+            ).Else(
+                operand.eq(dividend)
+            ),
+            digits.eq(0)
+        ]
+        for i in range(dw):
+            self.comb += If(operand[i], digits.eq(i // bits + 1))
+
         self.sync += [
             If(~reset_n,
                 counter.eq(~0),
@@ -47,16 +93,17 @@ class Divider(Module):
                         qr.eq(0),
                         err.eq(1)
                     ).Else(
-                        counter.eq(dw),
-                        qr.eq(dividend),
-                        divisor_r.eq(divisor)
+                        counter.eq(digits),
+                        Case(digits, {d: qr.eq(operand << (dw - d * bits))
+                            for d in range(dw // bits + 1)}),
+                        If(half,
+                            divisor_r.eq(divisor[:dw // 2])
+                        ).Else(
+                            divisor_r.eq(divisor)
+                        )
                     )
                 ).Elif(~ack,
-                    If(diff[dw],
-                        qr.eq(Cat(0, qr[:2 * dw - 1]))
-                    ).Else(
-                        qr.eq(Cat(1, qr[:dw-1], diff[:dw]))
-                    ),
+                    qr.eq(steps[-1]),
                     counter.eq(counter - 1)
                 )
             )
@@ -70,7 +117,7 @@ class Divider(Module):
 p = 0
 f = 0
 
-def div_test(divider, dividend, divisor):
+def div_test(divider, dividend, divisor, half=False):
     global p, f
 
     expected_error = False
@@ -116,6 +163,7 @@ def div_test(divider, dividend, divisor):
 
     yield divider.dividend.eq(dividend)
     yield divider.divisor.eq(divisor)
+    yield divider.half.eq(half)
     yield divider.stb.eq(1)
     yield
 
@@ -190,6 +238,33 @@ def div_test32(divider):
     print("Divider Tests: %d Passed, %d Failed"%(p, f))
 
 
+def div_test64(divider):
+    global p, f
+
+    # Print a test header.
+    print("--- Divider 64, radix %d ---" % divider.radix)
+
+    yield from div_test(divider, 13, 2)
+    yield from div_test(divider, 1, 0)
+    yield from div_test(divider, 2**64 - 1, 3)
+    yield from div_test(divider, 0, 7)
+    yield from div_test(divider, 1500, 8)
+    yield from div_test(divider, 13, 2, half=True)
+    yield from div_test(divider, 1, 0, half=True)
+    yield from div_test(divider, 2**32 - 1, 2**32 - 1, half=True)
+    # some random tests
+    for i in range(10):
+        yield from div_test(divider,
+            random.randint(0, 2**64 - 1) >> random.randint(0, 63),
+            random.randint(0, 2**64 - 1) >> random.randint(0, 63))
+        yield from div_test(divider, random.randint(0, 2**32 - 1),
+            random.randint(0, 2**32 - 1) >> random.randint(0, 31), half=True)
+
+    # Done.
+    yield
+    print("Divider Tests: %d Passed, %d Failed"%(p, f))
+
+
 # 'main' method to run a basic testbench.
 if __name__ == "__main__":
     dut = Divider(data_width=8)
@@ -197,3 +272,7 @@ if __name__ == "__main__":
 
     dut = Divider(data_width=32)
     run_simulation(dut, div_test32(dut), vcd_name="divide.vcd")
+
+    for radix in [2, 4, 16]:
+        dut = Divider(data_width=64, radix=radix)
+        run_simulation(dut, div_test64(dut), vcd_name="divide.vcd")
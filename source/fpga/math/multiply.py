@@ -0,0 +1,157 @@
+import random
+from migen import *
+
+
+# Multiplier returning the lower data_width bits of a * b. The operands
+# are split into 16 bit parts, each partial product contributing to the
+# lower bits maps onto a single DSP slice (e.g. DSP48E1 25x18 bit), the
+# products are summed in an adder tree.
+# stages adds pipeline registers as the registers of a DSP slice do:
+#   1 - sum (P register),
+#   2 - partial products (M register) and sum,
+#   3 - operands (A/B registers), partial products and sum.
+# Operands are taken while 'stb' is set, 'ack' is set when 'out' holds
+# their product, 'latency' (= stages) cycles later. A new multiplication
+# can be started each cycle. With stages=0 the multiplier is purely
+# combinational and 'ack' follows 'stb'.
+class Multiplier(Module):
+
+    PART_WIDTH = 16
+
+    def __init__(self, data_width=64, stages=0):
+
+        assert data_width % self.PART_WIDTH == 0, \
+            "Data width must be a multiple of {}".format(self.PART_WIDTH)
+        assert stages <= 3, "Multiplier has up to 3 stages"
+
+        self.dw = dw = data_width
+        self.latency = stages
+
+        # Inputs
+        self.reset_n = reset_n = Signal()
+
+        self.a = a = Signal(dw)
+        self.b = b = Signal(dw)
+        self.stb = stb = Signal()
+
+        # Outputs
+        self.out = out = Signal(dw)
+        self.ack = ack = Signal()
+
+        # # #
+
+        # 'stb' passed through the stages along with the operands.
+        if stages > 0:
+            valid = Signal(stages)
+            self.sync += If(~reset_n,
+                valid.eq(0)
+            ).Else(
+                valid.eq(Cat(stb, valid[:-1]))
+            )
+            self.comb += ack.eq(valid[-1])
+        else:
+            self.comb += ack.eq(stb)
+
+        pw = self.PART_WIDTH
+        parts = dw // pw
+
+        def stage(registered, value, width):
+            s = Signal(width)
+            if registered:
+                self.sync += s.eq(value)
+            else:
+                self.comb += s.eq(value)
+            return s
+
+        a_r = stage(stages >= 3, a, dw)
+        b_r = stage(stages >= 3, b, dw)
+
+        # Partial products of parts i and j with i + j < parts, shifted to
+        # their position within the lower data_width bits.
+        products = []
+        for i in range(parts):
+            for j in range(parts - i):
+                product = stage(stages >= 2,
+                    a_r[i*pw:(i+1)*pw] * b_r[j*pw:(j+1)*pw], 2*pw)
+                products.append((product << ((i + j) * pw))[:dw])
+
+        # Adder tree.
+        while len(products) > 1:
+            products = [products[k] + products[k + 1]
+                if k + 1 < len(products) else products[k]
+                for k in range(0, len(products), 2)]
+
+        self.comb += out.eq(stage(stages >= 1, products[0][:dw], dw))
+
+
+#########################
+# Multiplier testbench: #
+#########################
+# Keep track of test pass / fail rates.
+p = 0
+f = 0
+
+def mul_test(multiplier, a, b):
+    global p, f
+
+    mask = 2**multiplier.dw - 1
+    expected = (a * b) & mask
+
+    yield multiplier.reset_n.eq(1)
+    yield multiplier.a.eq(a)
+    yield multiplier.b.eq(b)
+    yield multiplier.stb.eq(1)
+    yield
+
+    # Operands only need to be valid while 'stb' is set.
+    waited = 0
+    while not (yield multiplier.ack):
+        yield multiplier.stb.eq(0)
+        yield multiplier.a.eq(0)
+        yield multiplier.b.eq(0)
+        yield
+        waited += 1
+    yield multiplier.stb.eq(0)
+
+    actual = yield multiplier.out
+    if waited != multiplier.latency:
+        f += 1
+        print("\033[31mFAIL:\033[0m MUL ack after %d cycles (expected: %d)"
+            %(waited, multiplier.latency))
+    if expected != actual:
+        f += 1
+        print("\033[31mFAIL:\033[0m MUL( %016x, %016x ) = "
+            "%016x (got: %016x)"
+            %(a, b, expected, actual))
+    else:
+        p += 1
+        print("\033[32mPASS:\033[0m MUL( %016x, %016x ) = "
+            "%016x"
+            %(a, b, expected))
+
+
+def mul_test64(multiplier):
+    global p, f
+
+    # Print a test header.
+    print("--- Multiplier 64, %d stages ---" % multiplier.latency)
+
+    yield from mul_test(multiplier, 2, 3)
+    yield from mul_test(multiplier, 0, 0x123456789abcdef0)
+    yield from mul_test(multiplier, 0xffffffffffffffff, 0xffffffffffffffff)
+    yield from mul_test(multiplier, 0xffffffff, 0xffffffff)
+    # some random tests
+    for i in range(20):
+        yield from mul_test(multiplier, random.getrandbits(64),
+            random.getrandbits(64))
+
+    # Done.
+    yield
+    print("Multiplier Tests: %d Passed, %d Failed"%(p, f))
+
+
+# 'main' method to run a basic testbench.
+if __name__ == "__main__":
+    for stages in range(4):
+        dut = Multiplier(data_width=64, stages=stages)
+        run_simulation(dut, mul_test64(dut), vcd_name="multiply.vcd")
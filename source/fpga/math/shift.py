@@ -1,105 +1,123 @@
 from migen import *
 
 
+# Barrel shifter for logic left/right and arithmetic right shifts. The
+# log2(data_width) shift levels are split into 'stages' pipeline stages,
+# each followed by a register, so 'out' is valid 'latency' (= stages)
+# cycles after the inputs are set; inputs must be stable until then.
+# With stages=0 the shifter is purely combinational and shifts take a
+# single cycle, more stages shorten the path through the shifter for a
+# higher fmax.
 class Shifter(Module):
 
-    def __init__(self, data_width=64):
+    def __init__(self, data_width=64, stages=0):
+
+        levels = log2_int(data_width)
+        assert stages <= levels, "More stages than shift levels"
+
+        self.latency = stages
 
-        self.stb = stb = Signal()
         self.arith = arith = Signal()
         self.left = left = Signal()
         self.value = value = Signal(data_width)
         self.shift = shift = Signal(max=data_width)
         self.out = out = Signal(data_width)
-        self.ack = ack = Signal()
 
         # # #
 
-        state = Signal()
-        tmp1 = Signal(data_width)
-        tmp2 = Signal(data_width)
-
-        self.sync += [
-            If(ack,
-                ack.eq(0),
-                state.eq(0)
-            ).Elif(state,
-                If(~left & arith & value[data_width-1],
-                    out.eq(tmp1 | tmp2)
+        # Bits shifted in on arithmetic right shifts.
+        fill = Signal()
+        self.comb += fill.eq(arith & ~left & value[data_width-1])
+
+        # Level k shifts by 2**k, last level of each stage is registered.
+        x = value
+        for k in range(levels):
+            n = 2**k
+            y = Signal(data_width)
+            shifted = Signal(data_width)
+            self.comb += [
+                If(left,
+                    shifted.eq(Cat(Replicate(0, n), x[:data_width-n]))
                 ).Else(
-                    out.eq(tmp2)
-                ),
-                ack.eq(1)
-            ).Elif(stb,
-                If(~left,
-                    tmp1.eq(~(Replicate(1, data_width) >> shift)),
-                    tmp2.eq(value >> shift),
+                    shifted.eq(Cat(x[n:], Replicate(fill, n)))
+                )
+            ]
+            step = [
+                If(shift[k],
+                    y.eq(shifted)
                 ).Else(
-                    tmp2.eq(value << shift),
-                ),
-                state.eq(1)
-            )
-        ]
+                    y.eq(x)
+                )
+            ]
+            if stages and (k + 1) * stages // levels != k * stages // levels:
+                self.sync += step
+            else:
+                self.comb += step
+            x = y
+
+        self.comb += out.eq(x)
 
 
 ######################
-# Divider testbench: #
+# Shifter testbench: #
 ######################
 # Keep track of test pass / fail rates.
 p = 0
 f = 0
 
-def arsh_test(arsh, value, shift, expected):
+def shift_test(shifter, value, shift, expected, arith=1, left=0):
     global p, f
 
-    for i in range(5):
-        yield
-
-    yield arsh.value.eq(value)
-    yield arsh.shift.eq(shift)
-    yield arsh.stb.eq(1)
-    yield arsh.arith.eq(1)
-    yield arsh.left.eq(0)
-    yield
-
-    yield arsh.stb.eq(0)
+    yield shifter.value.eq(value)
+    yield shifter.shift.eq(shift)
+    yield shifter.arith.eq(arith)
+    yield shifter.left.eq(left)
     yield
 
-    c = 1
-    while (yield arsh.ack) == 0 and c < 100:
+    for i in range(shifter.latency):
         yield
-        c += 1
 
-    actual = yield arsh.out
+    actual = yield shifter.out
+    name = "LSH" if left else "ARSH" if arith else "RSH"
     if expected != actual:
         f += 1
-        print("\033[31mFAIL:\033[0m ARSH( %08d, %03d ) = "
-            "%08d (got: %08d)"
-            %(value, shift, expected, actual))
+        print("\033[31mFAIL:\033[0m %4s( %016x, %03d ) = "
+            "%016x (got: %016x)"
+            %(name, value, shift, expected, actual))
     else:
         p += 1
-        print("\033[32mPASS:\033[0m ARSH( %08d, %03d ) = "
-            "%08d"
-            %(value, shift, expected))
+        print("\033[32mPASS:\033[0m %4s( %016x, %03d ) = "
+            "%016x"
+            %(name, value, shift, expected))
 
 
-def arsh_test64(arsh):
+def shift_test64(shifter):
     global p, f
 
     # Print a test header.
-    print("--- Arithmetic Right Shift 32 ---")
-
-    yield from arsh_test(arsh, 0x1000, 1, 0x0800)
-    yield from arsh_test(arsh, 1, 1, 0)
-    yield from arsh_test(arsh, 0x8000000000000080, 4, 0xf800000000000008)
-    yield from arsh_test(arsh, 0x8000000000000000, 60, 0xfffffffffffffff8)
+    print("--- Shift 64, %d stages ---" % shifter.latency)
+
+    yield from shift_test(shifter, 0x1000, 1, 0x0800)
+    yield from shift_test(shifter, 1, 1, 0)
+    yield from shift_test(shifter, 0x8000000000000080, 4, 0xf800000000000008)
+    yield from shift_test(shifter, 0x8000000000000000, 60, 0xfffffffffffffff8)
+    yield from shift_test(shifter, 0x8000000000000080, 4, 0x0800000000000008,
+        arith=0)
+    yield from shift_test(shifter, 0x8000000000000080, 4, 0x0000000000000800,
+        arith=0, left=1)
+    yield from shift_test(shifter, 0x8000000000000080, 4, 0x0000000000000800,
+        arith=1, left=1)
+    yield from shift_test(shifter, 0x123456789abcdef0, 0, 0x123456789abcdef0)
+    yield from shift_test(shifter, 0xffffffffffffffff, 63, 0x8000000000000000,
+        arith=0, left=1)
 
     # Done.
     yield
-    print("ARSH Tests: %d Passed, %d Failed"%(p, f))
+    print("Shift Tests: %d Passed, %d Failed"%(p, f))
 
 
 # 'main' method to run a basic testbench.
 if __name__ == "__main__":
-    dut = Shifter(data_width=64)
-    run_simulation(dut, arsh_test64(dut), vcd_name="shift.vcd")
+    for stages in [0, 1, 2, 6]:
+        dut = Shifter(data_width=64, stages=stages)
+        run_simulation(dut, shift_test64(dut), vcd_name="shift.vcd")
@@ -0,0 +1,204 @@
+import sys
+sys.path.insert(0, '..')
+
+from migen import *
+from fpga.ram_lanes import *
+
+
+# Access signals of a RAM (see RAM and RAMLanes).
+class RAMPort:
+
+    def __init__(self, words):
+        self.stb = Signal()
+        self.ack = Signal()
+        self.adr = Signal(min=0, max=words)
+
+        self.dat_r = Signal(8)
+        self.dat_r2 = Signal(8*2)
+        self.dat_r4 = Signal(8*4)
+        self.dat_r8 = Signal(8*8)
+
+        self.we = Signal()
+        self.ww = Signal(4)
+        self.dat_w = Signal(8*8)
+
+
+class RAMBanks(Module):
+
+    def __init__(self, banks=2, max_words=None,
+                init=None, endianness="big", write_capable=False,
+                csr_access=False, debug=False):
+
+        # A number of byte-lane RAMs (banks) of the same size with two
+        # access ports. The RAM interface of this module (like RAM and
+        # RAMLanes) accesses bank 'bank' and is used by the CPU, port 'rx'
+        # accesses bank 'rx_bank' and is used to fill a bank with the
+        # next packet while the CPU processes another one. 'rx' has
+        # priority while its stb is set, both ports must not access the
+        # same bank at the same time.
+        # Byte-lane RAMs are used because their access signals are
+        # combinatorial (RAM also drives 'we' and 'dat_r'), so ports can
+        # be switched between banks without additional cycles.
+        self.write_capable = write_capable
+        self.csr_access = csr_access
+
+        self.banks = []
+        for i in range(banks):
+            ram = RAMLanes(max_words=max_words, init=init,
+                endianness=endianness, write_capable=write_capable,
+                csr_access=csr_access, debug=debug)
+            # Unique memory names for CSR access.
+            for k, lane in enumerate(ram.lanes):
+                lane.name_override = "bank{}_lane{}".format(i, k)
+            setattr(self.submodules, "bank{}".format(i), ram)
+            self.banks.append(ram)
+
+        self.words = self.banks[0].words
+
+        self.bank = Signal(max=max(banks, 2))
+        self.rx_bank = Signal(max=max(banks, 2))
+        self.rx = rx = RAMPort(self.words)
+
+        self.stb = Signal()
+        self.ack = Signal()
+        self.adr = Signal(min=0, max=self.words)
+
+        self.dat_r = Signal(8)
+        self.dat_r2 = Signal(8*2)
+        self.dat_r4 = Signal(8*4)
+        self.dat_r8 = Signal(8*8)
+
+        self.we = Signal()
+        self.ww = Signal(4)
+        self.dat_w = Signal(8*8)
+
+        # # #
+
+        if debug:
+            print("-"*50)
+            print("RAMBanks")
+            print("banks:                   {}".format(banks))
+
+        for i, ram in enumerate(self.banks):
+            self.comb += [
+                If(rx.stb & (self.rx_bank == i),
+                    ram.stb.eq(1),
+                    ram.adr.eq(rx.adr),
+                    ram.we.eq(rx.we),
+                    ram.ww.eq(rx.ww),
+                    ram.dat_w.eq(rx.dat_w),
+                ).Elif(self.bank == i,
+                    ram.stb.eq(self.stb),
+                    ram.adr.eq(self.adr),
+                    ram.we.eq(self.we),
+                    ram.ww.eq(self.ww),
+                    ram.dat_w.eq(self.dat_w),
+                )
+            ]
+
+        def select(index, name):
+            return Array(getattr(ram, name) for ram in self.banks)[index]
+
+        self.comb += [
+            self.ack.eq(select(self.bank, "ack") &
+                ~(rx.stb & (self.rx_bank == self.bank))),
+            rx.ack.eq(select(self.rx_bank, "ack") & rx.stb),
+        ]
+        for name in ["dat_r", "dat_r2", "dat_r4", "dat_r8"]:
+            self.comb += [
+                getattr(self, name).eq(select(self.bank, name)),
+                getattr(rx, name).eq(select(self.rx_bank, name)),
+            ]
+
+
+    def get_memories(self):
+        print("### RAM CSR access {} ###".format("enabled" if self.csr_access else "disabled"))
+        if self.csr_access:
+            return [lane for ram in self.banks for lane in ram.lanes]
+        else:
+            return []
+
+
+#######################
+# RAMBanks testbench: #
+#######################
+# Keep track of test pass / fail rates.
+p = 0
+f = 0
+
+# Perform an individual RAM write unit test.
+def ram_write_ut(port, address, data, data_width=1):
+    yield port.adr.eq(address)
+    yield port.we.eq(1)
+    yield port.ww.eq(data_width)
+    yield port.dat_w.eq(data)
+    yield port.stb.eq(1)
+    yield
+
+    while (yield port.ack) == 0:
+        yield
+
+    yield port.we.eq(0)
+    yield port.stb.eq(0)
+    yield
+
+
+# Perform an individual RAM read unit test.
+def ram_read_ut(port, address, expected, data_width=1):
+    global p, f
+
+    yield port.adr.eq(address)
+    yield port.stb.eq(1)
+    yield
+
+    while (yield port.ack) == 0:
+        yield
+
+    actual = yield {1: port.dat_r, 2: port.dat_r2,
+        4: port.dat_r4, 8: port.dat_r8}[data_width]
+    if expected != actual:
+        f += 1
+        print("\033[31mFAIL:\033[0m RAM[ 0x%08X ](%02d) == "
+            "0x%08X (got: 0x%08X)"
+            %(address, data_width, expected, actual))
+    else:
+        p += 1
+        print("\033[32mPASS:\033[0m RAM[ 0x%08X ](%02d) == 0x%08X"
+            %(address, data_width, expected))
+
+    yield port.stb.eq(0)
+    yield
+
+
+# Top-level RAM test method.
+def ram_test(mem):
+    global p, f
+
+    # Print a test header.
+    print("--- RAMBanks Tests ---")
+    print("words: {}".format(mem.words))
+
+    # Fill bank 1 through rx port, bank 0 through CPU port.
+    yield mem.bank.eq(0)
+    yield mem.rx_bank.eq(1)
+    yield from ram_write_ut(mem.rx, 0x03, 0x44332211, data_width=4)
+    yield from ram_write_ut(mem, 0x03, 0xddccbbaa, data_width=4)
+    yield from ram_read_ut(mem, 0x03, 0xddccbbaa, data_width=4)
+    yield from ram_read_ut(mem.rx, 0x04, 0x443322, data_width=4)
+
+    # Switch banks.
+    yield mem.bank.eq(1)
+    yield mem.rx_bank.eq(0)
+    yield from ram_read_ut(mem, 0x03, 0x44332211, data_width=4)
+    yield from ram_read_ut(mem.rx, 0x05, 0xcc, data_width=1)
+
+    # Done.
+    yield
+    print("RAMBanks Tests: %d Passed, %d Failed"%(p, f))
+
+
+# 'main' method to run a basic testbench.
+if __name__ == "__main__":
+    dut = RAMBanks(banks=2, max_words=256, write_capable=True,
+                   csr_access=True, debug=True)
+    run_simulation(dut, ram_test(dut), vcd_name="ram_banks.vcd")
@@ -0,0 +1,253 @@
+import sys
+sys.path.insert(0, '..')
+
+import os
+import math
+from migen import *
+from tools.common import *
+
+
+class RAMLanes(Module):
+
+    LANES = 8
+
+    def __init__(self, max_words=None,
+                init=None, endianness="big", write_capable=False,
+                csr_access=False, debug=False):
+
+        self.init = None
+        self.words = None
+
+        # Byte addressed RAM with the same interface as RAM but organized
+        # as 8 byte-lanes, each a separate memory 8 bits wide. Byte n is
+        # stored in lane (n % 8) at row (n // 8). An access of up to 8
+        # bytes at any (unaligned) address touches each lane at most once,
+        # either in the row of the address or the next one, so all bytes
+        # are read or written with a single memory port per lane in one
+        # cycle. Each lane only needs one read-write port for the CPU,
+        # the second port of a block RAM is left for CSR access.
+        # (see the Vivado RAM template note in ram.py)
+        self.write_capable = write_capable
+        self.csr_access = csr_access
+
+        if isinstance(max_words, int):
+            self.words = max_words
+
+        self.stb = Signal()
+        self.ack = Signal()
+
+        self.dat_r = Signal(8)
+        self.dat_r2 = Signal(8*2)
+        self.dat_r4 = Signal(8*4)
+        self.dat_r8 = Signal(8*8)
+
+        # Keep write signals even if module is not write capable
+        # so that interface does not change
+        self.we = Signal()
+        self.ww = Signal(4)
+        self.dat_w = Signal(8*8)
+
+        # # #
+
+        if debug:
+            print("-"*50)
+            print("RAMLanes")
+
+        init_words = None
+
+        # Read binary data into memory if specified
+        if isinstance(init, str):
+            init_file = os.path.abspath(os.path.dirname(__file__))
+            init_file = os.path.join(init_file, init)
+            self.init = get_data(init_file, data_width_bits=8,
+                endianness=endianness)
+            init_words = len(self.init)
+        elif isinstance(init, list):
+            self.init = init
+            init_words = len(self.init)
+
+        if debug:
+            print("max words:               {}".format(max_words))
+            print("init words:              {}".format(init_words))
+
+        if self.words is None:
+            self.words = init_words
+        elif self.init is not None:
+            assert init_words <= self.words, \
+                "Init contents ({} words) does not fit into specified " \
+                "maximum ({} words)".format(init_words, self.words)
+
+        assert self.words is not None, \
+            "Either number of words or data must be specified"
+
+        rows = math.ceil(self.words / self.LANES)
+        if debug:
+            print("instance words:          {}".format(self.words))
+            print("lane rows:               {}".format(rows))
+
+        self.adr = Signal(min=0, max=self.words)
+        row = self.adr[3:]
+        off = self.adr[0:3]
+
+        # Address the lane outputs belong to (memory reads take a cycle).
+        adr_r = Signal.like(self.adr)
+
+        self.lanes = []
+        ports = []
+        for i in range(self.LANES):
+            lane_init = None
+            if self.init is not None:
+                lane_init = self.init[i::self.LANES]
+            mem = Memory(8, rows, init=lane_init, name="lane{}".format(i))
+            port = mem.get_port(has_re=False, write_capable=write_capable)
+            setattr(self.specials, "lane{}".format(i), mem)
+            setattr(self.specials, "port{}".format(i), port)
+            self.lanes.append(mem)
+            ports.append(port)
+
+            # Lanes below the offset hold the bytes of the next row.
+            self.comb += port.adr.eq(row + (off > i))
+
+            if write_capable:
+                # Byte of dat_w stored in this lane.
+                n = Signal(3)
+                self.comb += [
+                    n.eq(i - off),
+                    port.dat_w.eq(Array(self.dat_w[8*k:8*(k+1)]
+                        for k in range(self.LANES))[n]),
+                    port.we.eq(self.stb & self.we & (n < self.ww)),
+                ]
+
+        # Rotate lane outputs into byte order.
+        lane_dat = Array(port.dat_r for port in ports)
+        data = []
+        for k in range(self.LANES):
+            lane = Signal(3)
+            self.comb += lane.eq(adr_r[0:3] + k)
+            data.append(lane_dat[lane])
+
+        self.comb += [
+            self.dat_r.eq(data[0]),
+            self.dat_r2.eq(Cat(*data[0:2])),
+            self.dat_r4.eq(Cat(*data[0:4])),
+            self.dat_r8.eq(Cat(*data)),
+        ]
+
+        # Writes are done in the cycle stb is seen, reads as soon as the
+        # lane outputs belong to the current address.
+        if write_capable:
+            self.comb += self.ack.eq(self.stb & (self.we | (adr_r == self.adr)))
+        else:
+            self.comb += self.ack.eq(self.stb & (adr_r == self.adr))
+
+        self.sync += adr_r.eq(self.adr)
+
+
+    def get_memories(self):
+        print("### RAM CSR access {} ###".format("enabled" if self.csr_access else "disabled"))
+        if self.csr_access:
+            return self.lanes
+        else:
+            return []
+
+
+#######################
+# RAMLanes testbench: #
+#######################
+# Keep track of test pass / fail rates.
+p = 0
+f = 0
+
+# Perform an individual RAM write unit test.
+def ram_write_ut(mem, address, data, data_width=1):
+    yield mem.adr.eq(address)
+    yield mem.we.eq(1)
+    yield mem.ww.eq(0 if data_width < 1 or data_width > 8 else data_width)
+    yield mem.dat_w.eq(data)
+    yield mem.stb.eq(1)
+    yield
+
+    while (yield mem.ack) == 0:
+        yield
+
+    yield mem.we.eq(0)
+    yield mem.stb.eq(0)
+    yield
+
+
+# Perform an individual RAM read unit test.
+def ram_read_ut(mem, address, expected, data_width=1):
+    global p, f
+
+    # Set address.
+    yield mem.adr.eq(address)
+    yield mem.stb.eq(1)
+    yield
+
+    while (yield mem.ack) == 0:
+        yield
+
+    actual = None
+    if data_width == 8:
+        actual = yield mem.dat_r8
+    elif data_width == 4:
+        actual = yield mem.dat_r4
+    elif data_width == 2:
+        actual = yield mem.dat_r2
+    else:
+        actual = yield mem.dat_r
+    if expected != actual:
+        f += 1
+        print("\033[31mFAIL:\033[0m RAM[ 0x%08X ](%02d) == "
+            "0x%08X (got: 0x%08X)"
+            %(address, data_width, expected, actual))
+    else:
+        p += 1
+        print("\033[32mPASS:\033[0m RAM[ 0x%08X ](%02d) == 0x%08X"
+            %(address, data_width, expected))
+
+    yield mem.stb.eq(0)
+    yield
+
+
+# Top-level RAM test method.
+def ram_test(mem):
+    global p, f
+
+    # Print a test header.
+    print("--- RAMLanes Tests ---")
+    print("words: {}".format(mem.words))
+
+    # Unaligned writes crossing rows.
+    yield from ram_write_ut(mem, 0x00, 0x0706050403020100, data_width=8)
+    yield from ram_write_ut(mem, 0x08, 0x0f0e0d0c0b0a0908, data_width=8)
+    yield from ram_write_ut(mem, 0x05, 0x8877, data_width=2)
+    yield from ram_write_ut(mem, 0x0d, 0xccbbaa99, data_width=4)
+    yield from ram_write_ut(mem, 0x13, 0x1a19181716151413, data_width=8)
+
+    yield from ram_read_ut(mem, 0x00, 0x00)
+    yield from ram_read_ut(mem, 0x05, 0x77)
+    yield from ram_read_ut(mem, 0x06, 0x88)
+    yield from ram_read_ut(mem, 0x07, 0x07)
+    yield from ram_read_ut(mem, 0x05, 0x08078877, data_width=4)
+    yield from ram_read_ut(mem, 0x03, 0x0a09080788770403, data_width=8)
+    yield from ram_read_ut(mem, 0x0c, 0x130000ccbbaa990c, data_width=8)
+    yield from ram_read_ut(mem, 0x13, 0x1a19181716151413, data_width=8)
+    yield from ram_read_ut(mem, 0x17, 0x1817, data_width=2)
+
+    # roll over
+    yield from ram_write_ut(mem, mem.words-1, 0xF8F7F6F5F4F3F2F1, data_width=8)
+    yield from ram_read_ut(mem, mem.words-1, 0xF1)
+    yield from ram_read_ut(mem, 0x00, 0xF5F4F3F2, data_width=4)
+    yield from ram_read_ut(mem, mem.words-2, 0xF3F2F100, data_width=4)
+
+    # Done.
+    yield
+    print("RAMLanes Tests: %d Passed, %d Failed"%(p, f))
+
+
+# 'main' method to run a basic testbench.
+if __name__ == "__main__":
+    dut = RAMLanes(max_words=1024, write_capable=True, csr_access=True,
+                   debug=True)
+    run_simulation(dut, ram_test(dut), vcd_name="ram_lanes.vcd")
@@ -1,3 +1,6 @@
+import struct
+from emulator.ebpf.vm_verifier import Verifier
+
 
 # Used to connect to hardware under test. Uses serial link (but can use
 # any other medium provided by lites.tools.remote) to communicate with
@@ -125,7 +128,14 @@ class HW_Connect:
         data = self.read(self.regs.hbpf_csr_ticks.addr, length=2)
         return (data[0] << 32 | data[1])
 
-    def cpu_load_pgm(self, data):
+    # data are the program's 32 bit half words as written to program
+    # memory. Programs the CPU can not run are rejected before loading
+    # unless verify is cleared (e.g. to test CPU error handling).
+    def cpu_load_pgm(self, data, verify=True):
+        if verify:
+            code = struct.pack('>{}L'.format(len(data)), *data)
+            Verifier(struct.unpack('<{}Q'.format(len(code) // 8), code),
+                fpga=True).verify()
         self.write(self.bases.hbpf_pgm_mem, data)
 
     def cpu_load_data(self, data):
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import glob
+import struct
+import argparse
+# add search paths seen from project root folder
+# (used for vscode test integration)
+sys.path.insert(0, "source")
+sys.path.insert(0, "tools/ubpf")
+# add search paths when run from inside test folder
+# (used when running test directly)
+sys.path.insert(0, "../source")
+sys.path.insert(0, "../tools/ubpf")
+import ubpf.assembler
+import tools.testdata
+from emulator.ebpf.vm_cycles import *
+
+"""
+This script estimates the clock cycles a program needs on the hBPF CPU
+without running it. It builds the control flow graph of the program and
+sums up cycles per opcode from the most recent opcode cycle table (see
+stats_op_cycles.py). Reported are the worst-case path, the typical path
+(each conditional jump taken with 50% probability) and the resulting
+packets per second of a single CPU at the given system clock frequency,
+e.g. to size line-rate deployments on the arty-a7-100-net and
+arty-s7-50-nic boards.
+"""
+
+parser = argparse.ArgumentParser(description="Estimate hBPF program cycles")
+parser.add_argument("programs", nargs="+",
+                    help="Test data files (.test) or compiled eBPF binaries")
+parser.add_argument("-f", "--sys-clk-freq", type=float, default=100e6,
+                    help="System clock frequency in Hz (default 100e6)")
+parser.add_argument("-t", "--table", type=str, default=None,
+                    help="Opcode cycle table (default most recent table in "
+                    "tests/statistics)")
+parser.add_argument("-l", "--loop-bound", type=int, default=None,
+                    help="Maximum executions of a block inside a loop "
+                    "(default none, programs with loops are unbounded)")
+parser.add_argument("-c", "--call-cycles", type=int, default=CALL_CYCLES,
+                    help="Cycles per helper call (default {})".format(
+                    CALL_CYCLES))
+args = parser.parse_args()
+
+
+# Read program words in VM byte-order.
+def load(file_name):
+    if file_name.endswith(".test"):
+        td = tools.testdata.read(file_name)
+        if "raw" in td:
+            code = b"".join(struct.pack(">Q", x) for x in td["raw"])
+        else:
+            code = ubpf.assembler.assemble(td["asm"])
+    else:
+        with open(file_name, "rb") as fd:
+            code = fd.read()
+    return struct.unpack("<{}Q".format(len(code) // 8), code)
+
+
+# Most recent opcode cycle table under tests/statistics by default.
+table_file = args.table
+if table_file is None:
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+        "statistics")
+    files = sorted(glob.glob(os.path.join(path, "opcode_cycles_*.csv")))
+    if not files:
+        raise Exception("No opcode cycle table found in {}".format(path))
+    table_file = files[-1]
+table = read_cycle_table(table_file)
+
+print(f"System clock: {args.sys_clk_freq / 1e6:.2f} MHz")
+print(f"{'Program':30s} {'Worst':>10s} {'Typical':>10s} "
+      f"{'Worst pps':>14s} {'Typical pps':>14s}")
+
+for file_name in args.programs:
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    try:
+        est = CycleEstimator(load(file_name), table=table,
+            call_cycles=args.call_cycles, loop_bound=args.loop_bound)
+    except Exception as ex:
+        print(f"{name:30s} {ex}")
+        continue
+
+    worst = est.worst_case()
+    typical = est.typical()
+    if worst is None:
+        print(f"{name:30s} {'unbounded':>10s} {'unbounded':>10s} "
+              f"{'-':>14s} {'-':>14s}")
+        continue
+    print(f"{name:30s} {worst:10d} {typical:10.1f} "
+          f"{packets_per_second(worst, args.sys_clk_freq):14.0f} "
+          f"{packets_per_second(typical, args.sys_clk_freq):14.0f}")
@@ -37,6 +37,15 @@ True, a markdown file will be created instead.
 
 OUPUT_MD_TABLE = False
 
+# Divider radix of the CPU (see CPU divider_radix).
+DIVIDER_RADIX = 2
+
+# Shifter pipeline stages of the CPU (see CPU shifter_stages).
+SHIFTER_STAGES = 0
+
+# Multiplier pipeline stages of the CPU (see CPU multiplier_stages).
+MULTIPLIER_STAGES = 0
+
 stats = {}
 
 def cpu_test(fd, opcode, cpu):
@@ -83,9 +92,9 @@ def cpu_test(fd, opcode, cpu):
 
         ticks += 1
 
-    # Subtract initial reset tick and final added exit op-code tick
-    # (except for the 'exit' opcode itself)
-    ticks -= (2 if opcode.name != "exit" else 1)
+    # Subtract final added exit op-code tick (except for the 'exit'
+    # opcode itself). The first instruction is fetched during reset.
+    ticks -= (1 if opcode.name != "exit" else 0)
 
     # Write output
     if OUPUT_MD_TABLE:
@@ -134,7 +143,9 @@ def opcode_cycles(fd, opcode):
     data = b"\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\xcc\xdd\xee\xff"
     data_mem = list(data)
 
-    cpu = CPU(pgm_init=pgm_mem, data_init=data_mem, simulation=True)
+    cpu = CPU(pgm_init=pgm_mem, data_init=data_mem, simulation=True,
+        divider_radix=DIVIDER_RADIX, shifter_stages=SHIFTER_STAGES,
+        multiplier_stages=MULTIPLIER_STAGES)
     run_simulation(cpu, cpu_test(fd, opcode, cpu), vcd_name="stats_op_cycles.vcd")
 
 
@@ -167,12 +178,23 @@ opcodes_alu64 = [
     OPCODE("mul reg",   "mul r1, r2",
         REGS(2, 2, 0, 0, 0),
         REGS(4, 2, 0, 0, 0)),
+    # Division cycles depend on the dividend's significant bits, the
+    # plain entries are the worst case (used by stats_estimate.py).
     OPCODE("div imm",   "div r1, 2",
-        REGS(5, 0, 0, 0, 0),
-        REGS(2, 0, 0, 0, 0)),
+        REGS(0xffffffffffffffff, 0, 0, 0, 0),
+        REGS(0x7fffffffffffffff, 0, 0, 0, 0)),
     OPCODE("div reg",   "div r1, r2",
-        REGS(5, 2, 0, 0, 0),
-        REGS(2, 2, 0, 0, 0)),
+        REGS(0xffffffffffffffff, 2, 0, 0, 0),
+        REGS(0x7fffffffffffffff, 2, 0, 0, 0)),
+    OPCODE("div imm 8 bit",   "div r1, 8",
+        REGS(200, 0, 0, 0, 0),
+        REGS(25, 0, 0, 0, 0)),
+    OPCODE("div imm 16 bit",  "div r1, 4",
+        REGS(1500, 0, 0, 0, 0),
+        REGS(375, 0, 0, 0, 0)),
+    OPCODE("div reg 32 bit",  "div r1, r2",
+        REGS(100000000, 1000, 0, 0, 0),
+        REGS(100000, 1000, 0, 0, 0)),
     OPCODE("or imm",    "or r1, 1",
         REGS(2, 0, 0, 0, 0),
         REGS(3, 0, 0, 0, 0)),
@@ -201,11 +223,14 @@ opcodes_alu64 = [
         REGS(3,                       0, 0, 0, 0),
         REGS(-3 & 0xffffffffffffffff, 0, 0, 0, 0)),
     OPCODE("mod imm",   "mod r1, 2",
-        REGS(5, 0, 0, 0, 0),
+        REGS(0xffffffffffffffff, 0, 0, 0, 0),
         REGS(1, 0, 0, 0, 0)),
     OPCODE("mod reg",   "mod r1, r2",
-        REGS(5, 2, 0, 0, 0),
+        REGS(0xffffffffffffffff, 2, 0, 0, 0),
         REGS(1, 2, 0, 0, 0)),
+    OPCODE("mod imm 16 bit",  "mod r1, 64",
+        REGS(1500, 0, 0, 0, 0),
+        REGS(28, 0, 0, 0, 0)),
     OPCODE("xor imm",   "xor r1, 2",
         REGS(7, 0, 0, 0, 0),
         REGS(5, 0, 0, 0, 0)),
@@ -263,11 +288,14 @@ opcodes_alu32 = [
         REGS(2, 2, 0, 0, 0),
         REGS(4, 2, 0, 0, 0)),
     OPCODE("div32 imm",   "div32 r1, 2",
-        REGS(5, 0, 0, 0, 0),
-        REGS(2, 0, 0, 0, 0)),
+        REGS(0xffffffff, 0, 0, 0, 0),
+        REGS(0x7fffffff, 0, 0, 0, 0)),
     OPCODE("div32 reg",   "div32 r1, r2",
-        REGS(5, 2, 0, 0, 0),
-        REGS(2, 2, 0, 0, 0)),
+        REGS(0xffffffff, 2, 0, 0, 0),
+        REGS(0x7fffffff, 2, 0, 0, 0)),
+    OPCODE("div32 imm 16 bit",  "div32 r1, 4",
+        REGS(1500, 0, 0, 0, 0),
+        REGS(375, 0, 0, 0, 0)),
     OPCODE("or32 imm",    "or32 r1, 1",
         REGS(2, 0, 0, 0, 0),
         REGS(3, 0, 0, 0, 0)),
@@ -296,10 +324,10 @@ opcodes_alu32 = [
         REGS(3,                       0, 0, 0, 0),
         REGS(-3 & 0x00000000ffffffff, 0, 0, 0, 0)),
     OPCODE("mod32 imm",   "mod32 r1, 2",
-        REGS(5, 0, 0, 0, 0),
+        REGS(0xffffffff, 0, 0, 0, 0),
         REGS(1, 0, 0, 0, 0)),
     OPCODE("mod32 reg",   "mod32 r1, r2",
-        REGS(5, 2, 0, 0, 0),
+        REGS(0xffffffff, 2, 0, 0, 0),
         REGS(1, 2, 0, 0, 0)),
     OPCODE("xor32 imm",   "xor32 r1, 2",
         REGS(7, 0, 0, 0, 0),
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+from operator import xor
+from datetime import datetime
+# add search paths seen from project root folder
+# (used for vscode test integration)
+sys.path.insert(0, "source")
+# add search paths when run from inside test folder
+# (used when running test directly)
+sys.path.insert(0, "../source")
+from migen import *
+from migen.fhdl import verilog
+from fpga.ram import *
+from fpga.ram64 import *
+from fpga.cpu import *
+from fpga.math.divide import Divider
+from fpga.math.shift import Shifter
+from fpga.math.multiply import Multiplier
+
+"""
+This script synthesizes the CPU and its RAM, RAM64, Divider, Shifter and
+Multiplier submodules with several parameter sets using an open source
+flow (Yosys and nextpnr) for an ECP5 or iCE40 FPGA as proxy target and
+writes LUT, FF, RAM and DSP usage and the fmax estimated by nextpnr to a
+CSV file. Numbers are not those of Vivado for the Arty boards but allow
+to track the area and timing impact of hardware changes over time.
+
+Each module is wrapped by a small harness so synthesis neither removes
+logic nor needs a pin per signal: all inputs are registered and chained
+to a shift register fed by one input pin, all outputs are XORed into one
+registered output pin. Numbers include the harness (one FF per input bit
+and an XOR tree of the output bits).
+"""
+
+parser = argparse.ArgumentParser(description="Synthesize hBPF modules and "
+                    "record area and fmax")
+parser.add_argument("-t", "--target", type=str, default="ecp5",
+                    choices=["ecp5", "ice40"],
+                    help="Target FPGA family (default ecp5)")
+parser.add_argument("-m", "--modules", type=str, default=None, nargs="?",
+                    help="Only run benchmarks whose name contains this text")
+parser.add_argument("-f", "--freq", type=float, default=100.0,
+                    help="Target frequency in MHz for place and route " +
+                    "(default 100)")
+parser.add_argument("-b", "--build-dir", type=str, default="./synth",
+                    help="Directory for generated files (default ./synth)")
+parser.add_argument("--verilog-only", action="store_true",
+                    help="Only generate Verilog, e.g. to check elaboration " +
+                    "without Yosys and nextpnr")
+args = parser.parse_args()
+
+
+# Tools and cell types per target. FFs and distributed RAM are matched by
+# prefix as there are several variants.
+TARGETS = {
+    "ecp5": {
+        "synth": "synth_ecp5",
+        "pnr": ["nextpnr-ecp5", "--85k", "--package", "CABGA381",
+            "--lpf-allow-unconstrained"],
+        "luts": ["LUT4"],
+        "ffs": ["TRELLIS_FF"],
+        "drams": ["TRELLIS_DPR16X4"],
+        "brams": ["DP16KD"],
+        "dsps": ["MULT18X18D"],
+    },
+    "ice40": {
+        "synth": "synth_ice40",
+        "pnr": ["nextpnr-ice40", "--up5k", "--package", "sg48",
+            "--pcf-allow-unconstrained"],
+        "luts": ["SB_LUT4"],
+        "ffs": ["SB_DFF"],
+        "drams": [],
+        "brams": ["SB_RAM40_4K"],
+        "dsps": ["SB_MAC16"],
+    },
+}
+
+
+# Wrap 'dut' for synthesis, see above.
+class Harness(Module):
+
+    def __init__(self, dut, inputs, outputs):
+        self.submodules.dut = dut
+
+        self.sin = Signal()
+        self.sout = Signal()
+
+        # # #
+
+        # Inputs are assigned synchronously as some modules (e.g. RAM 'we')
+        # clear their inputs themselves.
+        chain = Cat(*inputs)
+        self.sync += chain.eq(Cat(self.sin, chain[:-1]))
+
+        bits = [s[i] for s in outputs for i in range(len(s))]
+        self.sync += self.sout.eq(reduce(xor, bits))
+
+
+# Benchmarks returning module, inputs and outputs.
+def bench_cpu(**kwargs):
+    cpu = CPU(max_pgm_words=1024, max_data_words=2048, **kwargs)
+    # Without a write port program memory is a ROM of zeros and most of
+    # the CPU logic would be removed.
+    port = cpu.pgm.mem.get_port(write_capable=True)
+    cpu.specials += port
+    return (cpu, [cpu.reset_n, port.adr, port.dat_w, port.we],
+        [cpu.halt, cpu.error, cpu.ticks, cpu.r0])
+
+
+def bench_ram(**kwargs):
+    ram = RAM(max_words=2048, **kwargs)
+    return (ram, [ram.adr, ram.stb, ram.we, ram.ww, ram.dat_w],
+        [ram.ack, ram.dat_r, ram.dat_r2, ram.dat_r4, ram.dat_r8])
+
+
+def bench_ram64(**kwargs):
+    ram = RAM64(max_words=1024, **kwargs)
+    port = ram.mem.get_port(write_capable=True)
+    ram.specials += port
+    return (ram, [ram.adr, port.adr, port.dat_w, port.we], [ram.dat_r])
+
+
+def bench_divider(**kwargs):
+    div = Divider(data_width=64, **kwargs)
+    return (div, [div.reset_n, div.dividend, div.divisor, div.half, div.stb],
+        [div.quotient, div.remainder, div.ack, div.err])
+
+
+def bench_shifter(**kwargs):
+    shift = Shifter(data_width=64, **kwargs)
+    return (shift, [shift.arith, shift.left, shift.value, shift.shift],
+        [shift.out])
+
+
+def bench_multiplier(**kwargs):
+    mul = Multiplier(data_width=64, **kwargs)
+    return (mul, [mul.reset_n, mul.a, mul.b, mul.stb], [mul.out, mul.ack])
+
+
+BENCHMARKS = [
+    ("CPU", bench_cpu, {}),
+    ("CPU", bench_cpu, {"data_byte_lanes": True}),
+    ("CPU", bench_cpu, {"divider_radix": 4}),
+    ("CPU", bench_cpu, {"divider_radix": 16}),
+    ("CPU", bench_cpu, {"shifter_stages": 2}),
+    ("CPU", bench_cpu, {"multiplier_stages": 3}),
+    ("CPU", bench_cpu, {"data_byte_lanes": True, "divider_radix": 4,
+        "shifter_stages": 2, "multiplier_stages": 3}),
+    ("RAM", bench_ram, {"write_capable": True}),
+    ("RAM64", bench_ram64, {}),
+    ("Divider", bench_divider, {"radix": 2}),
+    ("Divider", bench_divider, {"radix": 4}),
+    ("Divider", bench_divider, {"radix": 16}),
+    ("Shifter", bench_shifter, {"stages": 0}),
+    ("Shifter", bench_shifter, {"stages": 2}),
+    ("Multiplier", bench_multiplier, {"stages": 0}),
+    ("Multiplier", bench_multiplier, {"stages": 3}),
+]
+
+
+def run(cmd, cwd):
+    try:
+        subprocess.run(cmd, cwd=cwd, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        raise Exception("{} not found, install Yosys and nextpnr or use "
+            "--verilog-only".format(cmd[0]))
+
+
+# Count cells of Yosys 'stat' output, newer versions print the count
+# before the cell type.
+def cell_counts(stat):
+    counts = {}
+    for name, count in re.findall(r"^\s+([A-Z]\S+)\s+(\d+)\s*$", stat, re.M):
+        counts[name] = int(count)
+    for count, name in re.findall(r"^\s+(\d+)\s+([A-Z]\S+)\s*$", stat, re.M):
+        counts[name] = int(count)
+    return counts
+
+
+def synthesize(path, target):
+    t = TARGETS[target]
+    cwd = os.path.dirname(path)
+
+    run(["yosys", "-q", "-l", "yosys.log", "-p",
+        "read_verilog top.v; {} -top top -json top.json; "
+        "tee -o stat.txt stat".format(t["synth"])], cwd)
+    with open(os.path.join(cwd, "stat.txt")) as fd:
+        counts = cell_counts(fd.read())
+
+    def total(prefixes):
+        return sum(c for n, c in counts.items()
+            if any(n.startswith(p) for p in prefixes))
+
+    result = {k: total(t[k]) for k in ["luts", "ffs", "drams", "brams", "dsps"]}
+
+    # The last reported fmax is the one after routing, designs not fitting
+    # the device have none.
+    result["fmax"] = ""
+    try:
+        run(t["pnr"] + ["--json", "top.json", "--freq", str(args.freq),
+            "--log", "pnr.log"], cwd)
+    except subprocess.CalledProcessError:
+        print("    place and route failed, see {}".format(
+            os.path.join(cwd, "pnr.log")))
+    if os.path.exists(os.path.join(cwd, "pnr.log")):
+        with open(os.path.join(cwd, "pnr.log")) as fd:
+            fmax = re.findall(
+                r"Max frequency for clock\s+'[^']*':\s+([\d.]+) MHz", fd.read())
+        if fmax:
+            result["fmax"] = fmax[-1]
+    return result
+
+
+date = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+rows = []
+for name, bench, kwargs in BENCHMARKS:
+    params = " ".join("{}={}".format(k, v) for k, v in kwargs.items())
+    tag = "_".join([name.lower()] +
+        ["{}{}".format(k, int(v)) for k, v in kwargs.items()])
+    if args.modules and args.modules.lower() not in tag:
+        continue
+
+    print("{} {}".format(name, params))
+    path = os.path.join(os.path.abspath(args.build_dir), tag, "top.v")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    harness = Harness(*bench(**kwargs))
+    verilog.convert(harness, ios={harness.sin, harness.sout},
+        name="top").write(path)
+    if args.verilog_only:
+        continue
+
+    result = synthesize(path, args.target)
+    print("    LUTs: {luts}, FFs: {ffs}, DRAMs: {drams}, BRAMs: {brams}, "
+        "DSPs: {dsps}, Fmax: {fmax} MHz".format(**result))
+    rows.append((name, params, result))
+
+if not args.verilog_only:
+    with open(f"./statistics/synth_{args.target}_{date}.csv", "w") as fd:
+        fd.write('"Module","Parameters","LUTs","FFs","DRAMs","BRAMs","DSPs",'
+            '"Fmax (MHz)"\n')
+        for name, params, r in rows:
+            fd.write('"{}","{}",{luts},{ffs},{drams},{brams},{dsps},{fmax}\n'
+                .format(name, params, **r))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import struct
+import argparse
+import contextlib
+import timeit
+# add search paths seen from project root folder
+# (used for vscode test integration)
+sys.path.insert(0, "source")
+sys.path.insert(0, "tools/ubpf")
+# add search paths when run from inside test folder
+# (used when running test directly)
+sys.path.insert(0, "../source")
+sys.path.insert(0, "../tools/ubpf")
+import ubpf.assembler
+import tools.testdata
+from emulator.ebpf.vm import VM
+
+"""
+This script measures the time per instruction of the emulator with and
+without debug tracing. Non debug VMs call the raw instruction handlers,
+debug VMs call handlers wrapped with the disassembly tracing (output is
+discarded). Numbers depend on the machine and are only printed.
+"""
+
+parser = argparse.ArgumentParser(description="Measure emulator time per "
+                    "instruction with and without debug tracing")
+parser.add_argument("-n", "--number", type=int, default=200,
+                    help="Number of runs over all packets per measurement " +
+                    "(default 200)")
+parser.add_argument("-r", "--repeat", type=int, default=5,
+                    help="Number of measurements, the fastest is used " +
+                    "(default 5)")
+args = parser.parse_args()
+
+
+# Run all tcp-port-80 test packets through their program.
+path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+            "data", "net", "tcp-port-80")
+tds = [tools.testdata.read(f) for f in tools.testdata.list_files(path)]
+packets = [td['mem'] for td in tds]
+
+code = ubpf.assembler.assemble(tds[0]['asm'])
+pgm_mem = list(struct.unpack('={}Q'.format(len(code) // 8), code))
+
+
+# Count executed instructions of all packets.
+vm = VM(mem=list(pgm_mem), color=False)
+instructions = 0
+for packet in packets:
+    vm.regs[:] = [0] * len(vm.regs)
+    vm.data_mem[:len(packet)] = packet
+    vm.reset()
+    while vm.exit_val is None:
+        vm.step()
+        instructions += 1
+
+
+def measure(debug):
+    vm = VM(mem=list(pgm_mem), color=False, debug=debug)
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        t = min(timeit.repeat(lambda: list(vm.run_batch(packets, args=[0])),
+            number=args.number, repeat=args.repeat))
+    return t / (args.number * instructions) * 1e9
+
+
+raw = measure(False)
+traced = measure(True)
+print("Instructions per run: {}".format(instructions))
+print("Non debug: {:.1f} ns per instruction".format(raw))
+print("Debug:     {:.1f} ns per instruction".format(traced))
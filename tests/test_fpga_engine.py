@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import sys
+# add search paths seen from project root folder
+# (used for vscode test integration)
+sys.path.insert(0, 'source')
+sys.path.insert(0, 'tools/ubpf')
+# add search paths when run from inside test folder
+# (used when running test directly)
+sys.path.insert(0, '../source')
+sys.path.insert(0, '../tools/ubpf')
+
+import unittest
+import colour_runner.runner
+import os
+import struct
+import ubpf.assembler
+from migen import *
+from fpga.engine import *
+
+
+class TestFPGA_Engine(unittest.TestCase):
+
+    # Verdict is frame length (R1) and last byte of the frame.
+    PROGRAM = """
+        mov r0, r1
+        lsh r0, 8
+        ldxb r2, [r1-1]
+        or r0, r2
+        exit
+        """
+
+    def run_engine(self, frames, cores, data_byte_lanes=False, banks=1,
+            data_width=8, hold=0):
+        """
+        Send frames to a packet engine and collect verdicts. The first
+        verdict is not taken for 'hold' cycles.
+        """
+        code = ubpf.assembler.assemble(self.PROGRAM)
+        pgm_mem = list(struct.unpack('>{}L'.format(len(code) // 4), code))
+        engine = PacketEngine(pgm_init=pgm_mem, max_data_words=256,
+            cores=cores, banks=banks, data_width=data_width,
+            data_byte_lanes=data_byte_lanes)
+
+        verdicts = []
+        received = []
+
+        def send():
+            for frame in frames:
+                for i, byte in enumerate(frame):
+                    yield engine.sink.valid.eq(1)
+                    yield engine.sink.data.eq(byte)
+                    yield engine.sink.last.eq(i == len(frame) - 1)
+                    yield
+                    while not (yield engine.sink.ready):
+                        yield
+                received.append(len(verdicts))
+            yield engine.sink.valid.eq(0)
+
+        def collect():
+            for i in range(hold):
+                yield
+            yield engine.source.ready.eq(1)
+            cycles = 0
+            while len(verdicts) < len(frames) and cycles < 20000:
+                yield
+                cycles += 1
+                if (yield engine.source.valid):
+                    verdicts.append(((yield engine.source.r0),
+                        (yield engine.source.error)))
+            yield
+            verdicts.append((yield engine.csr_packets.status))
+
+        run_simulation(engine, [send(), collect()])
+        return verdicts, received
+
+
+    def test_in_order(self):
+        """
+        Verdicts are delivered in order of the frames for any number of
+        cores.
+        """
+        frames = [bytes([i] * (20 + 7 * i)) for i in range(1, 6)]
+        expected = [((len(f) << 8) | f[-1], 0) for f in frames]
+        for cores in [1, 2, 3]:
+            for lanes, banks in [(False, 1), (True, 1), (True, 2)]:
+                verdicts, _ = self.run_engine(frames, cores, lanes, banks)
+                self.assertEqual(verdicts[:-1], expected,
+                    "cores {}, byte lanes {}, banks {}".format(
+                        cores, lanes, banks))
+                self.assertEqual(verdicts[-1], len(frames))
+
+
+    def test_data_width(self):
+        """
+        Frames are written to data memory in words, the last word
+        of a frame can be partial.
+        """
+        frames = [bytes(range(i, 20 + 7 * i)) for i in range(1, 6)]
+        expected = [((len(f) << 8) | f[-1], 0) for f in frames]
+        for data_width in [32, 64]:
+            for lanes, banks in [(False, 1), (True, 2)]:
+                verdicts, _ = self.run_engine(frames, 2, lanes, banks,
+                    data_width)
+                self.assertEqual(verdicts[:-1], expected,
+                    "data width {}, byte lanes {}, banks {}".format(
+                        data_width, lanes, banks))
+
+
+    def test_parallel(self):
+        """
+        Frames are received while cores are busy, ingress stalls only when
+        no core is idle.
+        """
+        frames = [bytes([i] * 16) for i in range(1, 5)]
+        _, received = self.run_engine(frames, 2, True, hold=2000)
+        # Two frames are accepted before any verdict is taken.
+        self.assertEqual(received[:2], [0, 0])
+        self.assertGreater(received[2], 0)
+
+
+    def test_banks(self):
+        """
+        A core receives the next frames into its other data memory banks
+        while processing a frame.
+        """
+        frames = [bytes([i] * 16) for i in range(1, 6)]
+        _, received = self.run_engine(frames, 1, True, banks=3, hold=2000)
+        # Three frames are accepted before any verdict is taken.
+        self.assertEqual(received[:3], [0, 0, 0])
+        self.assertGreater(received[3], 0)
+
+
+    def test_csrs(self):
+        """
+        CSRs and memories of the cores are not collected with the ones of
+        the engine, a SoC adds a core under its own name.
+        """
+        engine = PacketEngine(max_data_words=256, cores=2, banks=2,
+            data_byte_lanes=True)
+        self.assertEqual([c.name for c in engine.get_csrs()],
+            ["csr_packets", "csr_errors"])
+        self.assertEqual(engine.get_memories(), [])
+        names = [m.name_override for m in engine.cores[0].get_memories()]
+        self.assertIn("pgm_mem", names)
+        self.assertIn("data_bank1_lane7", names)
+
+
+if __name__ == '__main__':
+    # Use colored testrunner instead of standard testrunner.
+    #unittest.main()
+    runner = colour_runner.runner.ColourTextTestRunner(sys.stdout, verbosity=2)
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFPGA_Engine)
+    runner.run(suite)
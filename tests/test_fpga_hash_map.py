@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import sys
+# add search paths seen from project root folder
+# (used for vscode test integration)
+sys.path.insert(0, 'source')
+sys.path.insert(0, 'tools/ubpf')
+# add search paths when run from inside test folder
+# (used when running test directly)
+sys.path.insert(0, '../source')
+sys.path.insert(0, '../tools/ubpf')
+
+import unittest
+import colour_runner.runner
+import random
+from migen import *
+from fpga.hash_map import HashMap
+from emulator.ebpf import hash_map
+
+
+class TestFPGA_HashMap(unittest.TestCase):
+
+    def test_random(self):
+        """
+        Random lookups, updates and deletes give the same results as the
+        emulator hash map, including full buckets.
+        """
+        buckets, ways = 4, 2
+        dut = HashMap(buckets=buckets, ways=ways)
+        emu = hash_map.HashMap(buckets=buckets, ways=ways)
+        functions = {
+            HashMap.OP_LOOKUP: emu.lookup,
+            HashMap.OP_UPDATE: emu.update,
+            HashMap.OP_DELETE: emu.delete
+        }
+
+        random.seed(1)
+        # Few keys to get hits, one key above 32 bits.
+        keys = [random.getrandbits(8) for i in range(15)] + [0x1234567890]
+        results = []
+
+        def run():
+            for i in range(400):
+                op = random.choice(list(functions.keys()))
+                key = random.choice(keys)
+                value = random.getrandbits(64)
+
+                yield dut.op.eq(op)
+                yield dut.key.eq(key)
+                yield dut.value.eq(value)
+                yield dut.stb.eq(1)
+                yield
+                cycles = 1
+                while not (yield dut.ack):
+                    yield
+                    cycles += 1
+                ret = yield dut.ret
+                yield dut.stb.eq(0)
+                yield
+
+                results.append((op, key, ret, cycles,
+                    functions[op](key, value, 0, 0, 0)))
+
+        run_simulation(dut, run())
+
+        for op, key, ret, cycles, expected in results:
+            self.assertEqual(ret, expected,
+                "op {}, key 0x{:x}".format(op, key))
+            self.assertEqual(cycles, 2)
+        # Some updates failed and some deletes found the key.
+        self.assertIn((HashMap.OP_UPDATE, 1),
+            [(r[0], r[4]) for r in results])
+        self.assertIn((HashMap.OP_DELETE, 0),
+            [(r[0], r[4]) for r in results])
+
+
+if __name__ == '__main__':
+    # Use colored testrunner instead of standard testrunner.
+    #unittest.main()
+    runner = colour_runner.runner.ColourTextTestRunner(sys.stdout, verbosity=2)
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFPGA_HashMap)
+    runner.run(suite)
@@ -200,7 +200,9 @@ class TestFPGA_HW(unittest.TestCase):
         mem = test_data.get('mem')
         if mem is not None:
             self.comm.cpu_load_data(mem)
-        self.comm.cpu_load_pgm(test_data['raw'])
+        # Programs expected to fail are loaded unverified to test the
+        # CPU's error handling.
+        self.comm.cpu_load_pgm(test_data['raw'], verify=not expected_error)
 
         # set r1 - r5 input arguments
         args = test_data.get('args', {})
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import sys
+# add search paths seen from project root folder
+# (used for vscode test integration)
+sys.path.insert(0, 'source')
+sys.path.insert(0, 'tools/ubpf')
+# add search paths when run from inside test folder
+# (used when running test directly)
+sys.path.insert(0, '../source')
+sys.path.insert(0, '../tools/ubpf')
+
+import unittest
+import colour_runner.runner
+import os
+import gc
+import re
+import struct
+import random
+import ubpf.assembler
+import tools.testdata
+from fpga.cpu_model import *
+from emulator.ebpf.hash_map import HashMap
+from emulator.ebpf.checksum import Checksum
+
+
+# Helper functions like the CallHandler of test_fpga_sim.py, data_mem
+# returns the data memory for checksums.
+def call_handler(data_mem=None):
+    def gather_bytes(r1, r2, r3, r4, r5):
+        return (((r1 & 0xff) << 32) |
+            ((r2 & 0xff) << 24) |
+            ((r3 & 0xff) << 16) |
+            ((r4 & 0xff) << 8) |
+            r5)
+
+    def helper_random(r1, r2, r3, r4, r5):
+        return random.getrandbits(31)
+
+    def helper_leds(r1, r2, r3, r4, r5):
+        pass
+
+    return {
+        0: gather_bytes,
+        7: helper_random,
+        0xff000001: helper_leds,
+        **HashMap().helpers(),
+        **Checksum(data_mem).helpers()
+    }
+
+
+class TestFPGA_Model(unittest.TestCase):
+
+    def check_datafile(self, filename):
+        """
+        Given assembly source code and an expected result, run the eBPF program
+        on the CPU model and verify that the result matches.
+        """
+        print()
+
+        td = tools.testdata.read(filename)
+
+        self.assertFalse('asm' not in td and 'raw' not in td,
+                    'no asm or raw section in datafile')
+
+        # Prepare program memory
+        if 'raw' in td:
+            code = b''.join(struct.pack('>Q', x) for x in td['raw'])
+        else:
+            code = ubpf.assembler.assemble(td['asm'])
+        half_words = len(code) // 4
+        pgm_mem = list(struct.unpack('>{}L'.format(half_words), code))
+
+        # Prepare data memory
+        data_mem = td.get('mem')
+        if isinstance(data_mem, bytes):
+            data_mem = list(data_mem)
+
+        result = None
+        if 'result' in td:
+            result = int(td['result'], 0)
+
+        expected_error = 1 if 'error' in td else 0
+
+        expected = dict(re.findall(r'(\S+)\s*=\s*(".*?"|\S+)', td.get('expected', '')))
+        expected_halt = 1 if int(expected.get('halt', '1'), 0) > 0 else 0
+        # this can override error section above
+        expected_error = 1 if int(expected.get('error', str(expected_error)), 0) > 0 else 0
+        max_clock_cycles = int(expected.get('clocks', '1000'), 0)
+        # The model runs all tests the simulator runs, and long running
+        # ones it can be enabled for.
+        disable_test = int(expected.get('disable_model_test',
+            expected.get('disable_sim_test', '0')))
+
+        if disable_test == 1:
+            self.skipTest("Testcase not available for CPU model test")
+
+        args = td.get('args', {})
+        regs = [int(str(args.get('r{}'.format(i), 0)), 0) for i in range(1, 6)]
+
+        cpu = CPUModel(pgm_init=pgm_mem, data_init=data_mem,
+            call_handler=call_handler(lambda: cpu.data))
+        cpu.reset(*regs)
+        r0 = cpu.run(max_ticks=max_clock_cycles + 1)
+
+        print("Clock cycles: ({}), halt: ({}), error: ({}), R0: ({:20}, 0x{:016x})".format(
+            cpu.ticks,
+            "LOW" if cpu.halt == 0 else "HIGH",
+            "LOW" if cpu.error == 0 else "HIGH", r0, r0))
+
+        self.assertEqual(cpu.error, expected_error,
+            ("Action does not complete with expected error signal level; " +
+                "was {} should be {}").format(cpu.error, expected_error))
+
+        self.assertEqual(cpu.halt, expected_halt,
+            ("Action does not complete with expected halt signal level; " +
+                "was {} should be {}").format(cpu.halt, expected_halt))
+
+        if cpu.halt:
+            self.assertLessEqual(cpu.ticks, max_clock_cycles,
+                "Action did not complete within max clock cycles ({})".format(
+                    max_clock_cycles))
+            self.assertEqual(cpu.ticks, sum(cpu.state_ticks))
+
+        if result is not None:
+            self.assertEqual(r0, result,
+                ("Received result ({}, 0x{:08x}) not equal expected " +
+                "({}, 0x{:08x})").format(
+                    r0, r0, result, result))
+
+
+    def test_cycles(self):
+        """
+        Verify ticks and cycles per state of single instructions as measured
+        with stats_op_cycles.py.
+        """
+
+        def run(asm, data=None, **kwargs):
+            code = ubpf.assembler.assemble(asm + "\nexit")
+            pgm_mem = list(struct.unpack('>{}L'.format(len(code) // 4), code))
+            cpu = CPUModel(pgm_init=pgm_mem, data_init=data,
+                call_handler=call_handler(), **kwargs)
+            cpu.reset(r1=1, r2=2)
+            cpu.run()
+            # Without the added exit.
+            return cpu.ticks - 1, cpu.state_ticks
+
+        self.assertEqual(run("add r1, 1")[0], 1)
+        self.assertEqual(run("lsh r1, 4")[0], 1)
+        self.assertEqual(run("arsh32 r1, r2", shifter_stages=2)[0], 3)
+        self.assertEqual(run("mul r1, r2")[0], 1)
+        self.assertEqual(run("mul32 r1, 3", multiplier_stages=3)[0], 4)
+        self.assertEqual(run("lddw r1, 0x1122334455667788")[0], 2)
+        self.assertEqual(run("ja +0")[0], 1)
+        self.assertEqual(run("jeq r1, 1, +0")[0], 1)
+        self.assertEqual(run("call 0")[0], 3)
+        self.assertEqual(run("call 0", call_latency={0: 3})[0], 5)
+
+        # Divisions take one cycle per significant dividend bit, 32 bit
+        # divides only use the lower half and a higher divider radix
+        # takes less cycles.
+        ticks, states = run("lddw r1, 0xffffffffffffffff\ndiv r1, 2")
+        self.assertEqual(ticks, 2 + 68)
+        self.assertEqual(states[CPUModel.STATE_DIV_PENDING], 66)
+        for asm, radix, cycles in [("div r1, 2", 2, 3),
+                ("mov r1, 0\ndiv r1, 2", 2, 2),
+                ("mov r1, 1500\ndiv r1, 8", 2, 13),
+                ("mov r1, 1500\ndiv r1, 8", 4, 8),
+                ("lddw r1, 0xffffffffffffffff\ndiv32 r1, 2", 2, 34),
+                ("lddw r1, 0xffffffffffffffff\ndiv r1, 2", 4, 34),
+                ("lddw r1, 0xffffffffffffffff\nmod32 r1, 2", 16, 10),
+                ("lddw r1, 0xffffffffffffffff\ndiv r1, 2", 16, 18)]:
+            ticks, states = run(asm, divider_radix=radix)
+            self.assertEqual(states[CPUModel.STATE_DIV_PENDING], cycles)
+
+        ticks, states = run("ldxb r2, [r1+2]", data=list(range(16)))
+        self.assertEqual(ticks, 14)
+        self.assertEqual(states[CPUModel.STATE_DATA_FETCH], 12)
+
+        for asm, cycles in [("stb [r1+2], 0x40", 16), ("sth [r1+2], 0x40", 17),
+                ("stxw [r1+2], r2", 19), ("stxdw [r1+2], r2", 23)]:
+            self.assertEqual(run(asm, data=list(range(16)))[0], cycles)
+
+        # Byte-lane data memory takes the same cycles for all sizes.
+        for asm in ["ldxb r2, [r1+2]", "ldxdw r2, [r1+3]", "stb [r1+2], 0x40",
+                "stxdw [r1+3], r2"]:
+            ticks, states = run(asm, data=list(range(16)), data_byte_lanes=True)
+            self.assertEqual(ticks, 4)
+            self.assertEqual(states[CPUModel.STATE_DATA_FETCH], 2)
+
+        # Errors detected before an instruction is processed take no cycle.
+        cpu = CPUModel(pgm_init=[0x18010000, 0x44332211, 0x95000000, 0])
+        cpu.run()
+        self.assertEqual((cpu.ticks, cpu.halt, cpu.error, cpu.r1),
+            (1, 1, 1, 0x11223344))
+
+
+    def test_run_batch(self):
+        """
+        Run packets like the net boards do, R1 holds the packet length.
+        """
+
+        code = ubpf.assembler.assemble("""
+            mov r0, 0
+            ldxb r2, [r1-1]
+            jne r2, 0xff, +1
+            mov r0, r1
+            exit
+            """)
+        pgm_mem = list(struct.unpack('>{}L'.format(len(code) // 4), code))
+        cpu = CPUModel(pgm_init=pgm_mem)
+        results = list(cpu.run_batch([b'\x01\xff', b'\x01\x02\x03']))
+        self.assertEqual(results, [(2, 0, 1 + 14 + 1 + 1 + 1),
+            (0, 0, 1 + 14 + 1 + 1)])
+
+
+# Generate a testcase for each test data file when module is loaded.
+def generate_testcase(filename):
+    def test(self):
+        gc.collect()
+        self.check_datafile(filename)
+        gc.collect()
+    return test
+
+base_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+for filename in tools.testdata.list_files(base_path):
+    filebase = filename
+    if filename.startswith(base_path):
+        filebase = filename[len(base_path):]
+    testname = 'test_' + '_'.join(os.path.splitext(filebase)[0].split(os.sep)).strip('_')
+    setattr(TestFPGA_Model, testname, generate_testcase(filename))
+
+
+if __name__ == '__main__':
+    # Use colored testrunner instead of standard testrunner.
+    #unittest.main()
+    runner = colour_runner.runner.ColourTextTestRunner(sys.stdout, verbosity=2)
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFPGA_Model)
+    runner.run(suite)
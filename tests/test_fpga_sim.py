@@ -27,6 +27,11 @@ from litedram.frontend.bist import LFSR
 from fpga.ram import *
 from fpga.ram64 import *
 from fpga.cpu import *
+from fpga.cpu_model import CPUModel
+from fpga.hash_map import HashMap
+from fpga.checksum import Checksum
+from emulator.ebpf import hash_map
+from emulator.ebpf import checksum
 
 
 class CallHandler(Module):
@@ -52,6 +57,30 @@ class CallHandler(Module):
 
         self.submodules.lfsr = lfsr = LFSR(31, n_state=31, taps=self.__class__.PRBS31)
 
+        # Hash map functions as in the net board call handlers.
+        self.submodules.hash_map = hmap = HashMap()
+        self.comb += [
+            hmap.key.eq(r1),
+            hmap.value.eq(r2),
+            Case(func, {
+                0xff000004: [hmap.op.eq(HashMap.OP_LOOKUP)],
+                0xff000005: [hmap.op.eq(HashMap.OP_UPDATE)],
+                0xff000006: [hmap.op.eq(HashMap.OP_DELETE)],
+                "default": []
+            }),
+            hmap.stb.eq(stb & (func >= 0xff000004) & (func <= 0xff000006))
+        ]
+
+        # Checksum functions as in the net board call handlers.
+        self.submodules.checksum = csum = Checksum()
+        self.comb += [
+            csum.offset.eq(r1),
+            csum.length.eq(r2),
+            csum.init.eq(r3),
+            csum.op.eq(func == 0xff000008),
+            csum.stb.eq(stb & ((func == 0xff000007) | (func == 0xff000008)))
+        ]
+
         self.sync += [
             ack.eq(0),
             err.eq(0),
@@ -73,17 +102,81 @@ class CallHandler(Module):
                     0xff000001: [
                         # set LEDs to R1 bitmask
                     ],
+                    # Hash map lookup, update and delete, acks
+                    # one cycle later.
+                    0xff000004: [],
+                    0xff000005: [],
+                    0xff000006: [],
+                    # Checksums, ack when done.
+                    0xff000007: [],
+                    0xff000008: [],
                     "default": [
                         err.eq(1)
                     ]
                 }),
-                ack.eq(1)
+                ack.eq(1),
+
+                If(hmap.stb,
+                    ret.eq(hmap.ret),
+                    ack.eq(hmap.ack)
+                ),
+                If(csum.stb,
+                    ret.eq(csum.ret),
+                    ack.eq(csum.ack)
+                )
             )
         ]
 
 
+    def connect_data(self, data):
+        self.checksum.connect_data(data)
+
+
+    # Same functions for fpga.cpu_model.CPUModel (random values differ).
+    @staticmethod
+    def model_helpers(data_mem):
+        return {
+            0: lambda r1, r2, r3, r4, r5: (((r1 & 0xff) << 32) |
+                ((r2 & 0xff) << 24) | ((r3 & 0xff) << 16) |
+                ((r4 & 0xff) << 8) | r5),
+            7: lambda r1, r2, r3, r4, r5: 0,
+            0xff000001: lambda r1, r2, r3, r4, r5: None,
+            **hash_map.HashMap().helpers(),
+            **checksum.Checksum(data_mem).helpers()
+        }
+
+
+    # Call latency of functions differing from CPUModel default.
+    # Checksums read a word of 8 bytes in 2 cycles from byte-lane and in
+    # 12 cycles from standard data memory.
+    @staticmethod
+    def model_latency(data_byte_lanes):
+        word_cycles = 2 if data_byte_lanes else 12
+        checksum_latency = lambda r1, r2, r3, r4, r5: \
+            3 + (r2 + 7) // 8 * word_cycles
+        return {
+            hash_map.HashMap.LOOKUP: 2,
+            hash_map.HashMap.UPDATE: 2,
+            hash_map.HashMap.DELETE: 2,
+            checksum.Checksum.INTERNET: checksum_latency,
+            checksum.Checksum.CRC32: checksum_latency
+        }
+
+
 class TestFPGA_Sim(unittest.TestCase):
 
+    # Data memory organisation of the CPU (see CPU data_byte_lanes).
+    data_byte_lanes = False
+
+    # Divider of the CPU (see CPU divider_radix).
+    divider_radix = 2
+
+    # Shifter pipeline stages of the CPU (see CPU shifter_stages).
+    shifter_stages = 0
+
+    # Multiplier pipeline stages of the CPU (see CPU multiplier_stages).
+    multiplier_stages = 0
+
     def check_datafile(self, filename):
         """
         Given assembly source code and an expected result, run the eBPF program and
@@ -110,6 +203,34 @@ class TestFPGA_Sim(unittest.TestCase):
         half_words = len(code) // 4
         pgm_mem = list(struct.unpack('>{}L'.format(half_words), code))
 
+        # Only programs accessing data memory (LDX, ST, STX or checksum
+        # calls) depend on it.
+        checksum_calls = [struct.unpack('>L', struct.pack('<L', x))[0]
+            for x in (checksum.Checksum.INTERNET, checksum.Checksum.CRC32)]
+        if self.data_byte_lanes and not any((pgm_mem[i] >> 24) & 0x07 in
+                (OPC_LDX, OPC_ST, OPC_STX) or
+                ((pgm_mem[i] >> 24) == 0x85 and pgm_mem[i + 1] in
+                checksum_calls) for i in range(0, half_words, 2)):
+            self.skipTest("Testcase does not access data memory")
+
+        # Only programs dividing depend on the divider.
+        if self.divider_radix != 2 and not any((pgm_mem[i] >> 24) & 0x07 in
+                (OPC_ALU, OPC_ALU64) and (pgm_mem[i] >> 28) in (0x3, 0x9)
+                for i in range(0, half_words, 2)):
+            self.skipTest("Testcase does not divide")
+
+        # Only programs shifting depend on the shifter.
+        if self.shifter_stages != 0 and not any((pgm_mem[i] >> 24) & 0x07 in
+                (OPC_ALU, OPC_ALU64) and (pgm_mem[i] >> 28) in (0x6, 0x7, 0xc)
+                for i in range(0, half_words, 2)):
+            self.skipTest("Testcase does not shift")
+
+        # Only programs multiplying depend on the multiplier.
+        if self.multiplier_stages != 0 and not any((pgm_mem[i] >> 24) & 0x07
+                in (OPC_ALU, OPC_ALU64) and (pgm_mem[i] >> 28) == 0x2
+                for i in range(0, half_words, 2)):
+            self.skipTest("Testcase does not multiply")
+
         # Dump program memory for debug.
         #print("----- Program memory -----")
         #words = len(code) // 8
@@ -126,9 +247,34 @@ class TestFPGA_Sim(unittest.TestCase):
         #vcd_file = os.path.abspath(os.path.dirname(__file__))
         #vcd_file = os.path.join(vcd_file, __name__ + ".vcd")
         vcd_file = os.path.abspath(os.path.dirname(filename))
-        vcd_file = os.path.join(vcd_file, td['name'] + ".vcd")
-
-        cpu = CPU(pgm_init=pgm_mem, data_init=data_mem, call_handler=CallHandler())
+        vcd_file = os.path.join(vcd_file, td['name'] +
+            ("-lanes" if self.data_byte_lanes else "") +
+            ("-radix{}".format(self.divider_radix)
+                if self.divider_radix != 2 else "") +
+            ("-shift{}".format(self.shifter_stages)
+                if self.shifter_stages != 0 else "") +
+            ("-mul{}".format(self.multiplier_stages)
+                if self.multiplier_stages != 0 else "") + ".vcd")
+
+        # Run CPU model for comparison.
+        model = CPUModel(pgm_init=pgm_mem, data_init=data_mem,
+            call_handler=CallHandler.model_helpers(lambda: model.data),
+            call_latency=CallHandler.model_latency(self.data_byte_lanes),
+            data_byte_lanes=self.data_byte_lanes,
+            divider_radix=self.divider_radix,
+            shifter_stages=self.shifter_stages,
+            multiplier_stages=self.multiplier_stages)
+        args = td.get('args', {})
+        model.reset(*[int(str(args.get('r{}'.format(i), 0)), 0)
+            for i in range(1, 6)])
+        model.run(max_ticks=10000)
+        td['model'] = model
+
+        cpu = CPU(pgm_init=pgm_mem, data_init=data_mem, call_handler=CallHandler(),
+            data_byte_lanes=self.data_byte_lanes,
+            divider_radix=self.divider_radix,
+            shifter_stages=self.shifter_stages,
+            multiplier_stages=self.multiplier_stages)
         run_simulation(cpu, self.cpu_test(cpu, td, default_max_clock_cycles=1000),
                        vcd_name=vcd_file)
 
@@ -215,6 +361,8 @@ class TestFPGA_Sim(unittest.TestCase):
             if not halt:
                 clk_cnt += 1
 
+        ticks = (yield cpu.ticks)
+
         print("Output:")
         print("Clock cycles: ({}), halt: ({}), error: ({}), R0: ({:20}, 0x{:016x})".format(
             clk_cnt,
@@ -256,6 +404,11 @@ class TestFPGA_Sim(unittest.TestCase):
             ("Action does not complete with expected halt signal level; " +
                 "was {} should be {}").format(halt, expected_halt))
 
+        model = test_data.get('model', None)
+        if model is not None and halt:
+            self.assertEqual((ticks, error), (model.ticks, model.error),
+                "CPU model does not match (ticks, error)")
+
         if result is not None:
             self.assertEqual(r0, result,
                 ("Received result ({}, 0x{:08x}) not equal expected " +
@@ -280,9 +433,39 @@ for filename in tools.testdata.list_files(base_path):
     setattr(TestFPGA_Sim, testname, generate_testcase(filename))
 
 
+# Run all testcases accessing data memory with byte-lane data memory.
+class TestFPGA_SimByteLanes(TestFPGA_Sim):
+
+    data_byte_lanes = True
+
+
+# Run all testcases dividing with a radix 16 divider.
+class TestFPGA_SimDivider16(TestFPGA_Sim):
+
+    divider_radix = 16
+
+
+# Run all testcases shifting with a pipelined shifter.
+class TestFPGA_SimShifter2(TestFPGA_Sim):
+
+    shifter_stages = 2
+
+
+# Run all testcases multiplying with a pipelined multiplier.
+class TestFPGA_SimMultiplier3(TestFPGA_Sim):
+
+    multiplier_stages = 3
+
+
 if __name__ == '__main__':
     # Use colored testrunner instead of standard testrunner.
     #unittest.main()
     runner = colour_runner.runner.ColourTextTestRunner(sys.stdout, verbosity=2)
-    suite = unittest.TestLoader().loadTestsFromTestCase(TestFPGA_Sim)
+    suite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(TestFPGA_Sim),
+        unittest.TestLoader().loadTestsFromTestCase(TestFPGA_SimByteLanes),
+        unittest.TestLoader().loadTestsFromTestCase(TestFPGA_SimDivider16),
+        unittest.TestLoader().loadTestsFromTestCase(TestFPGA_SimShifter2),
+        unittest.TestLoader().loadTestsFromTestCase(TestFPGA_SimMultiplier3)
+    ])
     runner.run(suite)
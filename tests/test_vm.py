@@ -15,18 +15,26 @@ import colour_runner.runner
 import os
 import gc
 import tempfile
+import glob
 import struct
 import random
+import collections
 import re
 import ntpath
 import ubpf.assembler
 import tools.testdata
 from emulator.ebpf.vm import *
+from emulator.ebpf.runner import Runner
+from emulator.ebpf.pcap import read_frames
+from emulator.ebpf.vm_cycles import (CycleEstimator, packets_per_second,
+    read_cycle_table)
+from emulator.ebpf.hash_map import HashMap
+from emulator.ebpf.checksum import Checksum
 
 
 class TestVM(unittest.TestCase):
 
-    def check_datafile(self, filename):
+    def check_datafile(self, filename, engine="interpreter"):
         """
         Given assembly source code and an expected result, run the eBPF program and
         verify that the result matches.
@@ -102,13 +110,15 @@ class TestVM(unittest.TestCase):
         helpers = {
             0: gather_bytes,
             6: helper_print,
-            7: helper_random
+            7: helper_random,
+            **HashMap().helpers(),
+            **Checksum(lambda: vm.data_mem).helpers()
         }
 
         # instantiate VM
         print()
         vm = VM(mem=pgm_mem, color=False, debug=False, swap_endian=False,
-                call_handler=helpers)
+                call_handler=helpers, engine=engine)
         vm.data_mem = data_mem
 
         # set r1 - r5 input arguments
@@ -149,11 +159,354 @@ class TestVM(unittest.TestCase):
                     r0, r0, result, result))
 
 
-# Generate a testcase for each test data file when module is loaded.
-def generate_testcase(filename):
+    def test_run_batch(self):
+        """
+        Run all tcp-port-80 packets through one VM and verify that each
+        result matches the result of its test data file.
+        """
+
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                    "data", "net", "tcp-port-80")
+        tds = [tools.testdata.read(f) for f in tools.testdata.list_files(path)]
+        self.assertTrue(len(tds) > 1, 'no test data files found')
+
+        code = ubpf.assembler.assemble(tds[0]['asm'])
+        words = len(code) // 8
+        pgm_mem = list(struct.unpack('={}Q'.format(words), code))
+
+        for engine in ["interpreter", "threaded", "compiled"]:
+            vm = VM(mem=list(pgm_mem), color=False, engine=engine)
+            data_mem = vm.data_mem
+
+            # Run twice to ensure VM state is reset between contexts.
+            packets = [td['mem'] for td in tds] * 2
+            results = list(vm.run_batch(packets, args=[0]))
+
+            self.assertIs(vm.data_mem, data_mem)
+            for td, (r0, error) in zip(tds * 2, results):
+                self.assertIsNone(error)
+                self.assertEqual(r0, int(td['result'], 0))
+
+
+    def test_compiled_cache(self):
+        """
+        Verify that the compiled engine only keeps the most recently used
+        programs.
+        """
+
+        import emulator.ebpf.vm_compiled as vm_compiled
+
+        for i in range(vm_compiled.CACHE_SIZE + 10):
+            code = ubpf.assembler.assemble("mov r0, {}\nexit".format(i))
+            pgm_mem = list(struct.unpack('={}Q'.format(len(code) // 8), code))
+            vm = VM(mem=pgm_mem, color=False, engine="compiled")
+            self.assertEqual(vm.start(), i)
+        self.assertEqual(len(vm_compiled._cache), vm_compiled.CACHE_SIZE)
+
+
+    def test_data_mem_readonly(self):
+        """
+        Verify that stores work when data memory is set from bytes (e.g. a
+        file read by the emulator CLI).
+        """
+
+        code = ubpf.assembler.assemble("""
+            stb [r1+1], 0x40
+            ldxb r0, [r1+1]
+            exit
+            """)
+        pgm_mem = list(struct.unpack('={}Q'.format(len(code) // 8), code))
+
+        data = bytes([1, 2, 3])
+        vm = VM(mem=pgm_mem, color=False)
+        vm.data_mem = data
+        vm.start()
+        self.assertEqual(vm.r0, 0x40)
+        self.assertEqual(bytes(vm.data_mem), bytes([1, 0x40, 3]))
+        self.assertEqual(data, bytes([1, 2, 3]))
+
+
+    def test_runner(self):
+        """
+        Shard tcp-port-80 packets across worker processes and verify
+        ordered results and the per verdict counts.
+        """
+
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                    "data", "net", "tcp-port-80")
+        tds = [tools.testdata.read(f) for f in tools.testdata.list_files(path)]
+        self.assertTrue(len(tds) > 1, 'no test data files found')
+
+        code = ubpf.assembler.assemble(tds[0]['asm'])
+        words = len(code) // 8
+        pgm_mem = list(struct.unpack('={}Q'.format(words), code))
+
+        packets = [td['mem'] for td in tds] * 5
+        expected = [int(td['result'], 0) for td in tds] * 5
+
+        with Runner(pgm_mem, workers=2, chunk_size=3, args=[0]) as runner:
+            results = list(runner.run(packets))
+            self.assertEqual([r0 for r0, _ in results], expected)
+            self.assertEqual([e for _, e in results], [None] * len(expected))
+
+            counts = runner.reduce(packets)
+            self.assertEqual(counts, collections.Counter(expected))
+
+
+    def test_profiler(self):
+        """
+        Profile a loop calling a helper function and verify counts per IP
+        and opcode, branch outcomes, helper calls and the exported files.
+        """
+
+        code = ubpf.assembler.assemble("""
+            mov r6, 0
+            mov r7, 0
+            add r6, 1
+            call 0
+            add r7, r0
+            jlt r6, 5, -4
+            mov r0, r7
+            exit
+            """)
+        words = len(code) // 8
+        pgm_mem = list(struct.unpack('={}Q'.format(words), code))
+
+        vm = VM(mem=pgm_mem, color=False, profile=True,
+                call_handler={0: lambda r1, r2, r3, r4, r5: 2})
+        self.assertEqual(vm.start(), 10)
+
+        self.assertEqual(vm.profiler.ip_counts(),
+            {0: 1, 1: 1, 2: 5, 3: 5, 4: 5, 5: 5, 6: 1, 7: 1})
+        self.assertEqual(vm.profiler.opcode_counts(),
+            {0xb7: 2, 0x07: 5, 0x85: 5, 0x0f: 5, 0xa5: 5, 0xbf: 1, 0x95: 1})
+        self.assertEqual(vm.profiler.branch_counts(), {5: (4, 1)})
+        calls, t = vm.profiler.helper_times()[0]
+        self.assertEqual(calls, 5)
+        self.assertTrue(t >= 0)
+
+        with tempfile.TemporaryDirectory() as path:
+            csv_file = os.path.join(path, "profile.csv")
+            vm.profiler.write_csv(csv_file)
+            with open(csv_file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 9)
+            self.assertTrue(lines[6].startswith("0x0005,0xa5,5,4,1,,"))
+
+            collapsed_file = os.path.join(path, "profile.folded")
+            vm.profiler.write_collapsed(collapsed_file)
+            with open(collapsed_file) as f:
+                lines = f.read().splitlines()
+            self.assertIn("program;block_0x0002;0x0003_op_0x85;helper_0 5",
+                lines)
+            self.assertIn("program;block_0x0006;0x0007_op_0x95 1", lines)
+
+
+    def test_handlers_tagged_for_disassembly(self):
+        """
+        Verify that non debug VMs call raw handlers and debug VMs traced
+        ones (see stats_vm_debug.py for the time per instruction).
+        """
+
+        code = ubpf.assembler.assemble("add r1, 1\nexit")
+        words = len(code) // 8
+        pgm_mem = list(struct.unpack('={}Q'.format(words), code))
+
+        vm = VM(mem=list(pgm_mem), color=False)
+        self.assertTrue(hasattr(vm.code[0][1], 'disassemble'))
+
+        # Debug VMs still trace.
+        vm = VM(mem=list(pgm_mem), color=False, debug=True)
+        self.assertFalse(hasattr(vm.code[0][1], 'disassemble'))
+
+
+    def test_program_load(self):
+        """
+        Verify that program words are checked when the program is loaded
+        and that decoded instructions and registers use slots.
+        """
+
+        with self.assertRaisesRegex(Exception, "Invalid opcode"):
+            VM(mem=[0x95, "exit"], color=False)
+        with self.assertRaisesRegex(Exception, "Invalid opcode"):
+            VM(mem=[1 << 64], color=False)
+
+        vm = VM(mem=[0x95], color=False)
+        insn = vm.code[0][-1]
+        self.assertFalse(hasattr(insn, '__dict__'))
+        self.assertEqual((insn.op_code, insn.op_class), (0x95, OPC_JMP))
+
+        vm.r10 = 7
+        self.assertEqual(vm.regs[10], 7)
+        self.assertIn('r10', VM.__dict__)
+        self.assertNotIn('r10', vars(vm))
+
+
+    def test_verifier(self):
+        """
+        Verify all test data programs. Programs with errors which can be
+        found before running must be rejected, all others accepted.
+        """
+
+        static_errors = {
+            'err-div-by-zero-imm': 'division by zero',
+            'err-endian-size': 'invalid endian immediate',
+            'err-incomplete-lddw': 'incomplete lddw',
+            'err-invalid-reg-dst': 'invalid destination register',
+            'err-invalid-reg-src': 'invalid source register',
+            'err-jmp-lddw': 'jump to middle of lddw',
+            'err-unknown-opcode': 'unknown opcode 0x06'
+        }
+
+        base_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                    "data")
+        for filename in tools.testdata.list_files(base_path):
+            td = tools.testdata.read(filename)
+            if 'raw' in td:
+                code = b''.join(struct.pack('>Q', x) for x in td['raw'])
+            else:
+                code = ubpf.assembler.assemble(td['asm'])
+            words = len(code) // 8
+            pgm_mem = list(struct.unpack('={}Q'.format(words), code))
+
+            name = os.path.splitext(ntpath.basename(filename))[0]
+            error = static_errors.get(name, None)
+            with self.subTest(name=name):
+                if error is None:
+                    VM(mem=pgm_mem, color=False, verify=True)
+                else:
+                    with self.assertRaisesRegex(Exception, error):
+                        VM(mem=pgm_mem, color=False, verify=True)
+
+        for asm, error in [
+                ("ja +5\nexit", "jump out of bounds"),
+                ("mov r0, 1", "falls off end of program"),
+                ("ja -1\nexit", "no reachable exit"),
+                ("call 1\nexit", "call to unknown helper function 1")]:
+            words = ubpf.assembler.assemble(asm)
+            pgm_mem = list(struct.unpack('={}Q'.format(len(words) // 8), words))
+            with self.assertRaisesRegex(Exception, error):
+                VM(mem=pgm_mem, color=False, verify=True, call_handler={})
+
+
+    def test_cycle_estimator(self):
+        """
+        Estimate cycles of programs from the opcode cycle table. Straight
+        code must match the ticks the CPU needs for the test cases.
+        """
+
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                    "statistics")
+        table = read_cycle_table(sorted(glob.glob(
+            os.path.join(path, "opcode_cycles_*.csv")))[-1])
+
+        def estimator(asm, **kwargs):
+            code = ubpf.assembler.assemble(asm)
+            words = struct.unpack('<{}Q'.format(len(code) // 8), code)
+            return CycleEstimator(words, table, **kwargs)
+
+        # mov, mov, add, exit
+        est = estimator("mov r0, 1\nmov r1, 2\nadd r0, r1\nexit")
+        self.assertEqual(est.worst_case(), 4)
+        self.assertEqual(est.typical(), 4)
+        self.assertEqual(packets_per_second(4, 100e6), 25e6)
+
+        # One path has a 68 cycle division.
+        asm = "jeq r1, 0, +1\ndiv r0, 3\nexit"
+        est = estimator(asm)
+        self.assertEqual(est.worst_case(), 1 + 68 + 1)
+        self.assertEqual(est.typical(), 1 + 68 / 2 + 1)
+        self.assertEqual(est.typical({0: (1, 0)}), 1 + 1)
+
+        # Loops are unbounded unless a bound is given.
+        asm = "mov r1, 4\nsub r1, 1\njne r1, 0, -2\nexit"
+        self.assertIsNone(estimator(asm).worst_case())
+        self.assertEqual(estimator(asm).loops(), [[1]])
+        self.assertEqual(estimator(asm, loop_bound=4).worst_case(),
+            1 + 4 * (1 + 1) + 1)
+
+        with self.assertRaisesRegex(Exception, "verification failed"):
+            estimator("mov r0, 1")
+
+
+    def test_read_frames(self):
+        """
+        Write frames into classic pcap and pcapng files (both byte orders)
+        and verify that all frames are read back.
+        """
+
+        frames = [bytes(range(60)), bytes(101), b'\xff' * 1514]
+
+        def block(bo, block_type, body):
+            body += bytes(-len(body) % 4)
+            length = 12 + len(body)
+            return (struct.pack(bo + 'II', block_type, length) + body +
+                struct.pack(bo + 'I', length))
+
+        for bo in ['<', '>']:
+            pcap = struct.pack(bo + 'IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+            for frame in frames:
+                pcap += struct.pack(bo + 'IIII', 0, 0, len(frame), len(frame))
+                pcap += frame
+
+            # Section header, interface description, enhanced and simple
+            # packet blocks with an unknown block in between.
+            pcapng = block(bo, 0x0a0d0d0a,
+                struct.pack(bo + 'IHHq', 0x1a2b3c4d, 1, 0, -1))
+            pcapng += block(bo, 1, struct.pack(bo + 'HHI', 1, 0, 65535))
+            pcapng += block(bo, 6, struct.pack(bo + 'IIIII', 0, 0, 0,
+                len(frames[0]), len(frames[0])) + frames[0])
+            pcapng += block(bo, 5, bytes(8))
+            pcapng += block(bo, 3, struct.pack(bo + 'I', len(frames[1])) +
+                frames[1])
+            pcapng += block(bo, 6, struct.pack(bo + 'IIIII', 0, 0, 0,
+                len(frames[2]), len(frames[2])) + frames[2])
+
+            for content in [pcap, pcapng]:
+                with tempfile.NamedTemporaryFile() as f:
+                    f.write(content)
+                    f.flush()
+                    self.assertEqual(list(read_frames(f.name, read_ahead=64)),
+                        frames)
+
+            # Captured lengths exceeding their block and blocks too short
+            # for their fixed fields are rejected.
+            shb = block(bo, 0x0a0d0d0a,
+                struct.pack(bo + 'IHHq', 0x1a2b3c4d, 1, 0, -1))
+            for bad in [block(bo, 6, struct.pack(bo + 'IIIII', 0, 0, 0,
+                        1000, 1000) + frames[0]),
+                    block(bo, 2, struct.pack(bo + 'HHIIII', 0, 0, 0, 0,
+                        1000, 1000) + frames[0]),
+                    block(bo, 3, b''),
+                    block(bo, 6, bytes(8))]:
+                with tempfile.NamedTemporaryFile() as f:
+                    f.write(shb + bad)
+                    f.flush()
+                    with self.assertRaisesRegex(Exception,
+                            "Invalid pcapng block"):
+                        list(read_frames(f.name))
+
+            # Captured lengths exceeding the snapshot length of a classic
+            # pcap file (or the maximum if it has none) are rejected.
+            for snaplen, incl_len in [(1000, 1001), (0, 0xffffffff)]:
+                pcap = struct.pack(bo + 'IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0,
+                    snaplen, 1)
+                pcap += struct.pack(bo + 'IIII', 0, 0, incl_len, incl_len)
+                pcap += frames[0]
+                with tempfile.NamedTemporaryFile() as f:
+                    f.write(pcap)
+                    f.flush()
+                    with self.assertRaisesRegex(Exception,
+                            "Invalid pcap record"):
+                        list(read_frames(f.name))
+
+
+# Generate a testcase for each test data file and execution engine when
+# module is loaded.
+def generate_testcase(filename, engine):
     def test(self):
         gc.collect()
-        self.check_datafile(filename)
+        self.check_datafile(filename, engine=engine)
         gc.collect()
     return test
 
@@ -163,7 +516,9 @@ for filename in tools.testdata.list_files(base_path):
     if filename.startswith(base_path):
         filebase = filename[len(base_path):]
     testname = 'test_' + '_'.join(os.path.splitext(filebase)[0].split(os.sep)).strip('_')
-    setattr(TestVM, testname, generate_testcase(filename))
+    setattr(TestVM, testname, generate_testcase(filename, "interpreter"))
+    setattr(TestVM, testname + '_threaded', generate_testcase(filename, "threaded"))
+    setattr(TestVM, testname + '_compiled', generate_testcase(filename, "compiled"))
 
 
 if __name__ == '__main__':